@@ -1,6 +1,8 @@
 using Statistics
 
-mutable struct AnalysisWindow
+abstract type AbstractAnalysisWindow end
+
+mutable struct AnalysisWindow <: AbstractAnalysisWindow
     count::Int64
     sum::Float64
     sumsquares::Float64
@@ -17,7 +19,8 @@ mutable struct AnalysisWindow
     end
 end
 
-function Base.push!(window::AnalysisWindow, time::DateTime, datum::Float64)
+# the statistics that don't depend on which data are still in the window
+function pushstats!(window::AbstractAnalysisWindow, datum::Float64)
     # starting from no data requires some extra work, since values start as NaN
     if window.count == 0
         window.count = 1
@@ -38,12 +41,16 @@ function Base.push!(window::AnalysisWindow, time::DateTime, datum::Float64)
     end
 
     window.alltimelatest = datum
+end
+
+function Base.push!(window::AnalysisWindow, time::DateTime, datum::Float64)
+    pushstats!(window, datum)
 
     DataStructures.push!(window.maxheap, (datum, time))
     DataStructures.push!(window.minheap, (datum, time))
 end
 
-function Base.pop!(window::AnalysisWindow, time::DateTime, datum::Float64)
+function Base.pop!(window::AbstractAnalysisWindow, time::DateTime, datum::Float64)
     # if this is the last datapoint reset the sums to NaNs
     @boundscheck(
         if window.count ≤ 0
@@ -62,13 +69,18 @@ function Base.pop!(window::AnalysisWindow, time::DateTime, datum::Float64)
     window.lastpoptime = time
 end
 
-function Base.empty!(window::AnalysisWindow)
+function emptystats!(window::AbstractAnalysisWindow)
     window.count = 0
     window.sum = NaN
     window.sumsquares = NaN
     window.alltimemin = NaN
     window.alltimemax = NaN
     window.alltimelatest = NaN
+    window.lastpoptime = DateTime(Year(0))
+end
+
+function Base.empty!(window::AnalysisWindow)
+    emptystats!(window)
 
     # note: could call empty!(window.maxheap.valtree), but that would bypass the official interface
     while !isempty(window.maxheap)
@@ -77,15 +89,13 @@ function Base.empty!(window::AnalysisWindow)
     while !isempty(window.minheap)
         DataStructures.pop!(window.minheap)
     end
-
-    window.lastpoptime = DateTime(Year(0))
 end
 
-function Statistics.mean(window::AnalysisWindow)
+function Statistics.mean(window::AbstractAnalysisWindow)
     return window.sum / window.count
 end
 
-function Statistics.std(window::AnalysisWindow)
+function Statistics.std(window::AbstractAnalysisWindow)
     return window.count < 2 ? NaN : √(
         max(0., window.sumsquares - window.sum*window.sum/window.count) /
             (window.count - 1))
@@ -117,38 +127,124 @@ function Base.min(window::AnalysisWindow)
     end
 end
 
-function maxmindiff(window::AnalysisWindow)
+# A variant of AnalysisWindow that tracks the maximum and minimum with
+# monotonic deques rather than heaps.  This relies on the data being pushed
+# and popped in time order (as the events are), but then each datum takes
+# amortized O(1) time, and only the data that could still become the maximum
+# or minimum are kept.
+mutable struct MonotonicDeque
+    items::Vector{Tuple{Float64,DateTime}}
+    head::Int # index of the first item still in the deque
+
+    MonotonicDeque() = new(Tuple{Float64,DateTime}[], 1)
+end
+
+# add an item to the back, first dropping the items it supersedes (i.e. those
+# that can no longer be the extreme value, since it will outlast them)
+function pushmonotonic!(deque::MonotonicDeque, item, supersedes)
+    while (length(deque.items) ≥ deque.head &&
+           supersedes(item[1], deque.items[end][1]))
+        pop!(deque.items)
+    end
+    push!(deque.items, item)
+end
+
+# drop any stale items from the front, and return the front value (the
+# extreme value of those remaining)
+function frontvalue!(deque::MonotonicDeque, lastpoptime::DateTime)
+    while (deque.head ≤ length(deque.items) &&
+           lastpoptime ≥ deque.items[deque.head][2])
+        deque.head += 1
+    end
+
+    # reclaim the space of the dropped items once they're the majority
+    if deque.head > 32 && 2 * deque.head > length(deque.items)
+        deleteat!(deque.items, 1:(deque.head - 1))
+        deque.head = 1
+    end
+
+    if deque.head > length(deque.items)
+        return NaN
+    else
+        return deque.items[deque.head][1]
+    end
+end
+
+function Base.empty!(deque::MonotonicDeque)
+    empty!(deque.items)
+    deque.head = 1
+end
+
+mutable struct MonotonicAnalysisWindow <: AbstractAnalysisWindow
+    count::Int64
+    sum::Float64
+    sumsquares::Float64
+    alltimemax::Float64
+    alltimemin::Float64
+    alltimelatest::Float64
+    lastpoptime::DateTime
+    maxdeque::MonotonicDeque # values are decreasing from the front
+    mindeque::MonotonicDeque # values are increasing from the front
+
+    function MonotonicAnalysisWindow()
+        new(0, NaN, NaN, NaN, NaN, NaN, DateTime(Year(0)),
+            MonotonicDeque(), MonotonicDeque())
+    end
+end
+
+function Base.push!(window::MonotonicAnalysisWindow, time::DateTime, datum::Float64)
+    pushstats!(window, datum)
+
+    pushmonotonic!(window.maxdeque, (datum, time), ≥)
+    pushmonotonic!(window.mindeque, (datum, time), ≤)
+end
+
+function Base.empty!(window::MonotonicAnalysisWindow)
+    emptystats!(window)
+    empty!(window.maxdeque)
+    empty!(window.mindeque)
+end
+
+function Base.max(window::MonotonicAnalysisWindow)
+    return frontvalue!(window.maxdeque, window.lastpoptime)
+end
+
+function Base.min(window::MonotonicAnalysisWindow)
+    return frontvalue!(window.mindeque, window.lastpoptime)
+end
+
+function maxmindiff(window::AbstractAnalysisWindow)
     return max(window) - min(window)
 end
 
-function alltimemin(window::AnalysisWindow)
+function alltimemin(window::AbstractAnalysisWindow)
     return window.alltimemin
 end
 
-function alltimemax(window::AnalysisWindow)
+function alltimemax(window::AbstractAnalysisWindow)
     return window.alltimemax
 end
 
-function alltimelatest(window::AnalysisWindow)
+function alltimelatest(window::AbstractAnalysisWindow)
     return window.alltimelatest
 end
 
-function allstatnames(window::AnalysisWindow)
+function allstatnames(window::AbstractAnalysisWindow)
     return ["mean", "std", "max", "min", "maxmindiff", "alltimemax", "alltimemin", "alltimelatest"]
 end
 
-function allstats(window::AnalysisWindow)
+function allstats(window::AbstractAnalysisWindow)
     return mean(window), std(window), max(window), min(window), maxmindiff(window),
         alltimemax(window), alltimemin(window), alltimelatest(window)
 end
 
 const numanalysiswindowstats = length(allstatnames(AnalysisWindow()))
 
-function allmedstatnames(window::AnalysisWindow)
+function allmedstatnames(window::AbstractAnalysisWindow)
     return ["totaldose", "maxdose", "alltimemax", "alltimelatest"]
 end
 
-function allmedstats(window::AnalysisWindow)
+function allmedstats(window::AbstractAnalysisWindow)
     return [
         window.count == 0 ? 0 : window.sum,
         (x -> x > 0 ? x : 0)(max(window)),
@@ -0,0 +1,120 @@
+#!/usr/bin/julia
+using ArgParse
+using Dates
+using DataStructures
+using Random
+include("AnalysisWindow.jl")
+
+# Compares the heap-based AnalysisWindow with MonotonicAnalysisWindow on
+# synthetic high-frequency vitals (the inner loop of GenerateWindowedStatistics)
+# and checks that they calculate the same statistics.
+
+function parse_commandline()
+    s = ArgParseSettings()
+
+    @add_arg_table! s begin
+        "--days"
+            help = "length of each patient's stay"
+            arg_type = Int
+            default = 30
+
+        "--minutesbetween"
+            help = "minutes between the measurements of each vital"
+            arg_type = Int
+            default = 1
+
+        "--measures"
+            help = "number of vitals measured"
+            arg_type = Int
+            default = 8
+
+        "--windowhours"
+            help = "length of the analysis window (hours)"
+            arg_type = Int
+            default = 24
+
+        "--snapshothours"
+            help = "hours between snapshots"
+            arg_type = Int
+            default = 1
+
+        "--seed"
+            help = "random seed for the synthetic vitals"
+            arg_type = Int
+            default = 0
+    end
+
+    return parse_args(s)
+end
+
+# a random walk for each measure, in time order
+function syntheticevents(days, minutesbetween, nummeasures, seed)
+    rng = MersenneTwister(seed)
+    start = DateTime(2018, 1, 1)
+    times = start:Minute(minutesbetween):(start + Day(days))
+    values = 100 .+ cumsum(randn(rng, length(times), nummeasures), dims=1)
+    return [(time, id, values[i, id])
+            for (i, time) in enumerate(times) for id in 1:nummeasures]
+end
+
+# slide the windows over the events, taking a snapshot of the statistics
+# every snapshot period, in the same way as GenerateWindowedStatistics.jl
+function slide(windows, events, windowlength, snapshotperiod)
+    snapshots = Vector{Vector{Float64}}()
+    inwindow = Deque{Tuple{DateTime,Int,Float64}}()
+    next = 1
+    snapshottime = first(events)[1] + snapshotperiod
+    while snapshottime ≤ last(events)[1]
+        while next ≤ length(events) && events[next][1] < snapshottime
+            time, id, value = events[next]
+            push!(windows[id], time, value)
+            push!(inwindow, events[next])
+            next += 1
+        end
+        while !isempty(inwindow) && first(inwindow)[1] < snapshottime - windowlength
+            time, id, value = popfirst!(inwindow)
+            pop!(windows[id], time, value)
+        end
+        push!(snapshots, [stat for window in windows for stat in allstats(window)])
+        snapshottime += snapshotperiod
+    end
+    return snapshots
+end
+
+function benchmark(name, newwindow, events, nummeasures, windowlength,
+                   snapshotperiod)
+    # run once first so that compilation isn't included in the timing
+    slide([newwindow() for i in 1:nummeasures], events[1:min(end, 1000)],
+          windowlength, snapshotperiod)
+
+    windows = [newwindow() for i in 1:nummeasures]
+    GC.gc()
+    elapsed = @elapsed snapshots = slide(windows, events, windowlength,
+                                         snapshotperiod)
+    memory = sum(Base.summarysize, windows)
+    print("$name: $(round(elapsed, digits=3)) s, " *
+          "$(round(1e9 * elapsed / length(events), digits=1)) ns/event, " *
+          "$memory bytes in the windows at the end\n")
+    return snapshots
+end
+
+function main()
+    args = parse_commandline()
+
+    events = syntheticevents(args["days"], args["minutesbetween"],
+                             args["measures"], args["seed"])
+    print("$(length(events)) events, $(args["windowhours"]) hour window\n")
+
+    windowlength = Hour(args["windowhours"])
+    snapshotperiod = Hour(args["snapshothours"])
+    heapsnapshots = benchmark("heaps", AnalysisWindow, events,
+                              args["measures"], windowlength, snapshotperiod)
+    dequesnapshots = benchmark("monotonic deques", MonotonicAnalysisWindow,
+                               events, args["measures"], windowlength,
+                               snapshotperiod)
+
+    @assert isequal(heapsnapshots, dequesnapshots) "the statistics differ"
+    print("the statistics are identical\n")
+end
+
+main()
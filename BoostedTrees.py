@@ -11,6 +11,8 @@ import warnings
 import pickle
 import argparse
 import json
+from RowMasks import apply_rowmasks
+from CleaningTransformer import CleaningTransformer, stack_features
 import pandas as pd
 
 startup_time = time.time()
@@ -28,6 +30,14 @@ def parse_arguments():
             help='pairs of X and y datafiles used to train the model')
     subparser_train.add_argument('MODELFILE',
             help='filename to use to save the trained model\'s parameters')
+    subparser_train.add_argument('--cleaningmodel',
+            help='cleaning model (from CleanInputs.jl) to apply to the ' +
+                'X datafiles as they are loaded, rather than loading ' +
+                'cleaned datafiles')
+    subparser_train.add_argument('--rowmask', nargs='+',
+            help='row mask files (from GenerateRowMasks.py), one for each ' +
+                'X datafile, selecting the rows to use as they are loaded, ' +
+                'rather than loading subsets of the datafiles')
 
     subparser_apply = subparsers.add_parser('apply',
             help='apply the model to a given dataset')
@@ -39,6 +49,14 @@ def parse_arguments():
             help='file with inputs to use for the model')
     subparser_apply.add_argument('OUTFILE',
             help='file to save the predicted outputs')
+    subparser_apply.add_argument('--cleaningmodel',
+            help='cleaning model (from CleanInputs.jl) to apply to the ' +
+                'X datafiles as they are loaded, rather than loading ' +
+                'cleaned datafiles')
+    subparser_apply.add_argument('--rowmask', nargs='+',
+            help='row mask files (from GenerateRowMasks.py), one for each ' +
+                'X datafile, selecting the rows to use as they are loaded, ' +
+                'rather than loading subsets of the datafiles')
 
     subparser_apply = subparsers.add_parser('applynames',
             help='apply the model to a given dataset')
@@ -51,6 +69,30 @@ def parse_arguments():
     subparser_apply.add_argument('OUTFILE',
             help='file to save the feature importances')
 
+    subparser_explain = subparsers.add_parser('explain',
+            help='calculate the contribution of each feature to the ' +
+                'predictions for a given dataset')
+    subparser_explain.add_argument('MODELFILE',
+            type=argparse.FileType('rb'),
+            help='file from which to load the model parameters')
+    subparser_explain.add_argument('DATAFILE', nargs='+',
+            type=argparse.FileType('rb'),
+            help='file with inputs to use for the model')
+    subparser_explain.add_argument('OUTFILE',
+            help='file to save the predicted outputs and the contribution ' +
+                'of each feature (in log odds)')
+    subparser_explain.add_argument('--top', type=int,
+            help='only explain this many of the highest risk rows ' +
+                '(in order of decreasing risk)')
+    subparser_explain.add_argument('--cleaningmodel',
+            help='cleaning model (from CleanInputs.jl) to apply to the ' +
+                'X datafiles as they are loaded, rather than loading ' +
+                'cleaned datafiles')
+    subparser_explain.add_argument('--rowmask', nargs='+',
+            help='row mask files (from GenerateRowMasks.py), one for each ' +
+                'X datafile, selecting the rows to use as they are loaded, ' +
+                'rather than loading subsets of the datafiles')
+
     return argument_parser.parse_args()
 
 
@@ -62,7 +104,8 @@ if __name__ == "__main__":
         print(f"{time.time() - startup_time}: loading X")
         X_dataframes = [pd.read_csv(f, parse_dates=["DTS"])
                 for f in args.DATAFILE[0::2]]
-        X = np.vstack([np.asarray(df.iloc[:,2:]) for df in X_dataframes])
+        X_dataframes = apply_rowmasks(X_dataframes, args.rowmask)
+        X = stack_features(X_dataframes, args.cleaningmodel)
         del X_dataframes # these are large, so we try to free the memory
         print(f"{time.time() - startup_time}: loading y")
         y_dataframes = [pd.read_csv(f, parse_dates=["DTS"])
@@ -84,7 +127,8 @@ if __name__ == "__main__":
         print(f"{time.time() - startup_time}: loading X")
         X_dataframes = [pd.read_csv(f, parse_dates=["DTS"])
                 for f in args.DATAFILE]
-        X = np.vstack([np.asarray(df.iloc[:,2:]) for df in X_dataframes])
+        X_dataframes = apply_rowmasks(X_dataframes, args.rowmask)
+        X = stack_features(X_dataframes, args.cleaningmodel)
         mrndts = pd.concat([df[["MRN","DTS"]] for df in X_dataframes],
                 axis=0).reset_index(drop=True)
         del X_dataframes # these are large, so we try to free the memory
@@ -111,3 +155,37 @@ if __name__ == "__main__":
             f.write("feature,importance\n")
             for feature,importance in zip(colnames, mean_importances):
                 f.write(f"{feature},{importance:.9f}\n")
+
+    elif args.command == 'explain':
+        print(f"{time.time() - startup_time}: loading X")
+        X_dataframes = [pd.read_csv(f, parse_dates=["DTS"], dtype={"MRN": str})
+                for f in args.DATAFILE]
+        X_dataframes = apply_rowmasks(X_dataframes, args.rowmask)
+        if args.cleaningmodel is None:
+            featurenames = list(X_dataframes[0].columns[2:])
+        else:
+            featurenames = CleaningTransformer(args.cleaningmodel).featurenames
+        X = stack_features(X_dataframes, args.cleaningmodel)
+        mrndts = pd.concat([df[["MRN","DTS"]] for df in X_dataframes],
+                axis=0).reset_index(drop=True)
+        del X_dataframes # these are large, so we try to free the memory
+        print(f"{time.time() - startup_time}: loading model")
+        bt_model = pickle.load(args.MODELFILE)
+        print(f"{time.time() - startup_time}: applying model")
+        y_hat = bt_model.predict_proba(np.asarray(X))[:, 1]
+        if args.top is None:
+            rows = np.arange(len(y_hat))
+        else:
+            rows = np.argsort(-y_hat, kind='stable')[:args.top]
+        print(f"{time.time() - startup_time}: calculating contributions " +
+                f"for {len(rows)} rows")
+        # the contributions of each row (plus the bias) sum to its log odds
+        contributions = bt_model.get_booster().predict(
+                xgb.DMatrix(np.asarray(X)[rows]), pred_contribs=True)
+        print(f"{time.time() - startup_time}: saving result")
+        contributions_dataframe = pd.concat([
+            mrndts.iloc[rows].reset_index(drop=True),
+            pd.DataFrame(dict(y_hat=y_hat[rows])),
+            pd.DataFrame(contributions, columns=featurenames + ["BIAS"])],
+            axis=1)
+        contributions_dataframe.to_csv(args.OUTFILE, index=False)
@@ -0,0 +1,86 @@
+import numpy as np
+import scipy.sparse
+from concurrent.futures import ProcessPoolExecutor
+
+
+class PatientClusters:
+    """Groups the rows of a dataset by patient (MRN) so that bootstraps can
+    resample whole patients rather than individual patient-days.
+    """
+
+    def __init__(self, mrns):
+        self.patients, self.row_patient = np.unique(
+                np.asarray(mrns), return_inverse=True)
+        self.num_patients = len(self.patients)
+
+    def histogram(self, row_bins, num_bins, values=None):
+        """Collapse the rows into a (num_bins x num_patients) sparse matrix
+        with the sum of values (or count of rows) for each bin and patient.
+        """
+        if values is None:
+            values = np.ones(len(row_bins))
+        return scipy.sparse.csr_matrix(
+                (np.asarray(values, dtype=float),
+                    (np.asarray(row_bins), self.row_patient)),
+                shape=(num_bins, self.num_patients))
+
+    def resampling_weights(self, rngs):
+        """Generate a (num_patients x len(rngs)) matrix with the number of
+        times each patient was drawn in each bootstrap replicate.
+        """
+        return np.array([np.bincount(
+                rng.integers(0, self.num_patients, self.num_patients),
+                minlength=self.num_patients) for rng in rngs], dtype=float).T
+
+
+def chunk_size_for(num_bins, num_patients, max_cells=2**24):
+    """Choose how many replicates to process at a time so that the dense
+    (num_bins x chunk) and (num_patients x chunk) intermediates stay within a
+    bounded amount of memory.
+    """
+    return max(1, min(1000, max_cells // max(1, num_bins, num_patients)))
+
+
+def trapezoid_area(x, y):
+    """Area under each column of y as a function of the matching column of x.
+    """
+    return np.sum(np.diff(x, axis=0) * (y[1:] + y[:-1]) / 2, axis=0)
+
+
+# state shared with each worker process when the pool is started, so that the
+# (potentially large) data is only sent once per worker rather than per chunk
+worker_replicate_function = None
+worker_data = None
+
+def init_worker(replicate_function, data):
+    global worker_replicate_function, worker_data
+    worker_replicate_function = replicate_function
+    worker_data = data
+
+def run_chunk(seeds):
+    return worker_replicate_function(worker_data,
+            [np.random.default_rng(s) for s in seeds])
+
+
+def run_bootstraps(replicate_function, data, num_bootstraps, seed=0,
+        num_workers=1, chunk_size=50):
+    """Evaluate replicate_function(data, rngs) over num_bootstraps replicates,
+    returning the list of per-replicate results.
+
+    Every replicate gets its own random generator spawned from seed, and the
+    chunks of replicates are merged back in order, so the results are the
+    same regardless of the number of worker processes.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(num_bootstraps)
+    chunks = [seeds[start:start + chunk_size]
+            for start in range(0, num_bootstraps, chunk_size)]
+
+    if num_workers <= 1:
+        init_worker(replicate_function, data)
+        results = [run_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(num_workers, initializer=init_worker,
+                initargs=(replicate_function, data)) as pool:
+            results = list(pool.map(run_chunk, chunks))
+
+    return [replicate for chunk in results for replicate in chunk]
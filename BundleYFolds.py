@@ -15,6 +15,8 @@ def parse_arguments():
             help='individual y files to bundle together')
     argument_parser.add_argument('BUNDLEFILE',
             help='filename of the generated y datafile bundle')
+    argument_parser.add_argument('--mrns', action='store_true',
+            help='bundle the MRN of each row instead of the y values')
 
     return argument_parser.parse_args()
 
@@ -25,7 +27,10 @@ if __name__ == "__main__":
 
     print(f"{time.time() - startup_time}: loading ys")
     y_dataframes = [pd.read_csv(f, parse_dates=["DTS"]) for f in args.YFILE]
-    ys = [np.asarray(df.iloc[:,2:]).ravel() for df in y_dataframes]
+    if args.mrns:
+        ys = [np.asarray(df['MRN']) for df in y_dataframes]
+    else:
+        ys = [np.asarray(df.iloc[:,2:]).ravel() for df in y_dataframes]
 
     print(f"{time.time() - startup_time}: generating bundle")
     with open(args.BUNDLEFILE, 'wb') as f:
@@ -0,0 +1,37 @@
+# The exported CSV files may have line feeds and/or commas wrapped in quotes
+# (e.g. in free-text fields), so a record may span several lines and can't
+# simply be split on commas; these need to be handled carefully.
+
+# read a record as it appears in the file (including its line endings), which
+# may span several lines
+function readrawrecord(stream)
+    record = readline(stream, keep=true)
+
+    # continue reading until all quotes are closed.
+    while count(isequal('"'), record) % 2 == 1 && !eof(stream)
+        record *= readline(stream, keep=true)
+    end
+
+    return record
+end
+
+# convert a raw record into a single line with the quotes removed, so that its
+# fields can be split on commas (this doesn't use any Regex objects, so it can
+# be called on several threads)
+function normalizerecord(record)
+    line = replace(replace(record, "\r\n" => ""), "\n" => "")
+
+    if '"' in line
+        quotes = split(line, "\"")
+        for i in 2:2:length(quotes)
+            # remove commas and carriage returns
+            quotes[i] = replace(replace(quotes[i], ','=>'_'), '\r'=>'_')
+        end
+        line = join(quotes, "")
+    end
+
+    return line
+end
+
+# read a record, which may span several lines
+readrecord(stream) = normalizerecord(readrawrecord(stream))
@@ -8,12 +8,12 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import sklearn
 from sklearn.metrics import roc_curve, auc, roc_auc_score
-from sklearn.utils import resample
 import time
 import os.path
 import argparse
 import pickle
 import warnings
+from Bootstrap import PatientClusters, chunk_size_for, run_bootstraps
 
 startup_time = time.time()
 
@@ -37,10 +37,49 @@ def calibration_curve(bin_boundaries, ys, y_hats):
     return frac_pos, ece, mce
 
 
-def bootstrapped_calibration_plot(ax, ys, y_hats,
-        xlabel="Predicted Probability",
-        ylabel=("Observed Probability","Number of events in bin"), legend=True,
-        num_bootstraps=1000, n_bins=10):
+def calibration_replicates(data, rngs):
+    clusters, pos_hist, est_pos_hist, count_hist = data
+
+    # tally the bins for all of the replicates in this chunk at once
+    weights = clusters.resampling_weights(rngs)
+    bin_pos = pos_hist @ weights
+    bin_est_pos = est_pos_hist @ weights
+    bin_counts = count_hist @ weights
+
+    # avoid warning when dividing by a bin of size 0
+    divisor_bin_counts = bin_counts.copy()
+    divisor_bin_counts[bin_counts == 0] = np.nan # empty bin means no valid data
+    bin_calibration_error = np.abs(bin_pos - bin_est_pos)
+
+    fractions_of_positives = (bin_pos / divisor_bin_counts).T
+    eces = np.sum(bin_calibration_error, axis=0) / np.sum(bin_counts, axis=0)
+    mces = np.nanmax(bin_calibration_error / divisor_bin_counts, axis=0)
+
+    return list(zip(fractions_of_positives, eces, mces))
+
+
+def bootstrap_calibration_curves(bin_boundaries, ys, y_hats, mrns,
+        num_bootstraps=1000, seed=0, num_workers=1):
+    clusters = PatientClusters(mrns)
+
+    # collapse the rows into per-patient tallies for each bin
+    n_bins = len(bin_boundaries) - 1
+    bins = np.digitize(y_hats, bin_boundaries) - 1
+    pos_hist = clusters.histogram(bins, n_bins, np.asarray(ys, dtype=float))
+    est_pos_hist = clusters.histogram(bins, n_bins, y_hats)
+    count_hist = clusters.histogram(bins, n_bins)
+
+    replicates = run_bootstraps(calibration_replicates,
+            (clusters, pos_hist, est_pos_hist, count_hist), num_bootstraps,
+            seed=seed, num_workers=num_workers,
+            chunk_size=chunk_size_for(n_bins, clusters.num_patients))
+    fractions_of_positives, eces, mces = zip(*replicates)
+
+    return np.array(fractions_of_positives), np.array(eces), np.array(mces)
+
+
+def bootstrapped_calibration_metrics(ys, y_hats, num_bootstraps=1000,
+        n_bins=10, mrns=None, seed=0, num_workers=1):
 
     alpha = 0.05 # 1 - (confidence interval = 95%)
 
@@ -51,27 +90,48 @@ def bootstrapped_calibration_plot(ax, ys, y_hats,
     # generate the data for the main calibration curve
     fractions_of_positives, ece, mce = calibration_curve(bin_boundaries, ys, y_hats)
 
-    # generate the bootstrap samples
-    bootstrap_samples = [resample(ys, y_hats) for i in range(num_bootstraps)]
+    # resample whole patients if we know them (since days from the same
+    # patient are correlated), otherwise treat each row as its own patient
+    if mrns is None:
+        mrns = np.arange(len(ys))
 
-    bootstrap_fractions_of_positives = []
-    bootstrap_ece = []
-    bootstrap_mce = []
-    for ys_,y_hats_ in bootstrap_samples:
-        fractions_of_positives_, ece_, mce_ = calibration_curve(bin_boundaries, ys_, y_hats_)
-        bootstrap_fractions_of_positives.append(fractions_of_positives_)
-        bootstrap_ece.append(ece_)
-        bootstrap_mce.append(mce_)
+    # generate the bootstrap curves
+    (bootstrap_fractions_of_positives, bootstrap_ece,
+        bootstrap_mce) = bootstrap_calibration_curves(
+            bin_boundaries, ys, y_hats, mrns, num_bootstraps=num_bootstraps,
+            seed=seed, num_workers=num_workers)
 
     frac_ci_low, frac_ci_high = np.nanquantile(bootstrap_fractions_of_positives, [alpha/2, 1 - alpha/2], axis=0)
     ece_ci_low, ece_ci_high = np.nanquantile(bootstrap_ece, [alpha/2, 1 - alpha/2])
     mce_ci_low, mce_ci_high = np.nanquantile(bootstrap_mce, [alpha/2, 1 - alpha/2])
+
+    return dict(alpha=alpha, bin_boundaries=bin_boundaries,
+            bin_centers=bin_centers,
+            bin_counts=np.histogram(y_hats, bin_boundaries)[0],
+            fractions_of_positives=fractions_of_positives, ece=ece, mce=mce,
+            frac_ci=(frac_ci_low, frac_ci_high),
+            ece_ci=(ece_ci_low, ece_ci_high),
+            mce_ci=(mce_ci_low, mce_ci_high))
+
+
+def render_bootstrapped_calibration(ax, metrics,
+        xlabel="Predicted Probability",
+        ylabel=("Observed Probability","Number of events in bin"), legend=True):
+    bin_boundaries = metrics['bin_boundaries']
+    bin_centers = metrics['bin_centers']
+    fractions_of_positives = metrics['fractions_of_positives']
+    ece = metrics['ece']
+    mce = metrics['mce']
+    frac_ci_low, frac_ci_high = metrics['frac_ci']
+    ece_ci_low, ece_ci_high = metrics['ece_ci']
+    mce_ci_low, mce_ci_high = metrics['mce_ci']
     yerr = np.array([fractions_of_positives - frac_ci_low, frac_ci_high - fractions_of_positives])
 
     ax2 = ax.twinx() # create a second axis for the histogram
 
     # plot the histogram
-    ax.hist(y_hats, bin_boundaries, facecolor='lightgrey', edgecolor='lightgrey', rwidth=0.9)
+    ax.hist(bin_centers, bin_boundaries, weights=metrics['bin_counts'],
+            facecolor='lightgrey', edgecolor='lightgrey', rwidth=0.9)
 
     # plot the diagonal (perfect calibarion) line
     ax2.plot([0, 1], [0, 1], linestyle='--', color="grey")
@@ -121,8 +181,18 @@ def bootstrapped_calibration_plot(ax, ys, y_hats,
         plt.setp(ax.get_yticklabels(), visible=False)
 
 
-def cv_calibration_plot(ax, ys, y_hats, n_bins=10, xlabel="Predicted Probability",
-        ylabel="Observed Probability", legend=True):
+def bootstrapped_calibration_plot(ax, ys, y_hats,
+        xlabel="Predicted Probability",
+        ylabel=("Observed Probability","Number of events in bin"), legend=True,
+        num_bootstraps=1000, n_bins=10, mrns=None, seed=0, num_workers=1):
+    metrics = bootstrapped_calibration_metrics(ys, y_hats,
+            num_bootstraps=num_bootstraps, n_bins=n_bins, mrns=mrns,
+            seed=seed, num_workers=num_workers)
+    render_bootstrapped_calibration(ax, metrics, xlabel=xlabel,
+            ylabel=ylabel, legend=legend)
+
+
+def cv_calibration_metrics(ys, y_hats, n_bins=10):
     bin_boundaries = np.arange(n_bins + 1) / n_bins
     bin_boundaries[-1] = 1.0 + np.spacing(1.0) # make sure the final bin includes 1.0
 
@@ -141,8 +211,21 @@ def cv_calibration_plot(ax, ys, y_hats, n_bins=10, xlabel="Predicted Probability
         warnings.simplefilter("ignore")
         mean_fraction_of_positives = np.nanmean(fractions_of_positives, axis=0)
         sd_fraction_of_positives = np.nanvar(fractions_of_positives, axis=0)**0.5
-        mean_plus_sd = np.minimum(mean_fraction_of_positives + sd_fraction_of_positives, 1)
-        mean_minus_sd = np.maximum(mean_fraction_of_positives - sd_fraction_of_positives, 0)
+
+    return dict(bin_centers=bin_centers,
+            fractions_of_positives=fractions_of_positives,
+            mean_fraction_of_positives=mean_fraction_of_positives,
+            sd_fraction_of_positives=sd_fraction_of_positives)
+
+
+def render_cv_calibration(ax, metrics, xlabel="Predicted Probability",
+        ylabel="Observed Probability", legend=True):
+    bin_centers = metrics['bin_centers']
+    fractions_of_positives = metrics['fractions_of_positives']
+    mean_fraction_of_positives = metrics['mean_fraction_of_positives']
+    sd_fraction_of_positives = metrics['sd_fraction_of_positives']
+    mean_plus_sd = np.minimum(mean_fraction_of_positives + sd_fraction_of_positives, 1)
+    mean_minus_sd = np.maximum(mean_fraction_of_positives - sd_fraction_of_positives, 0)
 
     # plot the grey +/- one SD range
     ax.fill_between(
@@ -167,12 +250,26 @@ def cv_calibration_plot(ax, ys, y_hats, n_bins=10, xlabel="Predicted Probability
     ax.set(xlabel=xlabel, ylabel=ylabel)
 
 
+def cv_calibration_plot(ax, ys, y_hats, n_bins=10, xlabel="Predicted Probability",
+        ylabel="Observed Probability", legend=True):
+    render_cv_calibration(ax, cv_calibration_metrics(ys, y_hats, n_bins=n_bins),
+            xlabel=xlabel, ylabel=ylabel, legend=legend)
+
+
+def calibration_plot_from_metrics(ax, metrics, **kwargs):
+    # metrics files hold the results for every kind of plot
+    if metrics['bootstraps'] > 0:
+        render_bootstrapped_calibration(ax, metrics['calibration'], **kwargs)
+    else:
+        render_cv_calibration(ax, metrics['calibration'], **kwargs)
+
+
 def parse_arguments():
     argument_parser = argparse.ArgumentParser()
-    argument_parser.add_argument('YS',
+    argument_parser.add_argument('YS', nargs='?',
             type=argparse.FileType('rb'),
             help='bundle of actual y values for each fold')
-    argument_parser.add_argument('YHATS',
+    argument_parser.add_argument('YHATS', nargs='?',
             type=argparse.FileType('rb'),
             help='bundle of predicted y values for each fold')
     argument_parser.add_argument('PLOTFILE',
@@ -181,8 +278,24 @@ def parse_arguments():
     argument_parser.add_argument('--dpi', type=int, default=150)
     argument_parser.add_argument('--bootstraps', type=int, default=0,
             help='number of bootstraps to use for confidence intervals')
+    argument_parser.add_argument('--mrns',
+            type=argparse.FileType('rb'),
+            help='bundle of MRNs for each fold; if given, bootstrap by ' +
+                'resampling patients rather than individual rows')
+    argument_parser.add_argument('--seed', type=int, default=0,
+            help='random seed for the bootstraps')
+    argument_parser.add_argument('--workers', type=int, default=1,
+            help='number of processes to use for the bootstraps')
+    argument_parser.add_argument('--metrics',
+            type=argparse.FileType('rb'),
+            help='metrics file (from ComputeMetrics.py) to plot instead of ' +
+                'computing the curves from YS and YHATS')
 
-    return argument_parser.parse_args()
+    args = argument_parser.parse_args()
+    if args.metrics is None and args.YHATS is None:
+        argument_parser.error('either YS and YHATS or --metrics is required')
+
+    return args
 
 
 if __name__ == "__main__":
@@ -190,16 +303,27 @@ if __name__ == "__main__":
     args = parse_arguments()
     #print(args)
 
-    print(f"{time.time() - startup_time}: loading ys")
-    ys = pickle.load(args.YS)
-    print(f"{time.time() - startup_time}: loading y_hats")
-    y_hats = pickle.load(args.YHATS)
+    if args.metrics is not None:
+        print(f"{time.time() - startup_time}: loading metrics")
+        metrics = pickle.load(args.metrics)
+    else:
+        print(f"{time.time() - startup_time}: loading ys")
+        ys = pickle.load(args.YS)
+        print(f"{time.time() - startup_time}: loading y_hats")
+        y_hats = pickle.load(args.YHATS)
+        if args.mrns is not None:
+            print(f"{time.time() - startup_time}: loading mrns")
+            mrns = pickle.load(args.mrns)
 
     print(f"{time.time() - startup_time}: generating plot")
     fig,ax = plt.subplots(figsize=(7,7))
     ax.set_title(args.title)
-    if args.bootstraps > 0:
-        bootstrapped_calibration_plot(ax, ys[0], y_hats[0], num_bootstraps=args.bootstraps)
+    if args.metrics is not None:
+        calibration_plot_from_metrics(ax, metrics)
+    elif args.bootstraps > 0:
+        bootstrapped_calibration_plot(ax, ys[0], y_hats[0], num_bootstraps=args.bootstraps,
+                mrns=None if args.mrns is None else mrns[0],
+                seed=args.seed, num_workers=args.workers)
     else:
         cv_calibration_plot(ax, ys, y_hats)
     plt.savefig(args.PLOTFILE, bbox_inches='tight', dpi=args.dpi)
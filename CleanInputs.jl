@@ -1,22 +1,102 @@
 #!/usr/bin/julia
 using ArgParse
-using OnlineStats
+using Serialization
+include("FeatureFiles.jl")
+include("QuantileSketch.jl")
+
+# the statistics used to fit a cleaning model, which can be saved as a sketch
+# of a single file (e.g. a fold) and merged with the sketches of other files,
+# so that each file only needs to be read once no matter how many models it's
+# used to fit
+mutable struct CleaningSketch
+    featurenames::Vector{String}
+    numrows::Int
+    numnans::Vector{Int}
+    numzeros::Vector{Int}
+    maxes::Vector{Float32}
+    values::Vector{TDigest}         # the finite values
+    nonzerovalues::Vector{TDigest}  # the finite values that aren't zero
+end
+
+CleaningSketch(featurenames) = CleaningSketch(featurenames, 0,
+    zeros(Int, length(featurenames)), zeros(Int, length(featurenames)),
+    zeros(Float32, length(featurenames)),
+    [TDigest() for name in featurenames], [TDigest() for name in featurenames])
+
+function fit!(sketch::CleaningSketch, vals)
+    sketch.numrows += 1
+    for i in 1:length(vals)
+        # if it's finite, include it in our stats
+        if isfinite(vals[i])
+            fit!(sketch.values[i], vals[i])
+            sketch.maxes[i] = max(sketch.maxes[i], vals[i])
+            if vals[i] == 0
+                sketch.numzeros[i] += 1
+            else
+                fit!(sketch.nonzerovalues[i], vals[i])
+            end
+        else
+            sketch.numnans[i] += 1
+        end
+    end
+    return sketch
+end
+
+function Base.merge!(sketch::CleaningSketch, other::CleaningSketch)
+    @assert sketch.featurenames == other.featurenames "sketches are of different features"
+    sketch.numrows += other.numrows
+    sketch.numnans .+= other.numnans
+    sketch.numzeros .+= other.numzeros
+    sketch.maxes .= max.(sketch.maxes, other.maxes)
+    merge!.(sketch.values, other.values)
+    merge!.(sketch.nonzerovalues, other.nonzerovalues)
+    return sketch
+end
+
+function writemodel(filename, sketch::CleaningSketch)
+    open(filename, "w") do f
+        # write the headers
+        write(f, "Feature,NaNFraction,Q1,Median,Q3,Max,ZeroFraction,NonZeroQ3\n")
+        # write a row of stats for each feature
+        numrows = sketch.numrows
+        for i in 1:length(sketch.featurenames)
+            write(f, "$(sketch.featurenames[i]),$(sketch.numnans[i]/numrows)," *
+                  "$(quantile(sketch.values[i], 0.25))," *
+                  "$(quantile(sketch.values[i], 0.5))," *
+                  "$(quantile(sketch.values[i], 0.75))," *
+                  "$(sketch.maxes[i])," *
+                  "$(sketch.numzeros[i]/numrows)," *
+                  "$(quantile(sketch.nonzerovalues[i], 0.75))\n"
+                 )
+        end
+    end
+end
 
 function parse_commandline()
     s = ArgParseSettings()
 
     @add_arg_table! s begin
         "sourcefiles"
-            help = "files with features, all sharing the same columns"
-            nargs = '+'
-            required = true
+            help = "files with features, all sharing the same columns (CSV, " *
+                "or binary feature files ending with .f32)"
+            nargs = '*'
 
         "--model"
             help = "model file to train or apply"
-            required = true
+
+        "--savesketch"
+            help = "file to save a sketch of the statistics of the source " *
+                "files in, to be merged with others (with --mergesketches) " *
+                "to train models on several sets of files"
+
+        "--mergesketches"
+            help = "sketches (saved with --savesketch) of more files to " *
+                "train the model on"
+            nargs = '+'
 
         "--output", "-o"
-            help = "target file with cleaned-up features"
+            help = "target file with cleaned-up features (in the binary " *
+                "feature format if it ends with .f32)"
             required = false
     end
 
@@ -28,7 +108,17 @@ function main()
 
     # open the source files and read their headers
     sourcefiles = [open(filename,"r") for filename in args["sourcefiles"]]
-    allcols = [split(readline(f),",") for f in sourcefiles]
+    binaries = isbinaryfeaturefile.(args["sourcefiles"])
+    allcols = [readfeatureheader(f, binary)
+               for (f, binary) in zip(sourcefiles, binaries)]
+
+    # load the sketches of any other files
+    sketches = [deserialize(filename)
+                for filename in something(args["mergesketches"], String[])]
+    for sketch in sketches
+        push!(allcols, ["MRN"; "DTS"; sketch.featurenames])
+    end
+    @assert !isempty(allcols) "no source files or sketches"
 
     # make sure the column names are the same for all input files
     for cols in allcols[2:end]
@@ -41,71 +131,56 @@ function main()
 
     # if we don't have an output, we must be training the model
     if args["output"] == nothing
+        @assert (args["model"] ≠ nothing ||
+                 args["savesketch"] ≠ nothing) "nothing to generate"
 
         # set up the statistics to track
+        sketch = CleaningSketch(featurenames)
 
-        numnans = [0 for i in 1:numfeatures]
-        firstquartiles = [P2Quantile(0.25) for i in 1:numfeatures]
-        thirdquartiles = [P2Quantile(0.75) for i in 1:numfeatures]
-        medians = [P2Quantile(0.5) for i in 1:numfeatures]
-        maxes = [0f0 for i in 1:numfeatures]
-        numzeros = [0 for i in 1:numfeatures]
-        nonzerothirdquartiles = [P2Quantile(0.75) for i in 1:numfeatures]
-
-        numrows = 0
+        vals = Vector{Float32}(undef, numfeatures)
 
         # for each source file...
-        for f in sourcefiles
+        for (f, binary) in zip(sourcefiles, binaries)
             print("processing file $f...\n")
             # read each line
-            for line in eachline(f)
-                numrows += 1
+            while !eof(f)
+                numrows = sketch.numrows + 1
                 if (numrows % 1000) == 0
                     print("Processing row $numrows...\n")
                 end
-                cols = split(line,",")
-                if (length(cols) != numfixedcols + numfeatures)
-                    print("error on line $numrows: expected $(numfixedcols + numfeatures) columns but found $(length(cols))\n")
-                    exit(1)
-                end
-                vals = [parse(Float32, val) for val in cols[numfixedcols+1:end]]
-                for i in 1:numfeatures
-                    # if it's finite, include it in our stats
-                    if isfinite(vals[i])
-                        fit!(firstquartiles[i], vals[i])
-                        fit!(thirdquartiles[i], vals[i])
-                        fit!(medians[i], vals[i])
-                        maxes[i] = max(maxes[i], vals[i])
-                        if vals[i] == 0
-                            numzeros[i] += 1
-                        else
-                            fit!(nonzerothirdquartiles[i], vals[i])
-                        end
-                    else
-                        numnans[i] += 1
+                if binary
+                    readfeaturerow!(vals, f, binary)
+                else
+                    cols = split(readline(f),",")
+                    if (length(cols) != numfixedcols + numfeatures)
+                        print("error on line $numrows: expected $(numfixedcols + numfeatures) columns but found $(length(cols))\n")
+                        exit(1)
+                    end
+                    for i in 1:numfeatures
+                        vals[i] = parse(Float32, cols[numfixedcols+i])
                     end
                 end
+                fit!(sketch, vals)
             end
         end
 
-        # write out our stats to the model file
-        open(args["model"], "w") do f
-            # write the headers
-            write(f, "Feature,NaNFraction,Q1,Median,Q3,Max,ZeroFraction,NonZeroQ3\n")
-            # write a row of stats for each feature
-            for i in 1:numfeatures
-                write(f, "$(featurenames[i]),$(numnans[i]/numrows)," *
-                      "$(value(firstquartiles[i]))," *
-                      "$(value(medians[i]))," *
-                      "$(value(thirdquartiles[i]))," *
-                      "$(maxes[i])," *
-                      "$(numzeros[i]/numrows)," *
-                      "$(value(nonzerothirdquartiles[i]))\n"
-                     )
+        if args["savesketch"] ≠ nothing
+            # save the statistics of just the source files
+            serialize(args["savesketch"], sketch)
+        end
+
+        if args["model"] ≠ nothing
+            # write out our stats (with any other sketches) to the model file
+            for other in sketches
+                print("merging a sketch of $(other.numrows) rows...\n")
+                merge!(sketch, other)
             end
+            writemodel(args["model"], sketch)
         end
     else
         # we must be applying the model to data
+        @assert args["model"] ≠ nothing "no model to apply"
+        @assert isempty(sketches) "sketches can only be merged when training"
 
         # load the model
         nanfractions = Array{Float32}(undef, 0)
@@ -152,26 +227,56 @@ function main()
         end
         keepfeatures = (nanfractions .< maxnanfraction) .& (zerofractions .< maxzerofraction)
 
+        outbinary = isbinaryfeaturefile(args["output"])
+        keptvals = Vector{Float32}(undef, sum(keepfeatures))
+        vals = Vector{Float32}(undef, numfeatures)
         open(args["output"], "w") do outfile
             # write the header containing the columns we're keeping
-            write(outfile, join(allcols[1][1:numfixedcols], ","), ",",
-                  (join(featurenames[keepfeatures],",")), "\n")
+            writefeatureheader(outfile, outbinary,
+                [allcols[1][1:numfixedcols]; featurenames[keepfeatures]])
 
             # for each source file...
             numrows = 0
-            for f in sourcefiles
+            for (f, binary) in zip(sourcefiles, binaries)
                 # read each line
-                for line in eachline(f)
+                while !eof(f)
                     numrows += 1
                     if (numrows % 1000) == 0
                         print("Processing row $numrows...\n")
                     end
-                    cols = split(line,",")
-                    vals = [parse(Float32, val)
-                            for val in cols[numfixedcols+1:end]]
+                    if binary
+                        mrn, dts = readfeaturerow!(vals, f, binary)
+                        fixedcols = "$mrn,$dts"
+                    else
+                        cols = split(readline(f),",")
+                        for i in 1:numfeatures
+                            vals[i] = parse(Float32, cols[numfixedcols+i])
+                        end
+                        fixedcols = join(cols[1:numfixedcols], ",")
+                    end
+
+                    if outbinary
+                        # scale the values we're keeping in the same way as
+                        # below, replacing outliers with 0 (i.e. the median)
+                        j = 0
+                        for i in 1:numfeatures
+                            if keepfeatures[i]
+                                j += 1
+                                scaledval = (vals[i] - medians[i]) / iqrs[i]
+                                keptvals[j] = (minvalid ≤ scaledval ≤ maxvalid ?
+                                               scaledval : 0f0)
+                            end
+                        end
+                        if !binary
+                            mrn = parse(Int, cols[1])
+                            dts = DateTime(cols[2], featuredtsformat)
+                        end
+                        writefeaturerow(outfile, outbinary, mrn, dts, keptvals)
+                        continue
+                    end
 
                     # write the fixed columns (e.g. MRN and DTS)
-                    write(outfile, join(cols[1:numfixedcols], ","))
+                    write(outfile, fixedcols)
 
                     for i in 1:numfeatures
                         # if we're keeping this column...
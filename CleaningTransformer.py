@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+
+class CleaningTransformer:
+    """Applies a cleaning model fit by CleanInputs.jl to raw features as they
+    are loaded, giving the same values as the Xhat files that CleanInputs.jl
+    generates (without having to save and parse a cleaned copy of each file).
+    """
+
+    # the same limits for removing outliers as CleanInputs.jl
+    max_nan_fraction = 0.95
+    max_zero_fraction = 0.95
+    min_valid = -6. # IQR from median
+    max_valid = 6. # IQR from median
+
+    def __init__(self, modelfile):
+        model = pd.read_csv(modelfile, dtype={"Feature": str})
+        assert list(model.columns) == ["Feature", "NaNFraction", "Q1",
+                "Median", "Q3", "Max", "ZeroFraction", "NonZeroQ3"]
+        stats = {column: np.asarray(model[column], dtype=np.float32)
+                for column in model.columns[1:]}
+
+        self.input_featurenames = list(model["Feature"])
+        self.keep = ((stats["NaNFraction"] < self.max_nan_fraction) &
+                (stats["ZeroFraction"] < self.max_zero_fraction))
+        self.featurenames = [name for name, keep
+                in zip(self.input_featurenames, self.keep) if keep]
+
+        # some features (such as 1-hot vectors and medication doses) may be
+        # sparse but still significant; for these the IQR is spoofed (like
+        # CleanInputs.jl does when it applies a model, which reads the
+        # NonZeroQ3 values from the Max column) to be the maximum minus Q1
+        self.medians = stats["Median"][self.keep]
+        self.iqrs = np.where(stats["ZeroFraction"] >= 0.75,
+                stats["Max"] - stats["Q1"],
+                stats["Q3"] - stats["Q1"])[self.keep]
+
+    def transform(self, X_dataframe):
+        """Clean a dataframe with MRN, DTS and the raw features, returning
+        an array with the kept features scaled to have a median of zero and
+        an IQR of 1 (with missing values and outliers replaced by 0).
+        """
+        assert list(X_dataframe.columns[2:]) == self.input_featurenames, \
+                "the features don't match the cleaning model"
+        X = np.asarray(X_dataframe.iloc[:,2:], dtype=np.float32)[:, self.keep]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            X -= self.medians
+            X /= self.iqrs
+        # NaNs (missing values or 0/0) fail both comparisons, so become 0
+        X[~((X >= self.min_valid) & (X <= self.max_valid))] = 0
+        return X.astype(float)
+
+
+def stack_features(X_dataframes, cleaningmodel=None):
+    """Stack the features (without MRN and DTS) of several dataframes into
+    one array, cleaning them with the given cleaning model file (if any).
+    """
+    if cleaningmodel is None:
+        return np.vstack([np.asarray(df.iloc[:,2:]) for df in X_dataframes])
+    cleaner = CleaningTransformer(cleaningmodel)
+    return np.vstack([cleaner.transform(df) for df in X_dataframes])
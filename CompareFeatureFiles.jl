@@ -0,0 +1,99 @@
+#!/usr/bin/julia
+using ArgParse
+include("FeatureFiles.jl")
+
+# Checks that two feature files (e.g. the windowed statistics of a run that
+# resumed from a saved state and of a run from scratch) have the same rows
+# and features, with values that agree to within rounding.
+
+function parse_commandline()
+    s = ArgParseSettings()
+
+    @add_arg_table! s begin
+        "file1"
+            help = "file with features (CSV, or a binary feature file " *
+                "ending with .f32)"
+            required = true
+
+        "file2"
+            help = "file with features to compare to file1"
+            required = true
+
+        "--rtol"
+            help = "relative tolerance of the feature values (sums of the " *
+                "same values in a different order can differ slightly)"
+            arg_type = Float64
+            default = 1e-4
+
+        "--atol"
+            help = "absolute tolerance of the feature values"
+            arg_type = Float64
+            default = 1e-6
+    end
+
+    return parse_args(s)
+end
+
+function comparefeatures(filename1, filename2, rtol, atol)
+    binary1 = isbinaryfeaturefile(filename1)
+    binary2 = isbinaryfeaturefile(filename2)
+    file1 = open(filename1, "r")
+    file2 = open(filename2, "r")
+    try
+        columns = readfeatureheader(file1, binary1)
+        if readfeatureheader(file2, binary2) ≠ columns
+            print("$filename1 and $filename2 have different features\n")
+            return false
+        end
+
+        values1 = Vector{Float32}(undef, length(columns) - 2)
+        values2 = similar(values1)
+        row = 0
+        numdifferences = 0
+        while !eof(file1) && !eof(file2)
+            row += 1
+            mrn1, dts1 = readfeaturerow!(values1, file1, binary1)
+            mrn2, dts2 = readfeaturerow!(values2, file2, binary2)
+            if (mrn1, dts1) ≠ (mrn2, dts2)
+                print("row $row is for $mrn1 at $dts1 in $filename1 but " *
+                      "$mrn2 at $dts2 in $filename2\n")
+                return false
+            end
+            for i in 1:length(values1)
+                if !isapprox(values1[i], values2[i]; rtol=rtol, atol=atol,
+                             nans=true)
+                    numdifferences += 1
+                    if numdifferences ≤ 10
+                        print("$(columns[i + 2]) of $mrn1 at $dts1 is " *
+                              "$(values1[i]) in $filename1 but " *
+                              "$(values2[i]) in $filename2\n")
+                    end
+                end
+            end
+        end
+        if !eof(file1) || !eof(file2)
+            print("$filename1 and $filename2 have different numbers of rows\n")
+            return false
+        end
+        if numdifferences > 0
+            print("$numdifferences values differ\n")
+            return false
+        end
+        print("$filename1 and $filename2 match ($row rows)\n")
+        return true
+    finally
+        close(file1)
+        close(file2)
+    end
+end
+
+function main()
+    args = parse_commandline()
+
+    if !comparefeatures(args["file1"], args["file2"], args["rtol"],
+                        args["atol"])
+        exit(1)
+    end
+end
+
+main()
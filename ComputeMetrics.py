@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+
+import numpy as np
+import time
+import argparse
+import pickle
+from ROCPlot import bootstrapped_roc_metrics, cv_roc_metrics
+from PRPlot import bootstrapped_pr_metrics, cv_pr_metrics
+from CalibrationPlot import (bootstrapped_calibration_metrics,
+        cv_calibration_metrics)
+
+startup_time = time.time()
+
+
+def parse_arguments():
+    argument_parser = argparse.ArgumentParser(
+            description='compute the ROC, PR, and calibration curves (and ' +
+                'their confidence intervals) once so that they can be ' +
+                'rendered by any of the plotting scripts')
+    argument_parser.add_argument('YS',
+            type=argparse.FileType('rb'),
+            help='bundle of actual y values for each fold')
+    argument_parser.add_argument('YHATS',
+            type=argparse.FileType('rb'),
+            help='bundle of predicted y values for each fold')
+    argument_parser.add_argument('METRICSFILE',
+            type=argparse.FileType('wb'),
+            help='filename to use to save the metrics')
+    argument_parser.add_argument('--bootstraps', type=int, default=0,
+            help='number of bootstraps to use for confidence intervals')
+    argument_parser.add_argument('--mrns',
+            type=argparse.FileType('rb'),
+            help='bundle of MRNs for each fold; if given, bootstrap by ' +
+                'resampling patients rather than individual rows')
+    argument_parser.add_argument('--seed', type=int, default=0,
+            help='random seed for the bootstraps')
+    argument_parser.add_argument('--workers', type=int, default=1,
+            help='number of processes to use for the bootstraps')
+
+    return argument_parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+
+    print(f"{time.time() - startup_time}: loading ys")
+    ys = pickle.load(args.YS)
+    print(f"{time.time() - startup_time}: loading y_hats")
+    y_hats = pickle.load(args.YHATS)
+    mrns = None
+    if args.mrns is not None:
+        print(f"{time.time() - startup_time}: loading mrns")
+        mrns = pickle.load(args.mrns)[0]
+
+    metrics = dict(bootstraps=args.bootstraps)
+    if args.bootstraps > 0:
+        bootstrap_args = dict(num_bootstraps=args.bootstraps, mrns=mrns,
+                seed=args.seed, num_workers=args.workers)
+        print(f"{time.time() - startup_time}: computing ROC metrics")
+        metrics['roc'] = bootstrapped_roc_metrics(ys[0], y_hats[0],
+                **bootstrap_args)
+        print(f"{time.time() - startup_time}: computing PR metrics")
+        metrics['pr'] = bootstrapped_pr_metrics(ys[0], y_hats[0],
+                **bootstrap_args)
+        print(f"{time.time() - startup_time}: computing calibration metrics")
+        metrics['calibration'] = bootstrapped_calibration_metrics(ys[0],
+                y_hats[0], **bootstrap_args)
+    else:
+        print(f"{time.time() - startup_time}: computing ROC metrics")
+        metrics['roc'] = cv_roc_metrics(ys, y_hats)
+        print(f"{time.time() - startup_time}: computing PR metrics")
+        metrics['pr'] = cv_pr_metrics(ys, y_hats)
+        print(f"{time.time() - startup_time}: computing calibration metrics")
+        metrics['calibration'] = cv_calibration_metrics(ys, y_hats)
+
+    print(f"{time.time() - startup_time}: saving metrics")
+    pickle.dump(metrics, args.METRICSFILE)
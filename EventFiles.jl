@@ -0,0 +1,66 @@
+using Dates
+using Mmap
+
+# Tokenized events can be saved in a binary format (with a .events
+# extension) rather than as CSV, so that the measure names don't need to be
+# repeated on every row or looked up again when the events are read.  A
+# binary event file starts with a magic line, followed by fixed-size 28 byte
+# records, each holding the MRN (Int64), the DTS (Int64 milliseconds, as in
+# DateTime), the id of the measure (Int32, its line number in the token names
+# file) and the value (Float64), all little-endian.
+
+const binaryeventmagic = "EVENTS28\n"
+const binaryeventsize = 28
+
+isbinaryeventfile(filename::AbstractString) = endswith(filename, ".events")
+
+function writeeventheader(stream::IO)
+    write(stream, binaryeventmagic)
+end
+
+function writeevent(stream::IO, mrn, dts::DateTime, id, value)
+    write(stream, htol(Int64(mrn)), htol(Dates.value(dts)), htol(Int32(id)),
+          htol(Float64(value)))
+end
+
+# replace the ids of the events in a buffer of records (e.g. to map the ids
+# used by a single thread onto the ids for the whole file)
+function remapeventids!(records::Vector{UInt8}, ids)
+    GC.@preserve records for offset in 0:binaryeventsize:(length(records) - binaryeventsize)
+        idptr = Ptr{Int32}(pointer(records, offset + 17))
+        unsafe_store!(idptr, htol(Int32(ids[ltoh(unsafe_load(idptr))])))
+    end
+    return records
+end
+
+# the records of a binary event file are read straight from a memory map
+mutable struct BinaryEventFile
+    data::Vector{UInt8}
+    position::Int # offset of the next record
+end
+
+function openbinaryevents(filename)
+    data = Mmap.mmap(filename)
+    @assert String(data[1:sizeof(binaryeventmagic)]) == binaryeventmagic "not a binary event file"
+    @assert (length(data) - sizeof(binaryeventmagic)) % binaryeventsize == 0 "truncated binary event file"
+    return BinaryEventFile(data, sizeof(binaryeventmagic))
+end
+
+Base.eof(f::BinaryEventFile) = f.position >= length(f.data)
+
+# the byte offsets of the records (e.g. in an index from IndexEvents.jl)
+Base.position(f::BinaryEventFile) = f.position
+Base.seek(f::BinaryEventFile, offset) = (f.position = offset; f)
+Base.seekend(f::BinaryEventFile) = (f.position = length(f.data); f)
+
+function readbinaryevent(f::BinaryEventFile)
+    GC.@preserve f begin
+        ptr = pointer(f.data, f.position + 1)
+        mrn = Int(ltoh(unsafe_load(Ptr{Int64}(ptr))))
+        dts = DateTime(Dates.UTM(ltoh(unsafe_load(Ptr{Int64}(ptr + 8)))))
+        id = Int(ltoh(unsafe_load(Ptr{Int32}(ptr + 16))))
+        value = ltoh(unsafe_load(Ptr{Float64}(ptr + 20)))
+    end
+    f.position += binaryeventsize
+    return mrn, dts, id, value
+end
@@ -0,0 +1,62 @@
+using Dates
+
+# Wide feature tables can be saved in a binary format (with a .f32
+# extension) rather than as CSV, so that they don't need to be formatted and
+# parsed as text at every step of the pipeline.  A binary feature file starts
+# with a magic line and the same header line as a CSV file (MRN, DTS and the
+# feature names), followed by fixed-size rows, each holding the MRN (Int64),
+# the DTS (Int64 milliseconds, as in DateTime) and each feature as a Float32,
+# all little-endian.
+
+const binaryfeaturemagic = "F32FEATURES\n"
+
+const featuredtsformat = dateformat"yyyy-mm-ddTHH:MM:SS"
+
+isbinaryfeaturefile(filename::AbstractString) = endswith(filename, ".f32")
+
+function readfeatureheader(stream::IO, binary::Bool)
+    if binary
+        magic = String(read(stream, sizeof(binaryfeaturemagic)))
+        @assert magic == binaryfeaturemagic "not a binary feature file"
+    end
+    columns = split(readline(stream), ",")
+    @assert columns[1] == "MRN"
+    @assert columns[2] == "DTS"
+    return columns
+end
+
+function writefeatureheader(stream::IO, binary::Bool, columns)
+    if binary
+        write(stream, binaryfeaturemagic)
+    end
+    write(stream, join(columns, ","), "\n")
+end
+
+# read the next row into values (which must have a slot for each feature),
+# returning its MRN and DTS
+function readfeaturerow!(values::Vector{Float32}, stream::IO, binary::Bool)
+    if binary
+        mrn = Int(ltoh(read(stream, Int64)))
+        dts = DateTime(Dates.UTM(ltoh(read(stream, Int64))))
+        read!(stream, values)
+        values .= ltoh.(values)
+    else
+        cols = split(readline(stream), ",")
+        @assert length(cols) == length(values) + 2
+        mrn = parse(Int, cols[1])
+        dts = DateTime(cols[2], featuredtsformat)
+        for i in 1:length(values)
+            values[i] = parse(Float32, cols[i + 2])
+        end
+    end
+    return mrn, dts
+end
+
+function writefeaturerow(stream::IO, binary::Bool, mrn, dts::DateTime, values)
+    if binary
+        write(stream, htol(Int64(mrn)), htol(Dates.value(dts)))
+        write(stream, Float32[htol(Float32(value)) for value in values])
+    else
+        write(stream, "$mrn,$dts,$(join(values,","))\n")
+    end
+end
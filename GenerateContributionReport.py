@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+
+import numpy as np
+import pandas as pd
+import time
+import argparse
+
+startup_time = time.time()
+
+
+def parse_arguments():
+    argument_parser = argparse.ArgumentParser(
+            description='generate risk reports from per-feature contributions')
+    argument_parser.add_argument('XFILE',
+            help='csv file with the (cleaned) feature values for each row')
+    argument_parser.add_argument('CONTRIBUTIONFILE',
+            help='csv file with the predicted risk and feature contributions ' +
+                'for each row to report (from BoostedTrees.py explain)')
+    argument_parser.add_argument('INTERVENABLESFILE',
+            help='csv file listing the potentially intervenable features')
+    argument_parser.add_argument('REPORTFILE',
+            help='markdown file to which to save the reports')
+
+    return argument_parser.parse_args()
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def write_factors(out, order, effects, featurenames, featurevals):
+    for i in order:
+        out.write(f"- {100 * effects[i]:5.2f}%: {featurenames[i]} is " +
+                ("higher" if featurevals[i] > 0 else "lower") +
+                f" than average ({featurevals[i]} IQR)\n")
+
+
+def write_report(out, mrn, risk, featurenames, featurevals, contributions,
+        intervenables):
+    # the effect of a feature is the drop in risk from removing its
+    # contribution to the log odds, which plays the role of occluding it
+    margin = np.sum(contributions)
+    effects = sigmoid(margin) - sigmoid(margin - contributions[:-1])
+
+    # list the features that raise the risk, largest contribution first
+    order = np.argsort(-contributions[:-1], kind='stable')
+    order = order[effects[order] > 0]
+    intervenable = np.array([name in intervenables for name in featurenames],
+            dtype=bool)
+
+    out.write(f"# MRN: {mrn}\n")
+    out.write(f"Risk of delirium: {100 * risk:.2f}%\n")
+    out.write("\n")
+    out.write("Potentially intervenable contributing factors:\n")
+    write_factors(out, order[intervenable[order]], effects, featurenames,
+            featurevals)
+    out.write("\nOther contributing factors:\n")
+    write_factors(out, order[~intervenable[order]], effects, featurenames,
+            featurevals)
+    out.write("\n\n")
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+
+    print(f"{time.time() - startup_time}: loading contributions")
+    contributions = pd.read_csv(args.CONTRIBUTIONFILE, parse_dates=["DTS"],
+            dtype={"MRN": str})
+    featurenames = list(contributions.columns[3:-1])
+
+    print(f"{time.time() - startup_time}: loading X")
+    X = pd.read_csv(args.XFILE, parse_dates=["DTS"], dtype={"MRN": str})
+    if list(X.columns[2:]) != featurenames:
+        raise ValueError(f"{args.XFILE} and {args.CONTRIBUTIONFILE} have " +
+                "different features")
+    X = contributions[["MRN","DTS"]].merge(
+            X.drop_duplicates(["MRN","DTS"]), how='left', on=["MRN","DTS"])
+    featurevals = np.asarray(X.iloc[:,2:], dtype=np.float32)
+
+    # one feature name per line (which may contain commas)
+    with open(args.INTERVENABLESFILE, "r") as f:
+        if f.readline().rstrip('\n') != "feature":
+            raise ValueError(f"unexpected header in {args.INTERVENABLESFILE}")
+        intervenables = set(line.rstrip('\n') for line in f)
+
+    print(f"{time.time() - startup_time}: generating reports")
+    reportnames = [name.replace("_", " ") for name in featurenames]
+    with open(args.REPORTFILE, "w") as out:
+        for k in range(len(contributions)):
+            write_report(out, contributions["MRN"][k],
+                    contributions["y_hat"][k], reportnames, featurevals[k],
+                    np.asarray(contributions.iloc[k,3:], dtype=float),
+                    intervenables)
@@ -26,6 +26,23 @@ def uniform_deviate_from_text(text):
 def RandomizationValueForPatient(patient):
     return uniform_deviate_from_text(randomizationTextForPatient(patient))
 
+def randomization_texts(patients):
+    # same text as randomizationTextForPatient, built a column at a time
+    names = patients.FullName.str.split()
+    return (names.str[0].str.upper() + '|' + names.str[-1].str.upper() + '|' +
+            patients.Gender + '|' + patients.BirthDTS.map(str))
+
+def randomization_values(patients):
+    # same deviates as uniform_deviate_from_text (the first 8 bytes of the
+    # hash as a little-endian integer, scaled to [0, 1])
+    bits_per_byte = 8
+    bytes_used = 8
+    hashes = np.array([
+        int.from_bytes(hashlib.sha256(text.encode()).digest()[:bytes_used], 'little')
+        for text in randomization_texts(patients)], dtype=np.uint64)
+    return (hashes.astype(float) /
+            (math.pow(2, bytes_used*bits_per_byte) - 1))
+
 startup_time = time.time()
 
 def parse_arguments():
@@ -37,6 +54,10 @@ def parse_arguments():
             help='target csv file')
     argument_parser.add_argument('snappyoutput',
             help='target snappy file')
+    argument_parser.add_argument('--previous',
+            help='snappy file with earlier assignments; patients already ' +
+                'assigned there keep their assignment, and only new ' +
+                'patients are hashed and appended')
 
     return argument_parser.parse_args()
 
@@ -52,7 +73,15 @@ if __name__ == "__main__":
     numCVGroups = 10;
 
     patients = pd.read_csv(args.Patients, parse_dates=['BirthDTS'], dtype={'MRN' : int})
-    patients['RandomizationValue'] = patients.apply(RandomizationValueForPatient, axis=1)
+
+    # assignments only depend on the patient, so earlier ones can be reused
+    if args.previous is not None:
+        print(f"{time.time() - startup_time}: loading previous assignments")
+        previous = pd.read_parquet(args.previous)
+        patients = patients[~patients.MRN.isin(previous.MRN)].copy()
+
+    print(f"{time.time() - startup_time}: assigning {len(patients)} patients")
+    patients['RandomizationValue'] = randomization_values(patients)
     patients['Holdout'] = (patients.RandomizationValue < holdoutFraction)
 
     randomizationValueAfterHoldout = (patients.RandomizationValue - holdoutFraction) / (1 - holdoutFraction)
@@ -60,5 +89,16 @@ if __name__ == "__main__":
 
     patients['CVGroup'] = (numCVGroups * randomizationValueAfterHoldout).astype(np.int)
 
-    patients[['MRN','Holdout','CVGroup']].to_parquet(args.snappyoutput)
-    patients[['MRN','Holdout','CVGroup']].to_csv(args.csvoutput, index=False)
+    assignments = patients[['MRN','Holdout','CVGroup']]
+    if args.previous is not None:
+        assignments = pd.concat([previous[['MRN','Holdout','CVGroup']],
+            assignments], ignore_index=True)
+
+    # SplitIntoFolds.jl reads the assignments in step with the features, so
+    # they need to be sorted by MRN (the new patients aren't necessarily
+    # after the previous ones)
+    assignments = assignments.sort_values('MRN', kind='stable').reset_index(drop=True)
+
+    print(f"{time.time() - startup_time}: saving assignments")
+    assignments.to_parquet(args.snappyoutput)
+    assignments.to_csv(args.csvoutput, index=False)
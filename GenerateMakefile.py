@@ -1,10 +1,17 @@
 #!/usr/bin/python3
 import os
+import argparse
 import numpy as np
 
 nfolds = 10
 dpi = 1200
 num_bootstraps=1000
+bootstrap_by_patient = False # resample whole patients rather than patient-days
+sort_threads = 8 # threads used by each run of SortEvents.jl
+sort_memory = 2048 # MB of records each run of SortEvents.jl sorts at once
+tokenize_threads = 8 # threads used by each run of TokenizeEvents.jl
+default_shards = 1 # MRN-range shards for the training statistics (see --shards)
+default_workers = 1 # processes used by each bootstrap or SHAP run (see --workers)
 datadate = "2019-01-17"
 default_reportdts = "2018-01-17T05:00:00"
 reportdts = "$(REPORTDTS)"
@@ -27,6 +34,7 @@ modelscripts = ['./BoostedTrees.py', './RandomForest.py',
         #'./NuSVC.py'
         ]
 modelhasimportance = [ True, True, False, True, False ]
+modelhascontributions = [ True, False, False, False, False ]
 imported_measure_tables = [
     # BaseName      # DTS column            # Measure name column   # Value column      # use medstats
     [ "Lab",        "ResultDTS",            "ComponentNM",          "Result",           False   ],
@@ -35,15 +43,68 @@ imported_measure_tables = [
     [ "Medication", "MedicationTakenDTS",   "MedicationDSC",        "DiscreteDoseAMT",  True    ],
 ]
 
+# windowed statistics to save in the binary feature format (.f32) rather than
+# as CSV; the CAM score statistics are also read by GenerateYs.py, so they
+# stay as CSV
+binarystatistics = ["Lab", "Vital", "Medication"]
+
 conditions = ['', 'notdelirious_', 'nopriordelirium_']
 conditionnames = ['All Patients', 'Not Delirious', 'No Prior Delirium']
 
+# the features that exclude the rows from each of the conditions (rows in
+# which the feature is greater than 0)
+conditionfeatures = {
+    'notdelirious_': 'CAM_max',
+    'nopriordelirium_': 'CAM_alltimemax',
+}
+
 # make the outputs directory (if it does not yet exist)
 try:
     os.mkdir(outputsdir)
 except OSError:
     pass # directory already exists
 
+argument_parser = argparse.ArgumentParser(
+        description='generate the Makefile for the whole analysis')
+argument_parser.add_argument('--shards', type=int, default=default_shards,
+        help='number of contiguous MRN ranges to split the training ' +
+            'snapshots and events into, so that their windowed statistics ' +
+            'can be calculated in parallel (with make -j)')
+argument_parser.add_argument('--workers', type=int, default=default_workers,
+        help='number of processes used by each run of the bootstrapped ' +
+            'metrics and SHAP values (which multiplies the processes ' +
+            'started by make -j)')
+args = argument_parser.parse_args()
+shards = args.shards
+bootstrap_workers = args.workers
+shap_workers = args.workers
+
+def statistics_ext(basename):
+    return ".f32" if basename in binarystatistics else ".csv"
+
+# the X files of each fold (and of the holdout data) used to fit and apply the
+# models for cross-validation fold i, along with the model script options and
+# dependencies needed to clean them; the models clean the raw folds as they
+# load them rather than loading a cleaned copy of every fold for every
+# cleaning model
+def cv_inputs(xbase, i):
+    cleaningmodel = f"{xbase}clean_fold{i}.csv"
+    return ([f"{xbase}X_fold{j}.csv" for j in range(nfolds)],
+        f"{xbase}holdout_X_fold{i}.csv",
+        f"--cleaningmodel {cleaningmodel} ", [cleaningmodel])
+
+# the row masks selecting the rows of each fold (and of the holdout data for
+# cross-validation fold i) that meet a condition, so that the models can
+# subset the folds as they load them rather than loading a filtered copy
+def cv_rowmasks(xbase, c, i):
+    if c == '':
+        return [[] for j in range(nfolds)], []
+    return ([[f"{xbase}{c}rowmask_fold{j}.csv"] for j in range(nfolds)],
+        [f"{xbase}{c}rowmask_fold{i}_holdout.csv"])
+
+def rowmask_option(rowmasks):
+    return f" --rowmask {' '.join(rowmasks)}" if rowmasks else ""
+
 def start_rule(f, targets, dependencies):
     if len(targets) == 1:
         f.write(f"{targets[0]} : {' '.join(dependencies)}\n")
@@ -56,13 +117,30 @@ def start_rule(f, targets, dependencies):
         f.write(f".INTERMEDIATE : {intermediate}\n")
         f.write(f"{intermediate} : {' '.join(dependencies)}\n")
 
+def write_rowmasks_rule(f, inputfile, rowmasks):
+    # generate the row masks for all of the conditions in one pass
+    script = "./GenerateRowMasks.py"
+    dependencies = [script, inputfile]
+    start_rule(f, list(rowmasks.values()), dependencies)
+    masks = ' '.join(f"--mask {conditionfeatures[c]} 0.0 {rowmask}"
+            for c, rowmask in rowmasks.items())
+    f.write(f"\t{script} {inputfile} {masks}\n")
+    f.write("\n")
+
 with open("Makefile", "w") as f:
     plots = []
     text_results = []
+    xgboost_models = []
+    report_state_checks = []
 
     # add variable definitions
     f.write(f"REPORTDTS={default_reportdts}\n\n")
     f.write(f"REPORTSUFFIX=_$(subst :,,$(REPORTDTS))\n\n")
+    f.write(f"PREVIOUSREPORTDTS=\n\n")
+    f.write(f"PREVIOUSREPORTSUFFIX=_$(subst :,,$(PREVIOUSREPORTDTS))\n\n")
+    # optional file with the MRNs of the current inpatients, to limit the
+    # report to them
+    f.write(f"CENSUS=\n\n")
 
     # if no specific make target is given, generate all plots
     f.write(f"all : all_plots all_text_results\n\n")
@@ -75,9 +153,21 @@ with open("Makefile", "w") as f:
             + "\tshap-venv/bin/pip3 install -r $<\n"
             + "\n")
 
+    # sort the imported events by MRN and DTS (which the later steps assume)
+    for basename,dtscol,measurecol,valuecol,medstats in imported_measure_tables:
+        input_files = [f"{importeddatadir}{basename}s.csv"]
+        script = "./SortEvents.jl"
+        targets = [f"{cachedir}{basename}s_sorted.csv"]
+        dependencies = [script, *input_files]
+        start_rule(f, targets, dependencies)
+        f.write(f"\tJULIA_NUM_THREADS={sort_threads} {script} " +
+            f"--memory {sort_memory} --tmpdir {cachedir} " +
+            f"{' '.join(input_files)} MRN {dtscol} {' '.join(targets)}\n")
+        f.write("\n")
+
     # generate timestamp times for training
     input_files = [
-            f"{importeddatadir}CamScores.csv",
+            f"{cachedir}CamScores_sorted.csv",
             ]
     script = "./GenerateSnapshotTimes.jl"
     targets = [f"{cachedir}SnapshotTimes.csv"]
@@ -92,9 +182,10 @@ with open("Makefile", "w") as f:
             ]
     script = "./GenerateReportSnapshotTimes.jl"
     targets = [f"{cachedir}SnapshotTimes{reportsuffix}.csv"]
-    dependencies = [script, *input_files]
+    dependencies = [script, *input_files, "$(CENSUS)"]
     start_rule(f, targets, dependencies)
-    f.write(f"\t{script} {' '.join(input_files)} {reportdts} {' '.join(targets)}\n")
+    f.write(f"\t{script} $(if $(CENSUS),--census $(CENSUS)) " +
+        f"{' '.join(input_files)} {reportdts} {' '.join(targets)}\n")
     f.write("\n")
 
     # generate Demographics for training
@@ -137,69 +228,168 @@ with open("Makefile", "w") as f:
     for basename,dtscol,measurecol,valuecol,medstats in imported_measure_tables:
         input_files = [
                 f"./synonyms.csv",
-                f"{importeddatadir}{basename}s.csv",
+                f"{cachedir}{basename}s_sorted.csv",
                 ]
         script = "./TokenizeEvents.jl"
         targets = [
-                f"{cachedir}{basename}s_tokenized.csv",
+                f"{cachedir}{basename}s_tokenized.events",
                 f"{cachedir}{basename}s_tokennames.csv",
                 ]
         dependencies = [script, *input_files]
         start_rule(f, targets, dependencies)
-        f.write(f"\t{script} --synonyms {' '.join(input_files)} MRN {dtscol} "
+        f.write(f"\tJULIA_NUM_THREADS={tokenize_threads} {script} " +
+            f"--synonyms {' '.join(input_files)} MRN {dtscol} "
             + f"{measurecol} {valuecol} {' '.join(targets)}\n")
         f.write("\n")
 
-    # generate statistics files for training
-    for basename,dtscol,measurecol,valuecol,medstats in imported_measure_tables:
-        for xstart,xstop in xtimes + ytimes:
-            input_files = [
-                f"{cachedir}SnapshotTimes.csv",
-                f"{cachedir}{basename}s_tokenized.csv",
-                f"{cachedir}{basename}s_tokennames.csv",
-                ]
-            script = "./GenerateWindowedStatistics.jl"
-            targets = [
-                f"{cachedir}{basename}Statistics_" +
-                f"{xstart}hours_to_{xstop}hours.csv",
-                ]
-            dependencies = [script, *input_files]
+    # split the training snapshots (and each table's events) into shards by
+    # MRN range, so that the shards' statistics can be calculated in parallel
+    shardnames = [f"_shard{shard}of{shards}" for shard in range(1, shards + 1)]
+    shardboundaries = f"{cachedir}SnapshotShards{shards}.csv"
+    if shards > 1:
+        input_files = [f"{cachedir}SnapshotTimes.csv"]
+        script = "./ShardByMRN.jl"
+        targets = [shardboundaries]
+        dependencies = [script, *input_files]
+        start_rule(f, targets, dependencies)
+        f.write(f"\t{script} boundaries --shards {shards} " +
+            f"{' '.join(input_files)} {' '.join(targets)}\n")
+        f.write("\n")
+
+        sourcefiles = [f"{cachedir}SnapshotTimes.csv",
+            *[f"{cachedir}{basename}s_tokenized.events"
+                for basename,*_ in imported_measure_tables]]
+        for sourcefile in sourcefiles:
+            stem, ext = os.path.splitext(sourcefile)
+            targets = [f"{stem}{shardname}{ext}" for shardname in shardnames]
+            dependencies = [script, shardboundaries, sourcefile]
             start_rule(f, targets, dependencies)
-            f.write(f"\t{script}" +
-                (" --medstats " if medstats else " ") +
-                f"{xstart} {xstop} {' '.join(input_files)} " +
+            f.write(f"\t{script} split {shardboundaries} {sourcefile} " +
                 f"{' '.join(targets)}\n")
             f.write("\n")
 
-    # generate statistics files for a specific date for reporting
+    # generate statistics files for training (calculating every window in a
+    # single pass through each table's events, for each shard)
     for basename,dtscol,measurecol,valuecol,medstats in imported_measure_tables:
-        for xstart,xstop in xtimes + ytimes:
+        for shardname in (shardnames if shards > 1 else [""]):
             input_files = [
-                f"{cachedir}SnapshotTimes{reportsuffix}.csv",
-                f"{cachedir}{basename}s_tokenized.csv",
+                f"{cachedir}SnapshotTimes{shardname}.csv",
+                f"{cachedir}{basename}s_tokenized{shardname}.events",
                 f"{cachedir}{basename}s_tokennames.csv",
                 ]
             script = "./GenerateWindowedStatistics.jl"
             targets = [
                 f"{cachedir}{basename}Statistics_" +
-                f"{xstart}hours_to_{xstop}hours{reportsuffix}.csv",
+                f"{xstart}hours_to_{xstop}hours{shardname}" +
+                f"{statistics_ext(basename)}"
+                for xstart,xstop in xtimes + ytimes
                 ]
+            windows = [f"--window {xstart} {xstop} {target}"
+                for (xstart,xstop),target in zip(xtimes + ytimes, targets)]
             dependencies = [script, *input_files]
             start_rule(f, targets, dependencies)
             f.write(f"\t{script}" +
                 (" --medstats " if medstats else " ") +
-                f"{xstart} {xstop} {' '.join(input_files)} " +
-                f"{' '.join(targets)}\n")
+                f"{' '.join(windows)} {' '.join(input_files)}\n")
             f.write("\n")
 
+    # concatenate the statistics of the shards (in MRN order)
+    if shards > 1:
+        for basename,*_ in imported_measure_tables:
+            for xstart,xstop in xtimes + ytimes:
+                stem = (f"{cachedir}{basename}Statistics_" +
+                    f"{xstart}hours_to_{xstop}hours")
+                ext = statistics_ext(basename)
+                input_files = [f"{stem}{shardname}{ext}"
+                    for shardname in shardnames]
+                script = "./ShardByMRN.jl"
+                targets = [f"{stem}{ext}"]
+                dependencies = [script, *input_files]
+                start_rule(f, targets, dependencies)
+                f.write(f"\t{script} merge {' '.join(targets)} " +
+                    f"{' '.join(input_files)}\n")
+                f.write("\n")
+
+    # index where each patient's events start, so that reports only need to
+    # read the events of the patients being reported on
+    for basename,*_ in imported_measure_tables:
+        input_files = [f"{cachedir}{basename}s_tokenized.events"]
+        script = "./IndexEvents.jl"
+        targets = [f"{cachedir}{basename}s_tokenized_index.csv"]
+        dependencies = [script, *input_files]
+        start_rule(f, targets, dependencies)
+        f.write(f"\t{script} {' '.join(input_files)} {' '.join(targets)}\n")
+        f.write("\n")
+
+    # generate statistics files for a specific date for reporting
+    for basename,dtscol,measurecol,valuecol,medstats in imported_measure_tables:
+        eventindex = f"{cachedir}{basename}s_tokenized_index.csv"
+        input_files = [
+            f"{cachedir}SnapshotTimes{reportsuffix}.csv",
+            f"{cachedir}{basename}s_tokenized.events",
+            f"{cachedir}{basename}s_tokennames.csv",
+            ]
+        script = "./GenerateWindowedStatistics.jl"
+        targets = [
+            f"{cachedir}{basename}Statistics_" +
+            f"{xstart}hours_to_{xstop}hours{reportsuffix}{statistics_ext(basename)}"
+            for xstart,xstop in xtimes + ytimes
+            ]
+        windows = [f"--window {xstart} {xstop} {target}"
+            for (xstart,xstop),target in zip(xtimes + ytimes, targets)]
+        # save the state of the windows, so that the next report (with
+        # PREVIOUSREPORTDTS set to this one) only has to add new events to
+        # them; it is still given the whole history of events, so it reads
+        # (but skips) the earlier events of the patients in the census
+        statefile = f"{cachedir}{basename}Statistics_state{reportsuffix}.jls"
+        previousstatefile = (f"{cachedir}{basename}Statistics_" +
+            f"state$(PREVIOUSREPORTSUFFIX).jls")
+        dependencies = [script, *input_files, eventindex,
+            f"$(if $(PREVIOUSREPORTDTS),{previousstatefile})"]
+        start_rule(f, [*targets, statefile], dependencies)
+        f.write(f"\t{script}" +
+            (" --medstats " if medstats else " ") +
+            f"--eventindex {eventindex} " +
+            f"$(if $(PREVIOUSREPORTDTS),--loadstate {previousstatefile}) " +
+            f"--savestate {statefile} " +
+            f"{' '.join(windows)} {' '.join(input_files)}\n")
+        f.write("\n")
+
+        # check that resuming from the previous report's state gives the
+        # same statistics as calculating them from scratch
+        scratchtargets = [
+            f"{cachedir}{basename}Statistics_" +
+            f"{xstart}hours_to_{xstop}hours{reportsuffix}_fromscratch" +
+            f"{statistics_ext(basename)}"
+            for xstart,xstop in xtimes + ytimes
+            ]
+        windows = [f"--window {xstart} {xstop} {target}"
+            for (xstart,xstop),target in zip(xtimes + ytimes, scratchtargets)]
+        dependencies = [script, *input_files, eventindex]
+        start_rule(f, scratchtargets, dependencies)
+        f.write(f"\t{script}" +
+            (" --medstats " if medstats else " ") +
+            f"--eventindex {eventindex} " +
+            f"{' '.join(windows)} {' '.join(input_files)}\n")
+        f.write("\n")
+
+        script = "./CompareFeatureFiles.jl"
+        for target, scratchtarget in zip(targets, scratchtargets):
+            checktarget = f"check_{os.path.basename(target)}"
+            dependencies = [script, target, scratchtarget]
+            f.write(f".PHONY : {checktarget}\n")
+            f.write(f"{checktarget} : {' '.join(dependencies)}\n")
+            f.write(f"\t{script} {target} {scratchtarget}\n")
+            f.write("\n")
+            report_state_checks.append(checktarget)
+
     # generate X files for training
     for xstart,xstop in xtimes:
         xprefix = f"{cachedir}X{xstart}_{xstop}_"
         input_files = [
-                f"{cachedir}LabStatistics_{xstart}hours_to_{xstop}hours.csv",
-                f"{cachedir}VitalStatistics_{xstart}hours_to_{xstop}hours.csv",
-                f"{cachedir}CamScoreStatistics_{xstart}hours_to_{xstop}hours.csv",
-                f"{cachedir}MedicationStatistics_{xstart}hours_to_{xstop}hours.csv",
+                *[f"{cachedir}{basename}Statistics_{xstart}hours_to_" +
+                    f"{xstop}hours{statistics_ext(basename)}"
+                    for basename,*_ in imported_measure_tables],
                 f"{cachedir}Demographics.csv",
                 ]
         script = "./HCatFeatures.jl"
@@ -213,10 +403,9 @@ with open("Makefile", "w") as f:
     for xstart,xstop in xtimes:
         xprefix = f"{cachedir}X{xstart}_{xstop}_"
         input_files = [
-                f"{cachedir}LabStatistics_{xstart}hours_to_{xstop}hours{reportsuffix}.csv",
-                f"{cachedir}VitalStatistics_{xstart}hours_to_{xstop}hours{reportsuffix}.csv",
-                f"{cachedir}CamScoreStatistics_{xstart}hours_to_{xstop}hours{reportsuffix}.csv",
-                f"{cachedir}MedicationStatistics_{xstart}hours_to_{xstop}hours{reportsuffix}.csv",
+                *[f"{cachedir}{basename}Statistics_{xstart}hours_to_" +
+                    f"{xstop}hours{reportsuffix}{statistics_ext(basename)}"
+                    for basename,*_ in imported_measure_tables],
                 f"{cachedir}Demographics{reportsuffix}.csv",
                 ]
         script = "./HCatFeatures.jl"
@@ -237,18 +426,21 @@ with open("Makefile", "w") as f:
         f.write(f"\t{script} {' '.join(input_files)} {xprefix}X_fold\n")
         f.write("\n")
 
-    # generate y files
+    # generate y files (for both the holdout and non-holdout sets)
     for ystart,ystop in ytimes:
         yprefix = f"{cachedir}y{ystart}_{ystop}_"
         input_files = [
                 f"{cachedir}CamScoreStatistics_{ystart}hours_to_{ystop}hours.csv",
                 f"{cachedir}holdout_and_cvgroups.parquet.snappy"
                 ]
+        holdoutyprefix = f"{cachedir}y{ystart}_{ystop}_holdout_"
         script = "./GenerateYs.py"
-        targets = [f"{yprefix}y_fold{i}.csv" for i in range(nfolds)]
+        targets = ([f"{yprefix}y_fold{i}.csv" for i in range(nfolds)] +
+                [f"{holdoutyprefix}y_fold{i}.csv" for i in range(nfolds)])
         dependencies = [script, *input_files]
         start_rule(f, targets, dependencies)
-        f.write(f"\t{script} {' '.join(input_files)} {yprefix}\n")
+        f.write(f"\t{script} --holdoutprefix {holdoutyprefix} " +
+                f"{' '.join(input_files)} {yprefix}\n")
         f.write("\n")
 
     # generate X folds for holdout set
@@ -262,20 +454,6 @@ with open("Makefile", "w") as f:
         f.write(f"\t{script} --useholdout {' '.join(input_files)} {xprefix}holdout_X_fold\n")
         f.write("\n")
 
-    # generate y files for holdout set
-    for ystart,ystop in ytimes:
-        yprefix = f"{cachedir}y{ystart}_{ystop}_holdout_"
-        input_files = [
-                f"{cachedir}CamScoreStatistics_{ystart}hours_to_{ystop}hours.csv",
-                f"{cachedir}holdout_and_cvgroups.parquet.snappy"
-                ]
-        script = "./GenerateYs.py"
-        targets = [f"{yprefix}y_fold{i}.csv" for i in range(nfolds)]
-        dependencies = [script, *input_files]
-        start_rule(f, targets, dependencies)
-        f.write(f"\t{script} --useholdout {' '.join(input_files)} {yprefix}\n")
-        f.write("\n")
-
     # generate merged folds
     for holdout in ['', '_holdout']:
         # generate a single X file with all of the folds
@@ -300,6 +478,20 @@ with open("Makefile", "w") as f:
             f.write(f"\t{script} {' '.join(input_files)} -o {target}\n")
             f.write("\n")
 
+    # generate Table 1 (the demographics of each cohort)
+    input_files = [
+            f"{importeddatadir}Patients.csv",
+            f"{cachedir}holdout_and_cvgroups.csv",
+            f"{importeddatadir}CamScores.csv",
+            ]
+    script = "./GenerateTable1.py"
+    target = f"{outputsdir}Table1.tsv"
+    dependencies = [script, *input_files]
+    f.write(f"{target} : {' '.join(dependencies)}\n")
+    f.write(f"\t{script} {' '.join(input_files)} -o {target}\n")
+    f.write("\n")
+    text_results.append(target)
+
     # generate counts of patients and days used for the dataset
     for ystart,ystop in ytimes:
         yprefix = f"{cachedir}y{ystart}_{ystop}"
@@ -316,39 +508,40 @@ with open("Makefile", "w") as f:
     for xstart,xstop in xtimes:
         xprefix = f"{cachedir}X{xstart}_{xstop}_"
 
+        # sketch the statistics of each fold once, so that each cleaning
+        # model can be fit by merging the sketches of its folds
+        for j in range(nfolds):
+            input_files = [f"{xprefix}X_fold{j}.csv"]
+            script = "./CleanInputs.jl"
+            target = f"{xprefix}clean_sketch_fold{j}.jls"
+            dependencies = [script, *input_files]
+            f.write(f"{target} : {' '.join(dependencies)}\n")
+            f.write(f"\t{script} {' '.join(input_files)} --savesketch {target}\n")
+            f.write("\n")
+
         for i in range(nfolds):
             modelfile = f"{xprefix}clean_fold{i}.csv"
 
             # fit the models
-            other_xs = [f"{xprefix}X_fold{j}.csv" for j in range(nfolds)
-                    if j != i]
-            input_files = other_xs
+            other_sketches = [f"{xprefix}clean_sketch_fold{j}.jls"
+                    for j in range(nfolds) if j != i]
+            input_files = other_sketches
             script = "./CleanInputs.jl"
             target = modelfile
             dependencies = [script, *input_files]
             f.write(f"{target} : {' '.join(dependencies)}\n")
-            f.write(f"\t{script} {' '.join(input_files)} --model {target}\n")
+            f.write(f"\t{script} --mergesketches {' '.join(input_files)} --model {target}\n")
             f.write("\n")
 
-            # generate predictions
-            for j in range(nfolds):
-                script = "./CleanInputs.jl"
-                target = f"{xprefix}Xhat{i}_fold{j}.csv"
-                input_files = [modelfile, f"{xprefix}X_fold{j}.csv"]
-                dependencies = [script, *input_files]
-                f.write(f"{target} : {' '.join(dependencies)}\n")
-                f.write(f"\t{script} --model {' '.join(input_files)} --output {target}\n")
-                f.write("\n")
-
-            # generate predictions for the holdout dataset
-            for j in range(nfolds):
-                script = "./CleanInputs.jl"
-                target = f"{xprefix}Xhat{i}_fold{j}_holdout.csv"
-                input_files = [modelfile, f"{xprefix}holdout_X_fold{j}.csv"]
-                dependencies = [script, *input_files]
-                f.write(f"{target} : {' '.join(dependencies)}\n")
-                f.write(f"\t{script} --model {' '.join(input_files)} --output {target}\n")
-                f.write("\n")
+            # the names of the features the model keeps (without having to
+            # generate a cleaned copy of a fold)
+            script = "./csv2featurenames.py"
+            target = f"{xprefix}Xhat{i}_names.json"
+            input_files = [f"{xprefix}X_fold0.csv"]
+            dependencies = [script, *input_files, modelfile]
+            f.write(f"{target} : {' '.join(dependencies)}\n")
+            f.write(f"\t{script} --cleaningmodel {modelfile} {' '.join(input_files)} {target}\n")
+            f.write("\n")
 
         # generate a single cleaning model using all of the folds of training data
         if True:
@@ -356,12 +549,13 @@ with open("Makefile", "w") as f:
             xs = [f"{xprefix}X_fold{j}.csv" for j in range(nfolds)]
 
             # fit the models
-            input_files = xs
+            input_files = [f"{xprefix}clean_sketch_fold{j}.jls"
+                    for j in range(nfolds)]
             script = "./CleanInputs.jl"
             target = modelfile
             dependencies = [script, *input_files]
             f.write(f"{target} : {' '.join(dependencies)}\n")
-            f.write(f"\t{script} {' '.join(input_files)} --model {target}\n")
+            f.write(f"\t{script} --mergesketches {' '.join(input_files)} --model {target}\n")
             f.write("\n")
 
             # generate predictions
@@ -394,31 +588,16 @@ with open("Makefile", "w") as f:
             f.write(f"\t{script} --model {' '.join(input_files)} --output {target}\n")
             f.write("\n")
 
-    # Generate X and Y files for not delirious and no prior delirium cases
+    # Generate row masks and Y files for not delirious and no prior delirium
+    # cases (the models subset the X files with the masks as they load them)
     for holdout in ['','_holdout']:
         for xstart,xstop in xtimes:
             xprefix = f"{cachedir}X{xstart}_{xstop}"
 
             for i in range(nfolds):
-                # Generate the rowmasks for no prior delirium case
-                script = "./GenerateRowMask.jl"
-                target = f"{xprefix}_nopriordelirium_rowmask_fold{i}{holdout}.csv"
-                input_files = [f"{xprefix}{holdout}_X_fold{i}.csv"]
-                dependencies = [script, *input_files]
-                f.write(f"{target} : {' '.join(dependencies)}\n")
-                f.write(f"\t{script} {' '.join(input_files)} --column " +
-                    f"CAM_alltimemax --removeifgreaterthan 0.0 {target}\n")
-                f.write("\n")
-
-                # Generate the rowmasks for not delirious case
-                script = "./GenerateRowMask.jl"
-                target = f"{xprefix}_notdelirious_rowmask_fold{i}{holdout}.csv"
-                input_files = [f"{xprefix}{holdout}_X_fold{i}.csv"]
-                dependencies = [script, *input_files]
-                f.write(f"{target} : {' '.join(dependencies)}\n")
-                f.write(f"\t{script} {' '.join(input_files)} --column " +
-                    f"CAM_max --removeifgreaterthan 0.0 {target}\n")
-                f.write("\n")
+                write_rowmasks_rule(f, f"{xprefix}{holdout}_X_fold{i}.csv",
+                    {c: f"{xprefix}_{c}rowmask_fold{i}{holdout}.csv"
+                        for c in conditionfeatures})
 
                 for c in conditions:
                     rowmask = f"{xprefix}_{c}rowmask_fold{i}{holdout}.csv"
@@ -439,39 +618,11 @@ with open("Makefile", "w") as f:
                         f.write(f"\t{script} {' '.join(input_files)} {target}\n")
                         f.write("\n")
 
-                    if c != '':
-                        # filter the X files for each of the conditions
-                        for j in range(nfolds):
-                            script = "./ApplyRowMask.jl"
-                            target = f"{xprefix}_{c}Xhat{j}_fold{i}{holdout}.csv"
-                            input_files = [f"{xprefix}_Xhat{j}_fold{i}{holdout}.csv",
-                                    rowmask]
-                            dependencies = [script, *input_files]
-                            f.write(f"{target} : {' '.join(dependencies)}\n")
-                            f.write(f"\t{script} {' '.join(input_files)} {target}\n")
-                            f.write("\n")
-
             # for the combined datasets
             if True:
-                # Generate the rowmasks for no prior delirium case
-                script = "./GenerateRowMask.jl"
-                target = f"{xprefix}_nopriordelirium_rowmask{holdout}.csv"
-                input_files = [f"{xprefix}{holdout}_X_allfolds.csv"]
-                dependencies = [script, *input_files]
-                f.write(f"{target} : {' '.join(dependencies)}\n")
-                f.write(f"\t{script} {' '.join(input_files)} --column " +
-                    f"CAM_alltimemax --removeifgreaterthan 0.0 {target}\n")
-                f.write("\n")
-
-                # Generate the rowmasks for not delirious case
-                script = "./GenerateRowMask.jl"
-                target = f"{xprefix}_notdelirious_rowmask{holdout}.csv"
-                input_files = [f"{xprefix}{holdout}_X_allfolds.csv"]
-                dependencies = [script, *input_files]
-                f.write(f"{target} : {' '.join(dependencies)}\n")
-                f.write(f"\t{script} {' '.join(input_files)} --column " +
-                    f"CAM_max --removeifgreaterthan 0.0 {target}\n")
-                f.write("\n")
+                write_rowmasks_rule(f, f"{xprefix}{holdout}_X_allfolds.csv",
+                    {c: f"{xprefix}_{c}rowmask{holdout}.csv"
+                        for c in conditionfeatures})
 
                 for c in conditions:
                     rowmask = f"{xprefix}_{c}rowmask{holdout}.csv"
@@ -492,46 +643,21 @@ with open("Makefile", "w") as f:
                         f.write(f"\t{script} {' '.join(input_files)} {target}\n")
                         f.write("\n")
 
-                    if c != '':
-                        # filter the whole training and holdout set too for each of the conditions
-                        script = "./ApplyRowMask.jl"
-                        target = f"{xprefix}_{c}Xhat{holdout}.csv"
-                        input_files = [f"{xprefix}_Xhat{holdout}.csv",
-                                rowmask]
-                        dependencies = [script, *input_files]
-                        f.write(f"{target} : {' '.join(dependencies)}\n")
-                        f.write(f"\t{script} {' '.join(input_files)} {target}\n")
-                        f.write("\n")
-
 
     for xstart,xstop in xtimes:
         xprefix = f"{cachedir}X{xstart}_{xstop}_"
 
-        # Generate the rowmasks for no prior delirium case for reports
-        script = "./GenerateRowMask.jl"
-        target = f"{xprefix}nopriordelirium_rowmask{reportsuffix}.csv"
-        input_files = [f"{xprefix}X{reportsuffix}.csv"]
-        dependencies = [script, *input_files]
-        f.write(f"{target} : {' '.join(dependencies)}\n")
-        f.write(f"\t{script} {' '.join(input_files)} --column " +
-            f"CAM_alltimemax --removeifgreaterthan 0.0 {target}\n")
-        f.write("\n")
-
-        # Generate the rowmasks for not delirious case for reports
-        script = "./GenerateRowMask.jl"
-        target = f"{xprefix}notdelirious_rowmask{reportsuffix}.csv"
-        input_files = [f"{xprefix}X{reportsuffix}.csv"]
-        dependencies = [script, *input_files]
-        f.write(f"{target} : {' '.join(dependencies)}\n")
-        f.write(f"\t{script} {' '.join(input_files)} --column " +
-            f"CAM_max --removeifgreaterthan 0.0 {target}\n")
-        f.write("\n")
+        # Generate the rowmasks for reports
+        write_rowmasks_rule(f, f"{xprefix}X{reportsuffix}.csv",
+            {c: f"{xprefix}{c}rowmask{reportsuffix}.csv"
+                for c in conditionfeatures})
 
         for c in conditions:
             if c != '':
                 rowmask = f"{xprefix}{c}rowmask{reportsuffix}.csv"
 
-                # filter the report X files for each of the conditions
+                # filter the report X files for each of the conditions (these
+                # are small, and the occlusion reports need the rows in a file)
                 for j in range(nfolds):
                     script = "./ApplyRowMask.jl"
                     target = f"{xprefix}{c}Xhat{j}{reportsuffix}.csv"
@@ -545,43 +671,51 @@ with open("Makefile", "w") as f:
     for xstart,xstop in xtimes:
         for ystart,ystop in ytimes:
             for c in conditions:
-                xprefix = f"{cachedir}X{xstart}_{xstop}_{c}"
+                xbase = f"{cachedir}X{xstart}_{xstop}_"
+                xprefix = f"{xbase}{c}"
                 yprefix = f"{cachedir}X{xstart}_{xstop}_y{ystart}_{ystop}_{c}"
 
-                for modelname, modelprefix, modelscript, hasimportance in zip(
-                        modelnames, modelprefixes,modelscripts, modelhasimportance):
+                for (modelname, modelprefix, modelscript, hasimportance,
+                        hascontributions) in zip(modelnames, modelprefixes,
+                        modelscripts, modelhasimportance, modelhascontributions):
                     resultnameprefix = (f"X{xstart}_{xstop}_y{ystart}_" +
                         f"{ystop}_{c}{modelprefix}")
                     intermediatefileprefix = f"{cachedir}{resultnameprefix}"
                     outputfileprefix = f"{outputsdir}{resultnameprefix}"
 
+                    # the rows of the entire training (and holdout) data
+                    # that meet the condition
+                    rowmasks = [f"{xbase}{c}rowmask.csv"] if c != '' else []
+                    holdout_rowmasks = ([f"{xbase}{c}rowmask_holdout.csv"]
+                            if c != '' else [])
+
                     # fit the models on the entire training data
-                    input_files = [f"{xprefix}Xhat.csv", f"{yprefix}y.csv"]
+                    input_files = [f"{xbase}Xhat.csv", f"{yprefix}y.csv"]
                     script = modelscript
                     target = f"{intermediatefileprefix}.pickle"
-                    dependencies = [script, *input_files]
+                    dependencies = [script, *input_files, *rowmasks]
                     f.write(f"{target} : {' '.join(dependencies)}\n")
-                    f.write(f"\tCUDA_VISIBLE_DEVICES=1 {script} train {' '.join(input_files)} {target}\n")
+                    f.write(f"\tCUDA_VISIBLE_DEVICES=1 {script} train {' '.join(input_files)} {target}{rowmask_option(rowmasks)}\n")
                     f.write("\n")
 
                     # generate predictions from all of the training data
                     script = modelscript
                     target = f"{intermediatefileprefix}_yhat.csv"
                     input_files = [f"{intermediatefileprefix}.pickle",
-                            f"{xprefix}Xhat.csv"]
-                    dependencies = [script, *input_files]
+                            f"{xbase}Xhat.csv"]
+                    dependencies = [script, *input_files, *rowmasks]
                     f.write(f"{target} : {' '.join(dependencies)}\n")
-                    f.write(f"\tCUDA_VISIBLE_DEVICES=1 {script} apply {' '.join(input_files)} {target}\n")
+                    f.write(f"\tCUDA_VISIBLE_DEVICES=1 {script} apply {' '.join(input_files)} {target}{rowmask_option(rowmasks)}\n")
                     f.write("\n")
 
                     # generate predictions from all of the holdout data
                     script = modelscript
                     target = f"{intermediatefileprefix}_yhat_holdout.csv"
                     input_files = [f"{intermediatefileprefix}.pickle",
-                            f"{xprefix}Xhat_holdout.csv"]
-                    dependencies = [script, *input_files]
+                            f"{xbase}Xhat_holdout.csv"]
+                    dependencies = [script, *input_files, *holdout_rowmasks]
                     f.write(f"{target} : {' '.join(dependencies)}\n")
-                    f.write(f"\tCUDA_VISIBLE_DEVICES=1 {script} apply {' '.join(input_files)} {target}\n")
+                    f.write(f"\tCUDA_VISIBLE_DEVICES=1 {script} apply {' '.join(input_files)} {target}{rowmask_option(holdout_rowmasks)}\n")
                     f.write("\n")
 
                     # generate importances
@@ -589,7 +723,7 @@ with open("Makefile", "w") as f:
                         script = modelscript
                         target = f"{intermediatefileprefix}_importances.csv"
                         input_files = [f"{intermediatefileprefix}.pickle",
-                                f"{xprefix}Xhat_names.json"]
+                                f"{xbase}Xhat_names.json"]
                         dependencies = [script, *input_files]
                         f.write(f"{target} : {' '.join(dependencies)}\n")
                         f.write(f"\t{script} applynames {' '.join(input_files)} " +
@@ -600,37 +734,46 @@ with open("Makefile", "w") as f:
                     # for every fold
                     for i in range(nfolds):
 
+                        (fold_xs, holdout_x, cleaning,
+                            cleaning_dependencies) = cv_inputs(xbase, i)
+                        fold_rowmasks, fold_holdout_rowmasks = cv_rowmasks(xbase, c, i)
+
                         # fit the models on the CV folds
-                        other_xs = [f"{xprefix}Xhat{i}_fold{j}.csv" for j in range(nfolds)
+                        other_xs = [fold_xs[j] for j in range(nfolds)
                                 if j != i]
                         other_ys = [f"{yprefix}y_fold{j}.csv" for j in range(nfolds)
                                 if j != i]
+                        other_rowmasks = [m for j in range(nfolds) if j != i
+                                for m in fold_rowmasks[j]]
                         input_files = [a for b in zip(other_xs, other_ys) for a in b]
                         script = modelscript
                         target = f"{intermediatefileprefix}_fold{i}.pickle"
-                        dependencies = [script, *input_files]
+                        dependencies = [script, *input_files, *cleaning_dependencies,
+                                *other_rowmasks]
                         f.write(f"{target} : {' '.join(dependencies)}\n")
-                        f.write(f"\tCUDA_VISIBLE_DEVICES={i} {script} train {' '.join(input_files)} {target}\n")
+                        f.write(f"\tCUDA_VISIBLE_DEVICES={i} {script} train {cleaning}{' '.join(input_files)} {target}{rowmask_option(other_rowmasks)}\n")
                         f.write("\n")
 
                         # generate predictions from training data
                         script = modelscript
                         target = f"{intermediatefileprefix}_yhat_fold{i}.csv"
                         input_files = [f"{intermediatefileprefix}_fold{i}.pickle",
-                                f"{xprefix}Xhat{i}_fold{i}.csv"]
-                        dependencies = [script, *input_files]
+                                fold_xs[i]]
+                        dependencies = [script, *input_files, *cleaning_dependencies,
+                                *fold_rowmasks[i]]
                         f.write(f"{target} : {' '.join(dependencies)}\n")
-                        f.write(f"\tCUDA_VISIBLE_DEVICES={i} {script} apply {' '.join(input_files)} {target}\n")
+                        f.write(f"\tCUDA_VISIBLE_DEVICES={i} {script} apply {cleaning}{' '.join(input_files)} {target}{rowmask_option(fold_rowmasks[i])}\n")
                         f.write("\n")
 
                         # generate predictions from holdout data
                         script = modelscript
                         target = f"{intermediatefileprefix}_yhat_fold{i}_holdout.csv"
                         input_files = [f"{intermediatefileprefix}_fold{i}.pickle",
-                                f"{xprefix}Xhat{i}_fold{i}_holdout.csv"]
-                        dependencies = [script, *input_files]
+                                holdout_x]
+                        dependencies = [script, *input_files, *cleaning_dependencies,
+                                *fold_holdout_rowmasks]
                         f.write(f"{target} : {' '.join(dependencies)}\n")
-                        f.write(f"\tCUDA_VISIBLE_DEVICES={i} {script} apply {' '.join(input_files)} {target}\n")
+                        f.write(f"\tCUDA_VISIBLE_DEVICES={i} {script} apply {cleaning}{' '.join(input_files)} {target}{rowmask_option(fold_holdout_rowmasks)}\n")
                         f.write("\n")
 
                         # generate importances
@@ -638,7 +781,7 @@ with open("Makefile", "w") as f:
                             script = modelscript
                             target = f"{intermediatefileprefix}_importances_fold{i}.csv"
                             input_files = [f"{intermediatefileprefix}_fold{i}.pickle",
-                                    f"{xprefix}Xhat{i}_names.json"]
+                                    f"{xbase}Xhat{i}_names.json"]
                             dependencies = [script, *input_files]
                             f.write(f"{target} : {' '.join(dependencies)}\n")
                             f.write(f"\t{script} applynames {' '.join(input_files)} " +
@@ -664,58 +807,82 @@ with open("Makefile", "w") as f:
                         f.write(f"\ttail -n +2 {' '.join(input_files)} | sort -r -k 3 -t, >> {target}\n")
                         f.write("\n")
 
-                        for j in range(numpatientreports):
-                            # generate a single-row X input file for each of the top-n patients
-                            target = f"{intermediatefileprefix}_Xhat{i}{reportsuffix}_risk{j}_oneline.csv"
-                            xfile = f"{xprefix}Xhat{i}{reportsuffix}.csv"
-                            yfile = f"{intermediatefileprefix}_yhat{i}{reportsuffix}_sorted.csv"
-                            input_files = [xfile, yfile]
-                            dependencies = [*input_files]
-                            f.write(f"{target} : {' '.join(dependencies)}\n")
-                            f.write(f"\thead -1 {xfile} > {target}\n"); #colnames
-                            f.write(f"\tgrep -h ^`cat {yfile} | cut -d, -f 1-2 | cut -d' ' -f1" +
-                                f"| head -{j+1} | tail -1` {xfile} >> {target}\n")
-                            f.write("\n")
-
-                            # occlude each of the columns in each single-row input file
-                            script = "./OccludeColumns.jl"
-                            target = f"{intermediatefileprefix}_Xhat{i}{reportsuffix}_risk{j}_occluded.csv"
-                            xfile = f"{intermediatefileprefix}_Xhat{i}{reportsuffix}_risk{j}_oneline.csv"
-                            input_files = [xfile]
-                            dependencies = [script, *input_files]
-                            f.write(f"{target} : {' '.join(dependencies)}\n")
-                            f.write(f"\t{script} {' '.join(input_files)} {target}\n")
-                            f.write("\n")
-
-                            # generate predictions with the occluded features
+                        if hascontributions:
+                            # explain the highest risk predictions by the
+                            # contribution of each feature
                             script = modelscript
-                            target = f"{intermediatefileprefix}_yhat{i}{reportsuffix}_risk{j}_occluded.csv"
-                            xfile = f"{intermediatefileprefix}_Xhat{i}{reportsuffix}_risk{j}_occluded.csv"
-                            input_files = [f"{intermediatefileprefix}_fold{i}.pickle", xfile]
+                            target = f"{intermediatefileprefix}_contributions{i}{reportsuffix}.csv"
+                            input_files = [f"{intermediatefileprefix}_fold{i}.pickle",
+                                    f"{xprefix}Xhat{i}{reportsuffix}.csv"]
                             dependencies = [script, *input_files]
                             f.write(f"{target} : {' '.join(dependencies)}\n")
-                            f.write(f"\tCUDA_VISIBLE_DEVICES={i} {script} apply {' '.join(input_files)} {target}\n")
+                            f.write(f"\tCUDA_VISIBLE_DEVICES={i} {script} explain --top {numpatientreports} " +
+                                f"{' '.join(input_files)} {target}\n")
                             f.write("\n")
 
-                            # generate individual reports from the predictions from occlusions
-                            script = "./GenerateOcclusionReport.jl"
-                            target = f"{intermediatefileprefix}_report{i}{reportsuffix}_risk{j}.mkd"
-                            yfile = f"{intermediatefileprefix}_yhat{i}{reportsuffix}_risk{j}_occluded.csv"
-                            xfile = f"{intermediatefileprefix}_Xhat{i}{reportsuffix}_risk{j}_occluded.csv"
-                            input_files = [xfile, yfile, "IntervenableFeatures.csv"]
+                            # generate the reports from the contributions
+                            script = "./GenerateContributionReport.py"
+                            target = f"{outputfileprefix}_report{i}{reportsuffix}_risk.mkd"
+                            input_files = [f"{xprefix}Xhat{i}{reportsuffix}.csv",
+                                    f"{intermediatefileprefix}_contributions{i}{reportsuffix}.csv",
+                                    "IntervenableFeatures.csv"]
                             dependencies = [script, *input_files]
                             f.write(f"{target} : {' '.join(dependencies)}\n")
                             f.write(f"\t{script} {' '.join(input_files)} {target}\n")
                             f.write("\n")
-
-                        # generate a summary reports from the individual occlusion reports
-                        target = f"{outputfileprefix}_report{i}{reportsuffix}_risk.mkd"
-                        input_files = [f"{intermediatefileprefix}_report{i}{reportsuffix}_risk{j}.mkd"
-                                for j in range(numpatientreports)]
-                        dependencies = [*input_files]
-                        f.write(f"{target} : {' '.join(dependencies)}\n")
-                        f.write(f"\tcat {' '.join(input_files)} > {target}\n")
-                        f.write("\n")
+                        else:
+                            for j in range(numpatientreports):
+                                # generate a single-row X input file for each of the top-n patients
+                                target = f"{intermediatefileprefix}_Xhat{i}{reportsuffix}_risk{j}_oneline.csv"
+                                xfile = f"{xprefix}Xhat{i}{reportsuffix}.csv"
+                                yfile = f"{intermediatefileprefix}_yhat{i}{reportsuffix}_sorted.csv"
+                                input_files = [xfile, yfile]
+                                dependencies = [*input_files]
+                                f.write(f"{target} : {' '.join(dependencies)}\n")
+                                f.write(f"\thead -1 {xfile} > {target}\n"); #colnames
+                                f.write(f"\tgrep -h ^`cat {yfile} | cut -d, -f 1-2 | cut -d' ' -f1" +
+                                    f"| head -{j+1} | tail -1` {xfile} >> {target}\n")
+                                f.write("\n")
+
+                                # occlude each of the columns in each single-row input file
+                                script = "./OccludeColumns.jl"
+                                target = f"{intermediatefileprefix}_Xhat{i}{reportsuffix}_risk{j}_occluded.csv"
+                                xfile = f"{intermediatefileprefix}_Xhat{i}{reportsuffix}_risk{j}_oneline.csv"
+                                input_files = [xfile]
+                                dependencies = [script, *input_files]
+                                f.write(f"{target} : {' '.join(dependencies)}\n")
+                                f.write(f"\t{script} {' '.join(input_files)} {target}\n")
+                                f.write("\n")
+
+                                # generate predictions with the occluded features
+                                script = modelscript
+                                target = f"{intermediatefileprefix}_yhat{i}{reportsuffix}_risk{j}_occluded.csv"
+                                xfile = f"{intermediatefileprefix}_Xhat{i}{reportsuffix}_risk{j}_occluded.csv"
+                                input_files = [f"{intermediatefileprefix}_fold{i}.pickle", xfile]
+                                dependencies = [script, *input_files]
+                                f.write(f"{target} : {' '.join(dependencies)}\n")
+                                f.write(f"\tCUDA_VISIBLE_DEVICES={i} {script} apply {' '.join(input_files)} {target}\n")
+                                f.write("\n")
+
+                                # generate individual reports from the predictions from occlusions
+                                script = "./GenerateOcclusionReport.jl"
+                                target = f"{intermediatefileprefix}_report{i}{reportsuffix}_risk{j}.mkd"
+                                yfile = f"{intermediatefileprefix}_yhat{i}{reportsuffix}_risk{j}_occluded.csv"
+                                xfile = f"{intermediatefileprefix}_Xhat{i}{reportsuffix}_risk{j}_occluded.csv"
+                                input_files = [xfile, yfile, "IntervenableFeatures.csv"]
+                                dependencies = [script, *input_files]
+                                f.write(f"{target} : {' '.join(dependencies)}\n")
+                                f.write(f"\t{script} {' '.join(input_files)} {target}\n")
+                                f.write("\n")
+
+                            # generate a summary reports from the individual occlusion reports
+                            target = f"{outputfileprefix}_report{i}{reportsuffix}_risk.mkd"
+                            input_files = [f"{intermediatefileprefix}_report{i}{reportsuffix}_risk{j}.mkd"
+                                    for j in range(numpatientreports)]
+                            dependencies = [*input_files]
+                            f.write(f"{target} : {' '.join(dependencies)}\n")
+                            f.write(f"\tcat {' '.join(input_files)} > {target}\n")
+                            f.write("\n")
 
                     # create a dummy target for risk scores
                     target = "risk"
@@ -732,6 +899,7 @@ with open("Makefile", "w") as f:
                                 for j in range(nfolds)]
                         y_bundle = f"{intermediatefileprefix}_y_folds{holdout}.pickle"
                         y_hat_bundle = f"{intermediatefileprefix}_yhat_folds{holdout}.pickle"
+                        metrics_bundle = f"{intermediatefileprefix}_metrics_folds{holdout}.pickle"
 
                         # Bundle folds for ys
                         input_files = ys
@@ -751,45 +919,52 @@ with open("Makefile", "w") as f:
                         f.write(f"\t{script} {' '.join(input_files)} {target}\n")
                         f.write("\n")
 
-                        # ROC plots with cross-validation
+                        # compute the curves once for all of the plots
                         input_files = [y_bundle, y_hat_bundle]
+                        script = "./ComputeMetrics.py"
+                        target = metrics_bundle
+                        dependencies = [script, *input_files, "ROCPlot.py",
+                                "PRPlot.py", "CalibrationPlot.py"]
+                        f.write(f"{target} : {' '.join(dependencies)}\n")
+                        f.write(f"\t{script} {' '.join(input_files)} {target}\n")
+                        f.write("\n")
+
+                        # ROC plots with cross-validation
                         script = "./ROCPlot.py"
                         target = f"{outputfileprefix}_roc{holdout}.png"
-                        dependencies = [script, *input_files]
+                        dependencies = [script, metrics_bundle]
                         f.write(f"{target} : {' '.join(dependencies)}\n")
                         f.write(f"\t{script} --dpi={dpi} " +
                                 '--title "" ' +
                                 #f"--title \"{modelname} ROC " +
                                 #f"({xstart},{xstop})->({ystart},{ystop}))\" " +
-                                f"{' '.join(input_files)} {target}\n")
+                                f"--metrics {metrics_bundle} {target}\n")
                         f.write("\n")
                         plots.append(target)
 
                         # PR plots with cross-validation
-                        input_files = [y_bundle, y_hat_bundle]
                         script = "./PRPlot.py"
                         target = f"{outputfileprefix}_pr{holdout}.png"
-                        dependencies = [script, *input_files]
+                        dependencies = [script, metrics_bundle]
                         f.write(f"{target} : {' '.join(dependencies)}\n")
                         f.write(f"\t{script} --dpi={dpi} " +
                                 '--title "" ' +
                                 #f"--title \"{modelname} PR " +
                                 #f"({xstart},{xstop})->({ystart},{ystop}))\" " +
-                                f"{' '.join(input_files)} {target}\n")
+                                f"--metrics {metrics_bundle} {target}\n")
                         f.write("\n")
                         plots.append(target)
 
                         # calibration plots with cross-validation
-                        input_files = [y_bundle, y_hat_bundle]
                         script = "./CalibrationPlot.py"
                         target = f"{outputfileprefix}_calibration{holdout}.png"
-                        dependencies = [script, *input_files]
+                        dependencies = [script, metrics_bundle]
                         f.write(f"{target} : {' '.join(dependencies)}\n")
                         f.write(f"\t{script} --dpi={dpi} " +
                                 '--title "" ' +
                                 #f"--title \"{modelname} Calibration " +
                                 #f"({xstart},{xstop})->({ystart},{ystop}))\" " +
-                                f"{' '.join(input_files)} {target}\n")
+                                f"--metrics {metrics_bundle} {target}\n")
                         f.write("\n")
                         plots.append(target)
 
@@ -799,6 +974,11 @@ with open("Makefile", "w") as f:
                         y_hats = [f"{intermediatefileprefix}_yhat{holdout}.csv"]
                         y_bundle = f"{intermediatefileprefix}_y{holdout}.pickle"
                         y_hat_bundle = f"{intermediatefileprefix}_yhat{holdout}.pickle"
+                        mrn_bundle = f"{intermediatefileprefix}_mrn{holdout}.pickle"
+                        metrics_bundle = f"{intermediatefileprefix}_metrics{holdout}.pickle"
+                        bootstrap_inputs = [mrn_bundle] if bootstrap_by_patient else []
+                        bootstrap_flags = (f"--mrns {mrn_bundle} "
+                                if bootstrap_by_patient else "")
 
                         # Bundle folds for ys
                         input_files = ys
@@ -818,74 +998,87 @@ with open("Makefile", "w") as f:
                         f.write(f"\t{script} {' '.join(input_files)} {target}\n")
                         f.write("\n")
 
-                        # ROC plots with bootstrapping
+                        # Bundle folds for the MRNs (for resampling patients)
+                        input_files = ys
+                        script = "./BundleYFolds.py"
+                        target = mrn_bundle
+                        dependencies = [script, *input_files]
+                        f.write(f"{target} : {' '.join(dependencies)}\n")
+                        f.write(f"\t{script} --mrns {' '.join(input_files)} {target}\n")
+                        f.write("\n")
+
+                        # compute the curves and confidence intervals once for
+                        # all of the plots
                         input_files = [y_bundle, y_hat_bundle]
+                        script = "./ComputeMetrics.py"
+                        target = metrics_bundle
+                        dependencies = [script, *input_files, *bootstrap_inputs,
+                                "ROCPlot.py", "PRPlot.py", "CalibrationPlot.py"]
+                        f.write(f"{target} : {' '.join(dependencies)}\n")
+                        f.write(f"\t{script} " +
+                                f'--bootstraps {num_bootstraps} ' +
+                                f'--workers {bootstrap_workers} ' +
+                                bootstrap_flags +
+                                f"{' '.join(input_files)} {target}\n")
+                        f.write("\n")
+
+                        # ROC plots with bootstrapping
                         script = "./ROCPlot.py"
                         target = f"{outputfileprefix}_roc{holdout}_bootstrap.png"
-                        dependencies = [script, *input_files]
+                        dependencies = [script, metrics_bundle]
                         f.write(f"{target} : {' '.join(dependencies)}\n")
                         f.write(f"\t{script} --dpi={dpi} " +
-                                f'--bootstraps {num_bootstraps} ' +
                                 '--title "" ' +
                                 #f"--title \"{modelname} ROC " +
                                 #f"({xstart},{xstop})->({ystart},{ystop}))\" " +
-                                f"{' '.join(input_files)} {target}\n")
+                                f"--metrics {metrics_bundle} {target}\n")
                         f.write("\n")
                         plots.append(target)
 
-                        # PR plots with cross-validation
-                        input_files = [y_bundle, y_hat_bundle]
+                        # PR plots with bootstrapping
                         script = "./PRPlot.py"
                         target = f"{outputfileprefix}_pr{holdout}_bootstrap.png"
-                        dependencies = [script, *input_files]
+                        dependencies = [script, metrics_bundle]
                         f.write(f"{target} : {' '.join(dependencies)}\n")
                         f.write(f"\t{script} --dpi={dpi} " +
-                                f'--bootstraps {num_bootstraps} ' +
                                 '--title "" ' +
                                 #f"--title \"{modelname} PR " +
                                 #f"({xstart},{xstop})->({ystart},{ystop}))\" " +
-                                f"{' '.join(input_files)} {target}\n")
+                                f"--metrics {metrics_bundle} {target}\n")
                         f.write("\n")
                         plots.append(target)
 
-                        # calibration plots with cross-validation
-                        input_files = [y_bundle, y_hat_bundle]
+                        # calibration plots with bootstrapping
                         script = "./CalibrationPlot.py"
                         target = f"{outputfileprefix}_calibration{holdout}_bootstrap.png"
-                        dependencies = [script, *input_files]
+                        dependencies = [script, metrics_bundle]
                         f.write(f"{target} : {' '.join(dependencies)}\n")
                         f.write(f"\t{script} --dpi={dpi} " +
-                                f'--bootstraps {num_bootstraps} ' +
                                 '--title "" ' +
                                 #f"--title \"{modelname} Calibration " +
                                 #f"({xstart},{xstop})->({ystart},{ystop}))\" " +
-                                f"{' '.join(input_files)} {target}\n")
+                                f"--metrics {metrics_bundle} {target}\n")
                         f.write("\n")
                         plots.append(target)
 
                     # generate SHAP plots for the bt case
                     if modelname == "Boosted Trees":
-                        # First translate the model to JSON format (so we can
-                        # reload it with a newer version of XGBoost)
-                        script = "./XgboostPickle2JSON.py"
-                        target = f"{intermediatefileprefix}.json"
-                        input_files = [f"{intermediatefileprefix}.pickle"]
-                        #        f"{xprefix}Xhat_holdout.csv"]
-                        dependencies = [script, *input_files]
-                        f.write(f"{target} : {' '.join(dependencies)}\n")
-                        f.write(f"\t{script} {' '.join(input_files)} {target}\n")
-                        f.write("\n")
+                        # The model is converted (along with the others) to
+                        # a format a newer version of XGBoost can load below
+                        xgboost_models.append(intermediatefileprefix)
 
                         # Next generate the SHAP plot
                         script = "./XgboostShapPlot.py"
-                        target = f"{intermediatefileprefix}.json"
                         target = f"{outputfileprefix}_shap_plot.png"
-                        input_files = [f"{intermediatefileprefix}.json",
-                                f"{xprefix}Xhat_holdout.csv"]
-                        dependencies = [script, *input_files, "shap-venv/bin/activate"]
+                        input_files = [f"{intermediatefileprefix}.ubj",
+                                f"{xbase}Xhat_holdout.csv"]
+                        dependencies = [script, *input_files, *holdout_rowmasks,
+                                "shap-venv/bin/activate"]
                         f.write(f"{target} : {' '.join(dependencies)}\n")
                         f.write(f"\tshap-venv/bin/python3 {script} --dpi={dpi} " +
-                            f"{' '.join(input_files)} {target}\n")
+                            f"--workers {shap_workers} --cachedir {cachedir} " +
+                            f"{' '.join(input_files)} {target}" +
+                            f"{rowmask_option(holdout_rowmasks)}\n")
                         f.write("\n")
 
                         plots.append(target)
@@ -903,181 +1096,167 @@ with open("Makefile", "w") as f:
                     # for every fold
                     for i in range(nfolds):
 
+                        (fold_xs, holdout_x, cleaning,
+                            cleaning_dependencies) = cv_inputs(xbase, i)
+                        fold_rowmasks, fold_holdout_rowmasks = cv_rowmasks(xbase, c, i)
+
                         # fit the models
-                        other_xs = [f"{xprefix}Xhat{i}_fold{j}.csv" for j in range(nfolds)
+                        other_xs = [fold_xs[j] for j in range(nfolds)
                                 if j != i]
                         other_ys = [f"{yprefix}y_fold{j}.csv" for j in range(nfolds)
                                 if j != i]
+                        other_rowmasks = [m for j in range(nfolds) if j != i
+                                for m in fold_rowmasks[j]]
                         input_files = [a for b in zip(other_xs, other_ys) for a in b]
                         script = './LogisticRegression.py'
                         target = f"{intermediatefileprefix}_fold{i}.pickle"
-                        dependencies = [script, *input_files]
+                        dependencies = [script, *input_files, *cleaning_dependencies,
+                                *other_rowmasks]
                         f.write(f"{target} : {' '.join(dependencies)}\n")
-                        f.write(f"\tCUDA_VISIBLE_DEVICES={i} {script} train {' '.join(input_files)} {target} --logl1penalty {loglambda}\n")
+                        f.write(f"\tCUDA_VISIBLE_DEVICES={i} {script} train {cleaning}{' '.join(input_files)} {target} --logl1penalty {loglambda}{rowmask_option(other_rowmasks)}\n")
                         f.write("\n")
 
                         # generate predictions from training data
                         script = './LogisticRegression.py'
                         target = f"{intermediatefileprefix}_yhat_fold{i}.csv"
                         input_files = [f"{intermediatefileprefix}_fold{i}.pickle",
-                                f"{xprefix}Xhat{i}_fold{i}.csv"]
-                        dependencies = [script, *input_files]
+                                fold_xs[i]]
+                        dependencies = [script, *input_files, *cleaning_dependencies,
+                                *fold_rowmasks[i]]
                         f.write(f"{target} : {' '.join(dependencies)}\n")
-                        f.write(f"\tCUDA_VISIBLE_DEVICES={i} {script} apply {' '.join(input_files)} {target}\n")
+                        f.write(f"\tCUDA_VISIBLE_DEVICES={i} {script} apply {cleaning}{' '.join(input_files)} {target}{rowmask_option(fold_rowmasks[i])}\n")
                         f.write("\n")
 
-                    # AUCs per fold for each value of lambda
-                    ys = [f"{yprefix}y_fold{j}.csv" for j in range(nfolds)]
-                    y_hats = [f"{intermediatefileprefix}_yhat_fold{j}.csv"
-                            for j in range(nfolds)]
-                    input_files = [a for b in zip(ys, y_hats) for a in b]
-                    script = "./SummarizeAUCs.py"
-                    target = f"{intermediatefileprefix}_aucs.txt"
-                    dependencies = [script, *input_files]
-                    f.write(f"{target} : {' '.join(dependencies)}\n")
-                    f.write(f"\t{script} {' '.join(input_files)} {target}\n")
-                    f.write("\n")
-
                 # Lambda sweep plot
                 resultnameprefix = (f"X{xstart}_{xstop}_y{ystart}_" +
                     f"{ystop}_{c}lr")
                 intermediatefileprefix = f"{cachedir}{resultnameprefix}"
                 outputfileprefix = f"{outputsdir}{resultnameprefix}"
 
-                input_files = [f'{intermediatefileprefix}{loglambda}_aucs.txt'
-                        for loglambda in loglambdas]
+                # AUCs per fold for every value of lambda
+                ys = [f"{yprefix}y_fold{j}.csv" for j in range(nfolds)]
+                input_files = [a for loglambda in loglambdas
+                        for j in range(nfolds)
+                        for a in (ys[j], f"{intermediatefileprefix}{loglambda}_yhat_fold{j}.csv")]
+                script = "./SummarizeAUCs.py"
+                target = f"{intermediatefileprefix}_loglambda_aucs.txt"
+                dependencies = [script, *sorted(set(input_files))]
+                f.write(f"{target} : {' '.join(dependencies)}\n")
+                f.write(f"\t{script} --paramvals {' '.join(str(loglambda) for loglambda in loglambdas)} " +
+                        f"-- {' '.join(input_files)} {target}\n")
+                f.write("\n")
+
+                input_files = [target]
                 script = "./ParameterSweepPlot.py"
                 target = f"{outputfileprefix}_loglambda_sweep.png"
                 dependencies = [script, *input_files]
                 f.write(f"{target} : {' '.join(dependencies)}\n")
                 f.write(f"\t{script} --dpi={dpi} " +
                         '--title "" ' +
-                        f"{' '.join([str(loglambda) + ' ' + inputfile for loglambda, inputfile in zip(loglambdas, input_files)])} {target}\n")
+                        f"--table {input_files[0]} {target}\n")
                 f.write("\n")
                 plots.append(target)
 
-    # Generate grid plots
+    # Compare the AUROCs of the models on the same data (paired DeLong test)
     for xstart,xstop in xtimes:
         for ystart,ystop in ytimes:
-            for holdout in ['', '_holdout']:
-                y_bundles = [f"{cachedir}X{xstart}_{xstop}_y{ystart}_" +
-                    f"{ystop}_{c}{modelprefix}_y_folds{holdout}.pickle"
-                    for modelprefix in modelprefixes for c in conditions]
-                yhat_bundles = [f"{cachedir}X{xstart}_{xstop}_y{ystart}_" +
-                    f"{ystop}_{c}{modelprefix}_yhat_folds{holdout}.pickle"
-                    for modelprefix in modelprefixes for c in conditions]
-                outputfileprefix = (f"{outputsdir}X{xstart}_{xstop}_y{ystart}_" +
-                    f"{ystop}_")
-                quoted_rownames = '"' + '" "'.join(modelnames) + '"'
-                quoted_colnames = '"' + '" "'.join(conditionnames) + '"'
-
-                # ROC plots
-                input_files = y_bundles + yhat_bundles
-                script = "./GridPlot.py"
-                target = f"{outputfileprefix}_roc_grid{holdout}.png"
-                dependencies = [script, *input_files, "ROCPlot.py"]
-                f.write(f"{target} : {' '.join(dependencies)}\n")
-                f.write(f"\t{script} --dpi={dpi} " +
-                        f"--rownames {quoted_rownames} " +
-                        f"--colnames {quoted_colnames} " +
-                        f"--ys {' '.join(y_bundles)} " +
-                        f"--yhats {' '.join(yhat_bundles)} " +
-                        f"--out {target}\n")
-                f.write("\n")
-                plots.append(target)
-
-                # PR plots
-                input_files = y_bundles + yhat_bundles
-                script = "./GridPlot.py"
-                target = f"{outputfileprefix}_pr_grid{holdout}.png"
-                dependencies = [script, *input_files, "PRPlot.py"]
-                f.write(f"{target} : {' '.join(dependencies)}\n")
-                f.write(f"\t{script} --dpi={dpi} " +
-                        f"--rownames {quoted_rownames} " +
-                        f"--colnames {quoted_colnames} " +
-                        f"--ys {' '.join(y_bundles)} " +
-                        f"--yhats {' '.join(yhat_bundles)} " +
-                        f"--out {target} --precisionrecall\n")
-                f.write("\n")
-                plots.append(target)
+            for c in conditions:
+                for holdout in ['', '_holdout']:
+                    yprefix = f"{cachedir}X{xstart}_{xstop}_y{ystart}_{ystop}_{c}"
+                    ys = f"{yprefix}y{holdout}.csv"
+                    y_hats = [f"{cachedir}X{xstart}_{xstop}_y{ystart}_" +
+                        f"{ystop}_{c}{modelprefix}_yhat{holdout}.csv"
+                        for modelprefix in modelprefixes]
+                    input_files = [a for y_hat in y_hats for a in (ys, y_hat)]
+                    outputfileprefix = (f"{outputsdir}X{xstart}_{xstop}_y{ystart}_" +
+                        f"{ystop}_{c}")
+                    script = "./SummarizeAUCs.py"
+                    targets = [f"{outputfileprefix}auc_delong{holdout}.txt",
+                        f"{outputfileprefix}auc_comparisons{holdout}.csv"]
+                    dependencies = [script, ys, *y_hats]
+                    start_rule(f, targets, dependencies)
+                    f.write(f"\t{script} --ci-method delong " +
+                            f"--comparisons {targets[1]} " +
+                            f"{' '.join(input_files)} {targets[0]}\n")
+                    f.write("\n")
+                    text_results.extend(targets)
 
-                # calibration plots
-                input_files = y_bundles + yhat_bundles
-                script = "./GridPlot.py"
-                target = f"{outputfileprefix}_calibration_grid{holdout}.png"
-                dependencies = [script, *input_files, "CalibrationPlot.py"]
-                f.write(f"{target} : {' '.join(dependencies)}\n")
-                f.write(f"\t{script} --dpi={dpi} " +
-                        f"--rownames {quoted_rownames} " +
-                        f"--colnames {quoted_colnames} " +
-                        f"--ys {' '.join(y_bundles)} " +
-                        f"--yhats {' '.join(yhat_bundles)} " +
-                        f"--out {target} --calibration\n")
-                f.write("\n")
-                plots.append(target)
+    # Generate grid plots (from the metrics computed for the individual plots)
+    for bootstrap in ['', 'bootstrap']:
+        metrics_suffix = '' if bootstrap else '_folds'
+        for xstart,xstop in xtimes:
+            for ystart,ystop in ytimes:
+                for holdout in ['', '_holdout']:
+                    metrics_bundles = [f"{cachedir}X{xstart}_{xstop}_y{ystart}_" +
+                        f"{ystop}_{c}{modelprefix}_metrics{metrics_suffix}{holdout}.pickle"
+                        for modelprefix in modelprefixes for c in conditions]
+                    outputfileprefix = (f"{outputsdir}X{xstart}_{xstop}_y{ystart}_" +
+                        f"{ystop}_{bootstrap}")
+                    quoted_rownames = '"' + '" "'.join(modelnames) + '"'
+                    quoted_colnames = '"' + '" "'.join(conditionnames) + '"'
+
+                    # ROC plots
+                    input_files = metrics_bundles
+                    script = "./GridPlot.py"
+                    target = f"{outputfileprefix}_roc_grid{holdout}.png"
+                    dependencies = [script, *input_files, "ROCPlot.py"]
+                    f.write(f"{target} : {' '.join(dependencies)}\n")
+                    f.write(f"\t{script} --dpi={dpi} " +
+                            f"--rownames {quoted_rownames} " +
+                            f"--colnames {quoted_colnames} " +
+                            f"--metrics {' '.join(metrics_bundles)} " +
+                            f"--out {target}\n")
+                    f.write("\n")
+                    plots.append(target)
 
-    # Generate bootstrapped grid plots
-    for xstart,xstop in xtimes:
-        for ystart,ystop in ytimes:
-            for holdout in ['', '_holdout']:
-                y_bundles = [f"{cachedir}X{xstart}_{xstop}_y{ystart}_" +
-                    f"{ystop}_{c}{modelprefix}_y{holdout}.pickle"
-                    for modelprefix in modelprefixes for c in conditions]
-                yhat_bundles = [f"{cachedir}X{xstart}_{xstop}_y{ystart}_" +
-                    f"{ystop}_{c}{modelprefix}_yhat{holdout}.pickle"
-                    for modelprefix in modelprefixes for c in conditions]
-                outputfileprefix = (f"{outputsdir}X{xstart}_{xstop}_y{ystart}_" +
-                    f"{ystop}_bootstrap")
-                quoted_rownames = '"' + '" "'.join(modelnames) + '"'
-                quoted_colnames = '"' + '" "'.join(conditionnames) + '"'
-
-                # ROC plots
-                input_files = y_bundles + yhat_bundles
-                script = "./GridPlot.py"
-                target = f"{outputfileprefix}_roc_grid{holdout}.png"
-                dependencies = [script, *input_files, "ROCPlot.py"]
-                f.write(f"{target} : {' '.join(dependencies)}\n")
-                f.write(f"\t{script} --dpi={dpi} " +
-                        f"--rownames {quoted_rownames} " +
-                        f"--colnames {quoted_colnames} " +
-                        f"--bootstraps {num_bootstraps} " +
-                        f"--ys {' '.join(y_bundles)} " +
-                        f"--yhats {' '.join(yhat_bundles)} " +
-                        f"--out {target}\n")
-                f.write("\n")
-                plots.append(target)
+                    # PR plots
+                    input_files = metrics_bundles
+                    script = "./GridPlot.py"
+                    target = f"{outputfileprefix}_pr_grid{holdout}.png"
+                    dependencies = [script, *input_files, "PRPlot.py"]
+                    f.write(f"{target} : {' '.join(dependencies)}\n")
+                    f.write(f"\t{script} --dpi={dpi} " +
+                            f"--rownames {quoted_rownames} " +
+                            f"--colnames {quoted_colnames} " +
+                            f"--metrics {' '.join(metrics_bundles)} " +
+                            f"--out {target} --precisionrecall\n")
+                    f.write("\n")
+                    plots.append(target)
 
-                # PR plots
-                input_files = y_bundles + yhat_bundles
-                script = "./GridPlot.py"
-                target = f"{outputfileprefix}_pr_grid{holdout}.png"
-                dependencies = [script, *input_files, "PRPlot.py"]
-                f.write(f"{target} : {' '.join(dependencies)}\n")
-                f.write(f"\t{script} --dpi={dpi} " +
-                        f"--rownames {quoted_rownames} " +
-                        f"--colnames {quoted_colnames} " +
-                        f"--bootstraps {num_bootstraps} " +
-                        f"--ys {' '.join(y_bundles)} " +
-                        f"--yhats {' '.join(yhat_bundles)} " +
-                        f"--out {target} --precisionrecall\n")
-                f.write("\n")
-                plots.append(target)
+                    # calibration plots
+                    input_files = metrics_bundles
+                    script = "./GridPlot.py"
+                    target = f"{outputfileprefix}_calibration_grid{holdout}.png"
+                    dependencies = [script, *input_files, "CalibrationPlot.py"]
+                    f.write(f"{target} : {' '.join(dependencies)}\n")
+                    f.write(f"\t{script} --dpi={dpi} " +
+                            f"--rownames {quoted_rownames} " +
+                            f"--colnames {quoted_colnames} " +
+                            f"--metrics {' '.join(metrics_bundles)} " +
+                            f"--out {target} --calibration\n")
+                    f.write("\n")
+                    plots.append(target)
+
+    # translate each of the boosted tree models to JSON (so we can reload
+    # them with a newer version of XGBoost), and then from JSON to the faster
+    # loading UBJSON format, which only the newer version can write; each
+    # model has its own rules, so that a plot only needs its own model
+    script = "./XgboostPickle2JSON.py"
+    for prefix in xgboost_models:
+        target = f"{prefix}.json"
+        input_files = [f"{prefix}.pickle"]
+        dependencies = [script, *input_files]
+        f.write(f"{target} : {' '.join(dependencies)}\n")
+        f.write(f"\t{script} --formats json {' '.join(input_files)}\n")
+        f.write("\n")
 
-                # calibration plots
-                input_files = y_bundles + yhat_bundles
-                script = "./GridPlot.py"
-                target = f"{outputfileprefix}_calibration_grid{holdout}.png"
-                dependencies = [script, *input_files, "CalibrationPlot.py"]
-                f.write(f"{target} : {' '.join(dependencies)}\n")
-                f.write(f"\t{script} --dpi={dpi} " +
-                        f"--rownames {quoted_rownames} " +
-                        f"--colnames {quoted_colnames} " +
-                        f"--bootstraps {num_bootstraps} " +
-                        f"--ys {' '.join(y_bundles)} " +
-                        f"--yhats {' '.join(yhat_bundles)} " +
-                        f"--out {target} --calibration\n")
-                f.write("\n")
-                plots.append(target)
+        target = f"{prefix}.ubj"
+        input_files = [f"{prefix}.json"]
+        dependencies = [script, *input_files, "shap-venv/bin/activate"]
+        f.write(f"{target} : {' '.join(dependencies)}\n")
+        f.write(f"\tshap-venv/bin/python3 {script} --formats ubj " +
+            f"{' '.join(input_files)}\n")
+        f.write("\n")
 
     # generate a target for all plots
     f.write(f"all_plots : {' '.join(plots)}\n\n")
@@ -1085,6 +1264,10 @@ with open("Makefile", "w") as f:
     # generate a target for all text results
     f.write(f"all_text_results : {' '.join(text_results)}\n\n")
 
+    # generate a target for checking the resumed report statistics
+    f.write(f".PHONY : check_report_state\n")
+    f.write(f"check_report_state : {' '.join(report_state_checks)}\n\n")
+
     # generate a rule for converting from csv to npy files
     f.write(f"%.npy : %.csv\n")
     f.write(f"\t./csv2npy.py $^ $@\n\n")
@@ -1,5 +1,6 @@
 #!/usr/bin/julia
 using ArgParse
+include("CSVRecords.jl")
 
 function parse_commandline()
     s = ArgParseSettings()
@@ -15,6 +16,10 @@ function parse_commandline()
         "outfile"
             help = "file to generate with ages at each snapshot"
             required = true
+
+        "--census"
+            help = "file with the MRNs of the current inpatients (in an MRN " *
+                "column); only these patients get a snapshot"
     end
 
     return parse_args(s)
@@ -26,6 +31,21 @@ function main()
     # pre-rounding begins at 5 am
     dts = args["dts"]
 
+    # read the MRNs of the census (if any)
+    census = nothing
+    if args["census"] ≠ nothing
+        census = Set{String}()
+        open(args["census"], "r") do censusfile
+            censuscolnames = split(readline(censusfile), ",")
+            mrncol = findfirst(isequal("MRN"), censuscolnames)
+            @assert mrncol ≠ nothing "no MRN column in $(args["census"])"
+            while !eof(censusfile)
+                push!(census, split(readrecord(censusfile), ",")[mrncol])
+            end
+        end
+        print("limiting the snapshots to a census of $(length(census)) patients\n")
+    end
+
     print("generating $(args["outfile"])...\n")
     open(args["patients"], "r") do patientsfile
         open(args["outfile"], "w") do outfile
@@ -38,23 +58,12 @@ function main()
             # write the output header
             write(outfile, "MRN,DTS\n")
 
-            for line in eachline(patientsfile)
-                if '"' in line
-                    # continue reading until all quotes are closed.
-                    while count(isequal('"'),line) % 2 == 1
-                        line *= readline(eventfile)
-                    end
-                    quotes = split(line, "\"")
-                    for i in 2:2:length(quotes)
-                        # remove commas, newlines and carriage
-                        # returns
-                        quotes[i] = replace(quotes[i],
-                                            r"[\n\r,]"=>'_')
-                    end
-                    line = join(quotes, "")
-                end
-                cols = split(line,",")
+            while !eof(patientsfile)
+                cols = split(readrecord(patientsfile),",")
                 mrn = cols[mrncol]
+                if census ≠ nothing && !(mrn in census)
+                    continue
+                end
                 write(outfile,mrn,',',dts,'\n')
             end
         end
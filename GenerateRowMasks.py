@@ -0,0 +1,42 @@
+#!/usr/bin/python3
+
+import numpy as np
+import pandas as pd
+import time
+import argparse
+
+startup_time = time.time()
+
+def parse_arguments():
+    argument_parser = argparse.ArgumentParser(
+            description='generate row masks that exclude the rows in which ' +
+                'a feature is greater than a threshold')
+    argument_parser.add_argument('INPUTFILE',
+            help='file with the features to filter on')
+    argument_parser.add_argument('--mask', nargs=3, action='append',
+            required=True, metavar=('COLUMN', 'REMOVEIFGREATERTHAN', 'MASKFILE'),
+            help='column to filter on, the value above which rows are ' +
+                'excluded, and the row mask file to generate; give this ' +
+                'once for each mask (all of the masks are generated from a ' +
+                'single pass through INPUTFILE)')
+
+    return argument_parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+
+    # only the columns being filtered on need to be parsed
+    columns = sorted(set(column for column, threshold, maskfile in args.mask))
+    print(f"{time.time() - startup_time}: loading {', '.join(columns)}")
+    data = pd.read_csv(args.INPUTFILE, usecols=columns, dtype=np.float32)
+
+    for column, threshold, maskfile in args.mask:
+        print(f"{time.time() - startup_time}: saving {maskfile}")
+        # keep only the rows that don't match the exclusion criteria (rows
+        # with missing values are kept)
+        keep = ~(data[column] > np.float32(threshold))
+        with open(maskfile, "w") as f:
+            f.write("keep\n")
+            f.write("".join(np.where(keep, "1\n", "0\n")))
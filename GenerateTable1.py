@@ -1,147 +1,122 @@
 #!/usr/bin/python3
-import re
-import statistics
-from datetime import datetime, timedelta
+import sys
+import argparse
 import numpy as np
-
-if __name__ == '__main__':
-    data_dir = 'ImportedData/2019-01-17/'
-    demeographics_filename = data_dir + 'Patients.csv'
-    holdout_filename = 'Cache/2019-01-17/holdout_and_cvgroups.csv'
-    cam_filename = 'ImportedData/2019-01-17/CamScores.csv'
-
-    with open(demeographics_filename, 'r') as demographics_file, \
-            open(holdout_filename, 'r') as holdout_file, \
-            open(cam_filename, 'r') as cam_file:
-
-        class StatsTally:
-            def __init__(self):
-                self.count = 0
-                self.count_male = 0
-                self.count_female = 0
-                self.cam_counts = []
-                self.cam_positive_fraction = []
-                self.cam_day_counts = []
-                self.cam_positive_day_fraction = []
-                self.mean_ages = []
-
-            def update(self, gender, cam_scores, ages, cam_days):
-                self.count += 1
-                if gender == 'Male':
-                    self.count_male += 1
-                elif gender == 'Female':
-                    self.count_female += 1
-                self.cam_counts.append(len(cam_scores))
-                self.cam_positive_fraction.append(sum(cam_scores)/len(cam_scores))
-                self.cam_day_counts.append(len(cam_days))
-                self.cam_positive_day_fraction.append(sum(cam_days)/len(cam_days))
-                self.mean_ages.append(statistics.mean(ages))
-
-        all_tally = StatsTally()
-        train_tally = StatsTally()
-        holdout_tally = StatsTally()
-        cam_positive_tally = StatsTally()
-        cam_negative_tally = StatsTally()
-
-        mrn_cam = 0
-
-        # skip the headers
-        demographics_file.readline()
-        holdout_file.readline()
-        cam_file.readline()
-
-        for line in demographics_file:
-
-            # remove the quoted names because they might contain commas
-            line = re.sub('".*"', 'REMOVED', line)
-
-            mrn, fullname, birthdate, gender = line.strip().split(',')
-            mrn_holdout, holdout, cvgroup = holdout_file.readline().strip().split(',')
-            assert(int(mrn) == int(mrn_holdout))
-            birth_dts = datetime.fromisoformat(birthdate);
-
-            # convert holdout to a boolean
-            holdout = holdout.lower().strip() == 'true'
-
-            # find the first matching line from the CAM file
-            prior_date = datetime.fromordinal(1).date()
-            while mrn != mrn_cam:
-                mrn_cam, dts, measure, value = cam_file.readline().strip().split(',')
-                assert(int(mrn) >= int(mrn_cam))
-
-            # collect the CAM scores
-            cam_scores = []
-            ages = []
-            cam_days = []
-            while mrn == mrn_cam:
-                if value.lower() == 'positive':
-                    cam_scores.append(1)
-                if value.lower() == 'negative':
-                    cam_scores.append(0)
-
-                ages.append((datetime.fromisoformat(dts) - birth_dts).days/365.25)
-
-                # if this is a new date (starting at 5 am), add another cam day to the list
-                date = (datetime.fromisoformat(dts) - timedelta(hours=5)).date()
-                if date != prior_date:
-                    cam_days.append(0)
-                    prior_date = date
-
-                # if this cam screen was positive, mark the day as positive
-                if value.lower() == 'positive':
-                    cam_days[-1] = 1
-
-                # buffer the next line from the CAM file
-                try:
-                    mrn_cam, dts, measure, value = \
-                        cam_file.readline().strip().split(',')
-                except ValueError:
-                    mrn_cam = -1 # end of file
-
-            if len(cam_scores) > 0:
-                all_tally.update(gender, cam_scores, ages, cam_days)
-                if holdout:
-                    holdout_tally.update(gender, cam_scores, ages, cam_days)
-                else:
-                    train_tally.update(gender, cam_scores, ages, cam_days)
-                if sum(cam_scores) == 0:
-                    cam_negative_tally.update(gender, cam_scores, ages, cam_days)
-                else:
-                    cam_positive_tally.update(gender, cam_scores, ages, cam_days)
-
-
-    print(f'Measure\tAll Patients\tTraining Set\tTesting Set\tCAM positive\tCAM negative')
+import pandas as pd
+
+
+def load_patient_tallies(patients_file, holdout_file, cam_file):
+    # the files are read by position, so the column names in the headers
+    # don't matter
+    patients = pd.read_csv(patients_file, header=0,
+            names=['MRN', 'FullName', 'BirthDTS', 'Gender'],
+            parse_dates=['BirthDTS'])
+    holdouts = pd.read_csv(holdout_file, header=0,
+            names=['MRN', 'Holdout', 'CVGroup'])
+    cams = pd.read_csv(cam_file, header=0,
+            names=['MRN', 'DTS', 'Measure', 'Value'], parse_dates=['DTS'])
+
+    value = cams['Value'].astype(str).str.lower()
+    positive = value == 'positive'
+    scored = positive | (value == 'negative')
+
+    # every CAM evaluation counts towards the patient's mean age, even if it
+    # wasn't scored as positive or negative
+    birth_dts = cams['MRN'].map(patients.set_index('MRN')['BirthDTS'])
+    ages = (cams['DTS'] - birth_dts).dt.days / 365.25
+
+    # CAM days start at 5 am, and a new day begins whenever the date (or the
+    # patient) changes from one evaluation to the next
+    dates = (cams['DTS'] - pd.Timedelta(hours=5)).dt.floor('D')
+    new_day = ((cams['MRN'] != cams['MRN'].shift()) |
+            (dates != dates.shift()))
+    days = pd.DataFrame({'MRN': cams['MRN'], 'positive': positive}).groupby(
+            new_day.cumsum()).agg({'MRN': 'first', 'positive': 'max'})
+
+    by_patient = cams['MRN']
+    tallies = pd.DataFrame({
+        'cam_count': scored.groupby(by_patient).sum(),
+        'cam_positive': positive.groupby(by_patient).sum(),
+        'mean_age': ages.groupby(by_patient).mean(),
+        'cam_days': days.groupby('MRN').size(),
+        'cam_positive_days': days.groupby('MRN')['positive'].sum(),
+    })
+
+    # only patients with at least one scored CAM evaluation (and with
+    # demographics and a holdout assignment) are included
+    tallies = tallies[(tallies['cam_count'] > 0) &
+            tallies.index.isin(patients['MRN']) &
+            tallies.index.isin(holdouts['MRN'])]
+    tallies['Gender'] = tallies.index.map(patients.set_index('MRN')['Gender'])
+    tallies['Holdout'] = tallies.index.map(
+            holdouts.set_index('MRN')['Holdout'].astype(str).str.strip()
+                .str.lower() == 'true')
+
+    return tallies
+
+
+def mean_sd(values, scale=1):
+    return f'{np.mean(values) * scale:.1f} ({np.std(values, ddof=1) * scale:.1f})'
+
+
+def write_table(out, cohorts):
     rows = [
-            ['Number of patients', lambda tally: f'{tally.count}'],
-            ['Mean age (std dev)',
-                lambda tally: f'{statistics.mean(tally.mean_ages):.1f} ' +
-                    f'({statistics.stdev(tally.mean_ages):.1f})'],
-            ['Male (%)', lambda tally: f'{tally.count_male} ' +
-                f'({ 100 * tally.count_male / tally.count :.1f})'],
-            ['Female (%)', lambda tally: f'{tally.count_female} ' +
-                f'({ 100 * tally.count_female / tally.count :.1f})'],
+            ['Number of patients', lambda tally: f'{len(tally)}'],
+            ['Mean age (std dev)', lambda tally: mean_sd(tally['mean_age'])],
+            ['Male (%)', lambda tally: f'{np.sum(tally["Gender"] == "Male")} ' +
+                f'({100 * np.mean(tally["Gender"] == "Male"):.1f})'],
+            ['Female (%)', lambda tally: f'{np.sum(tally["Gender"] == "Female")} ' +
+                f'({100 * np.mean(tally["Gender"] == "Female"):.1f})'],
             #['Median CAM evaluations per patient',
-            #    lambda tally: f'{statistics.median(tally.cam_counts):0.1f}'],
+            #    lambda tally: f'{np.median(tally["cam_count"]):0.1f}'],
             ['Patients with at least one positive CAM screen (%)',
-                lambda tally:
-                    f'{np.sum(np.array(tally.cam_positive_fraction)!=0)} ' +
-                    f'({100*np.mean(np.array(tally.cam_positive_fraction)!=0):.1f})'
-                    ],
+                lambda tally: f'{np.sum(tally["cam_positive"] != 0)} ' +
+                    f'({100 * np.mean(tally["cam_positive"] != 0):.1f})'],
             ['Mean CAM evaluations per patient (std dev)',
-                lambda tally: f'{statistics.mean(tally.cam_counts):.1f} ' +
-                    f'({statistics.stdev(tally.cam_counts):.1f})' ],
+                lambda tally: mean_sd(tally['cam_count'])],
             ['Average percent positive CAM screens per patient (std dev)',
-                lambda tally: f'{statistics.mean(tally.cam_positive_fraction) * 100:.1f} '
-                    f'({statistics.stdev(tally.cam_positive_fraction) * 100:.1f})'],
+                lambda tally: mean_sd(tally['cam_positive'] / tally['cam_count'], 100)],
             ['Mean CAM evaluation days per patient (std dev)',
-                lambda tally: f'{statistics.mean(tally.cam_day_counts):.1f} ' +
-                    f'({statistics.stdev(tally.cam_day_counts):.1f})' ],
+                lambda tally: mean_sd(tally['cam_days'])],
             ['Average percent positive CAM days (std dev)',
-                lambda tally: f'{statistics.mean(tally.cam_positive_day_fraction) * 100:.1f} '
-                    f'({statistics.stdev(tally.cam_positive_day_fraction) * 100:.1f})'],
+                lambda tally: mean_sd(tally['cam_positive_days'] / tally['cam_days'], 100)],
         ]
+
+    print(f'Measure\tAll Patients\tTraining Set\tTesting Set\tCAM positive\tCAM negative',
+            file=out)
     for label, f in rows:
-        print( '\t'.join([label]
-            + [ f(tally) for tally in [all_tally, train_tally, holdout_tally,
-                cam_positive_tally, cam_negative_tally] ]
-            ))
+        print('\t'.join([label] + [f(cohort) for cohort in cohorts]), file=out)
+
+
+def parse_arguments():
+    argument_parser = argparse.ArgumentParser()
+    argument_parser.add_argument('PATIENTS',
+            help='csv file with patient demographics')
+    argument_parser.add_argument('HOLDOUT',
+            help='csv file with the holdout and CV group for each MRN')
+    argument_parser.add_argument('CAMSCORES',
+            help='csv file with the CAM scores (sorted by MRN and time)')
+    argument_parser.add_argument('--output', '-o',
+            help='file for the table (tab separated); defaults to stdout')
+
+    return argument_parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_arguments()
+
+    tally = load_patient_tallies(args.PATIENTS, args.HOLDOUT, args.CAMSCORES)
+    cohorts = [
+            tally,
+            tally[~tally['Holdout']],
+            tally[tally['Holdout']],
+            tally[tally['cam_positive'] != 0],
+            tally[tally['cam_positive'] == 0],
+        ]
+
+    if args.output is None:
+        write_table(sys.stdout, cohorts)
+    else:
+        with open(args.output, 'w') as out:
+            write_table(out, cohorts)
@@ -2,8 +2,11 @@
 using ArgParse
 using Dates
 using DataStructures
+using Serialization
 include("AnalysisWindow.jl")
 include("TokenNames.jl")
+include("FeatureFiles.jl")
+include("EventFiles.jl")
 
 struct Event
     mrn::Int
@@ -12,8 +15,82 @@ struct Event
     value::Float64
 end
 
+# the state of a patient's analysis windows at the end of a run, so that a
+# later run can resume from it rather than from the start of their history;
+# only the windows of the measures the patient has had are kept (most
+# patients only have a small fraction of all of the measures)
+struct PatientState
+    windows::Vector{Dict{Int,MonotonicAnalysisWindow}} # per window, by measure
+    events::Vector{Event}        # events that are (or will be) in a window
+    firstinwindow::Vector{Int}   # index of the first event in each window
+    nextforwindow::Vector{Int}   # index of the next event to add to each window
+    consumeduntil::DateTime      # all earlier events have already been read
+                                 # (just after the last event read)
+end
+
+struct Checkpoint
+    windowranges::Vector{Tuple{Hour,Hour}}
+    medstats::Bool
+    measures::Vector{String}
+    patients::Dict{Int,PatientState}
+end
+
 const iso8601 = dateformat"yyyy-mm-ddTHH:MM:SS"
 
+isunused(window::MonotonicAnalysisWindow) = (window.count == 0 &&
+    isnan(window.alltimelatest) && window.lastpoptime == DateTime(Year(0)))
+
+# save the state of a patient, taking the windows they have used (which are
+# replaced by empty ones for the next patient) and forgetting the events
+# that have expired from every window
+function savepatientstate!(windows, events, firstinwindow, nextforwindow,
+                           consumeduntil)
+    usedwindows = [Dict{Int,MonotonicAnalysisWindow}() for w in windows]
+    for (w, measurewindows) in enumerate(windows)
+        for (id, window) in enumerate(measurewindows)
+            if !isunused(window)
+                usedwindows[w][id] = window
+                measurewindows[id] = MonotonicAnalysisWindow()
+            end
+        end
+    end
+
+    numexpired = minimum(firstinwindow) - 1
+    return PatientState(usedwindows, events[(numexpired + 1):end],
+                        firstinwindow .- numexpired,
+                        nextforwindow .- numexpired, consumeduntil)
+end
+
+# whether all of a patient's events have expired from every window (their
+# state then only holds all-time statistics, which a later run can
+# recalculate from their history)
+hasexpired(state::PatientState) = minimum(state.firstinwindow) > length(state.events)
+
+# renumber the measures of saved states (using the ids of oldnames) to the
+# ids of the current token names, which are assigned in the order the
+# measures first appear in each export; the windows and events of measures
+# that are no longer in the token names are dropped
+function remapmeasures!(patients, oldnames, tokennames::TokenNames)
+    newids = [get(tokennames.nametoid, name, 0) for name in oldnames]
+    for mrn in collect(keys(patients))
+        state = patients[mrn]
+        windows = [Dict{Int,MonotonicAnalysisWindow}(newids[id] => window
+                        for (id, window) in measurewindows if newids[id] ≠ 0)
+                   for measurewindows in state.windows]
+
+        # the index of each event (and of the end of the events) once the
+        # events of dropped measures are removed
+        kept = [newids[event.id] ≠ 0 for event in state.events]
+        newindex = [0; cumsum(kept)] .+ 1
+        events = [Event(event.mrn, event.dts, newids[event.id], event.value)
+                  for (event, keep) in zip(state.events, kept) if keep]
+
+        patients[mrn] = PatientState(windows, events,
+            newindex[state.firstinwindow], newindex[state.nextforwindow],
+            state.consumeduntil)
+    end
+end
+
 function readevent(stream::IO, tokennames::TokenNames)
     if eof(stream)
         # create a dummy event with an MRN that is higher than any valid MRN
@@ -25,27 +102,68 @@ function readevent(stream::IO, tokennames::TokenNames)
     end
 end
 
-function calcwindowedstats(windowstart, windowend, snapshottimesfile,
-                           eventsfile, tokennames, outfile, medstats)
+function readevent(events::BinaryEventFile, tokennames::TokenNames)
+    if eof(events)
+        # create a dummy event with an MRN that is higher than any valid MRN
+        return Event(typemax(Int), now(), 1, 0.0)
+    else
+        # the ids are already those of the token names file
+        return Event(readbinaryevent(events)...)
+    end
+end
+
+function readeventindex(filename)
+    eventindex = Dict{Int,Int}()
+    open(filename, "r") do f
+        header = readline(f)
+        @assert header == "MRN,OFFSET,NUMEVENTS"
+        for line in eachline(f)
+            mrn, offset, numevents = split(line, ",")
+            eventindex[parse(Int, mrn)] = parse(Int, offset)
+        end
+    end
+    return eventindex
+end
+
+function calcwindowedstats(windowranges, snapshottimesfile, eventsfile,
+                           tokennames, outfiles, binaries, medstats,
+                           patients=nothing, eventindex=nothing)
 
     nummeasures = length(tokennames.names)
-    windows = [AnalysisWindow() for i = 1:nummeasures]
-    eventsinwindow = Deque{Event}()
+    numwindows = length(windowranges)
+
+    # the events arrive in time order, so the windows can track the max and
+    # min with monotonic deques (see BenchmarkAnalysisWindow.jl)
+    newwindows() = [[MonotonicAnalysisWindow() for i = 1:nummeasures]
+                    for w = 1:numwindows]
+    lastwindowend = maximum(windowend for (windowstart, windowend) in windowranges)
+
+    # the events of the current patient are read once and shared by all of
+    # the windows, each of which keeps track of the events it holds
+    windows = newwindows()
+    events = Event[]
+    firstinwindow = ones(Int, numwindows)
+    nextforwindow = ones(Int, numwindows)
 
     # read the headers
     header = readline(snapshottimesfile)
     @assert header == "MRN,DTS"
-    header = readline(eventsfile)
-    @assert header == "MRN,DTS,MEASURE,VALUE"
+    if eventsfile isa IO
+        header = readline(eventsfile)
+        @assert header == "MRN,DTS,MEASURE,VALUE"
+    end
 
     currentmrn = -1
+    consumeduntil = DateTime(Year(0))
     nextevent = readevent(eventsfile, tokennames)
 
-    # write the header
-    statnames = (medstats ? allmedstatnames : allstatnames)(windows[1])
+    # write the headers
+    statnames = (medstats ? allmedstatnames : allstatnames)(windows[1][1])
     colnames = [ "$(measure)_$stat" for stat in statnames,
                 measure in tokennames.names ][:]
-    write(outfile, "MRN,DTS,$(join(colnames, ","))\n")
+    for (outfile, binary) in zip(outfiles, binaries)
+        writefeatureheader(outfile, binary, ["MRN"; "DTS"; colnames])
+    end
 
     # for each snapshot (composed of an mrn and time)
     for line in eachline(snapshottimesfile)
@@ -55,42 +173,111 @@ function calcwindowedstats(windowstart, windowend, snapshottimesfile,
 
         # if this snapshot is for a new patient...
         if mrn ≠ currentmrn
+            if patients ≠ nothing && currentmrn ≠ -1
+                # keep the state of the last patient for the next run (which
+                # leaves empty analysis windows)
+                patients[currentmrn] = savepatientstate!(windows, events,
+                    firstinwindow, nextforwindow, consumeduntil)
+            else
+                # start with empty analysis windows
+                for patientwindows in windows, window in patientwindows
+                    empty!(window)
+                end
+            end
             currentmrn = mrn
+            empty!(events)
+            fill!(firstinwindow, 1)
+            fill!(nextforwindow, 1)
+            consumeduntil = DateTime(Year(0))
 
-            # start with empty analysis windows
-            for window in windows
-                empty!(window)
+            if patients ≠ nothing && haskey(patients, mrn)
+                # resume from where the last run left off
+                state = patients[mrn]
+                for (patientwindows, savedwindows) in zip(windows, state.windows)
+                    for (id, window) in savedwindows
+                        patientwindows[id] = window
+                    end
+                end
+                append!(events, state.events)
+                firstinwindow .= state.firstinwindow
+                nextforwindow .= state.nextforwindow
+                consumeduntil = state.consumeduntil
             end
 
-            # advance the event stream to the events for this patient
-            empty!(eventsinwindow)
-            while nextevent.mrn < currentmrn
+            # jump straight to this patient's events (if any) when there is
+            # an index, rather than reading through everyone else's
+            if eventindex ≠ nothing
+                if haskey(eventindex, currentmrn)
+                    seek(eventsfile, eventindex[currentmrn])
+                else
+                    seekend(eventsfile)
+                end
+                nextevent = readevent(eventsfile, tokennames)
+            end
+
+            # advance the event stream to the events for this patient that
+            # haven't already been consumed (when resuming, the consumed
+            # events are still read, so with the full history of events this
+            # takes time in proportion to the history of the patients with
+            # snapshots rather than to the new events)
+            while (nextevent.mrn < currentmrn ||
+                   (nextevent.mrn == currentmrn &&
+                    nextevent.dts < consumeduntil))
                 nextevent = readevent(eventsfile, tokennames)
             end
         end
 
-        # consume any new events
+        # read any new events up to the end of the latest window
         while (nextevent.mrn == currentmrn && # while still on the same patient
-               nextevent.dts < dts + windowend) # and we're not past the window
-            # add this point to the appropriate window
-            push!(windows[nextevent.id], nextevent.dts, nextevent.value)
-            push!(eventsinwindow, nextevent)
+               nextevent.dts < dts + lastwindowend) # & not past the windows
+            push!(events, nextevent)
+            # a later run only skips the events that were actually read,
+            # rather than everything up to the end of the windows (which
+            # for a report can end after the last event of the export, so
+            # that the next export has new events before then)
+            consumeduntil = nextevent.dts + Millisecond(1)
             nextevent = readevent(eventsfile, tokennames)
         end
 
-        # remove any expired events
-        while (!isempty(eventsinwindow) && # while not at the end of the table
-               first(eventsinwindow).dts < dts + windowstart) # & out of window
-            # remove this point from the appropriate window
-            event = popfirst!(eventsinwindow)
-            pop!(windows[event.id], event.dts, event.value)
+        for (w, (windowstart, windowend)) in enumerate(windowranges)
+            # consume any new events
+            while (nextforwindow[w] ≤ length(events) && # while events remain
+                   events[nextforwindow[w]].dts < dts + windowend) # in window
+                # add this point to the appropriate window
+                event = events[nextforwindow[w]]
+                push!(windows[w][event.id], event.dts, event.value)
+                nextforwindow[w] += 1
+            end
+
+            # remove any expired events
+            while (firstinwindow[w] < nextforwindow[w] && # while not empty
+                   events[firstinwindow[w]].dts < dts + windowstart) # & expired
+                # remove this point from the appropriate window
+                event = events[firstinwindow[w]]
+                pop!(windows[w][event.id], event.dts, event.value)
+                firstinwindow[w] += 1
+            end
+
+            # fill in the row for the given snapshot
+            results = [measure for imeasure = 1:nummeasures
+                       for measure in
+                       (medstats ? allmedstats : allstats)(windows[w][imeasure])]
+            writefeaturerow(outfiles[w], binaries[w], mrn, dts, results)
+        end
+
+        # forget the events that have expired from every window (once there
+        # are enough of them to be worth moving the rest)
+        numexpired = minimum(firstinwindow) - 1
+        if numexpired > 1024 && 2 * numexpired > length(events)
+            deleteat!(events, 1:numexpired)
+            firstinwindow .-= numexpired
+            nextforwindow .-= numexpired
         end
+    end
 
-        # fill in the row for the given snapshot
-        results = [measure for imeasure = 1:nummeasures
-                   for measure in
-                   (medstats ? allmedstats : allstats)(windows[imeasure])]
-        write(outfile, "$mrn,$dts,$(join(results,","))\n")
+    if patients ≠ nothing && currentmrn ≠ -1
+        patients[currentmrn] = savepatientstate!(windows, events,
+            firstinwindow, nextforwindow, consumeduntil)
     end
 end
 
@@ -98,35 +285,48 @@ function parse_commandline()
     s = ArgParseSettings()
 
     @add_arg_table! s begin
-        "windowstart"
-            help = "offset of the beginning of the window (hours)"
-            arg_type = Int
-            required = true
-
-        "windowend"
-            help = "offset of the end of the window (hours)"
-            arg_type = Int
-            required = true
-
         "windowtimes"
             help = "file with MRN and times of each snapshot"
             required = true
 
         "tokenizedevents"
-            help = "file with MRNs, datetime stamps, measure, and values"
+            help = "file with MRNs, datetime stamps, measure, and values " *
+                "(CSV, or a binary event file ending with .events)"
             required = true
 
         "tokennamesfile"
             help = "file with names of all possible measures"
             required = true
 
-        "outfile"
-            help = "file to generate with windowed statistics"
+        "--window"
+            help = "offsets of the beginning and end of a window (hours), " *
+                "and the file to generate with its windowed statistics " *
+                "(in the binary feature format if it ends with .f32); " *
+                "give this once for each window (all of the windows are " *
+                "calculated in a single pass through the events)"
+            nargs = 3
+            action = :append_arg
             required = true
 
         "--medstats"
             help = "use logic for medications (e.g. assume missing data is 0)"
             action = :store_true
+
+        "--loadstate"
+            help = "file with the state of each patient's windows saved by " *
+                "an earlier run (with --savestate) to resume from; the " *
+                "events file then only needs the events of the saved " *
+                "patients since that run (but all of the events of any " *
+                "other patients)"
+
+        "--savestate"
+            help = "file to save the state of each patient's windows in " *
+                "after the last snapshot, so a later run can resume from it"
+
+        "--eventindex"
+            help = "index of where each patient's events start in the " *
+                "events file (from IndexEvents.jl), so that only the events " *
+                "of the patients with snapshots need to be read"
     end
 
     return parse_args(s)
@@ -136,18 +336,64 @@ function main()
     args = parse_commandline()
 
     tokennames = readtokennames(args["tokennamesfile"])
+    windowranges = [(Hour(parse(Int, windowstart)), Hour(parse(Int, windowend)))
+                    for (windowstart, windowend, outfilename) in args["window"]]
+
+    patients = nothing
+    if args["loadstate"] ≠ nothing
+        print("loading $(args["loadstate"])...\n")
+        checkpoint = deserialize(args["loadstate"])
+        @assert (checkpoint.windowranges == windowranges &&
+                 checkpoint.medstats == args["medstats"]) "saved state is for different windows"
+        patients = checkpoint.patients
+        if checkpoint.measures ≠ tokennames.names
+            remapmeasures!(patients, checkpoint.measures, tokennames)
+        end
+    elseif args["savestate"] ≠ nothing
+        patients = Dict{Int,PatientState}()
+    end
+
+    eventindex = nothing
+    if args["eventindex"] ≠ nothing
+        print("loading $(args["eventindex"])...\n")
+        eventindex = readeventindex(args["eventindex"])
+    end
 
-    print("generating $(args["outfile"])...\n")
+    outfilenames = [outfilename for (windowstart, windowend, outfilename)
+                    in args["window"]]
+    print("generating $(join(outfilenames, ", "))...\n")
     open(args["windowtimes"], "r") do windowtimesfile
-        open(args["tokenizedevents"], "r") do eventsfile
-            open(args["outfile"], "w") do outfile
-                calcwindowedstats(
-                    Hour(args["windowstart"]), Hour(args["windowend"]),
-                    windowtimesfile, eventsfile, tokennames, outfile,
-                    args["medstats"])
+        eventsfile = (isbinaryeventfile(args["tokenizedevents"]) ?
+                      openbinaryevents(args["tokenizedevents"]) :
+                      open(args["tokenizedevents"], "r"))
+        outfiles = [open(outfilename, "w") for outfilename in outfilenames]
+        try
+            calcwindowedstats(
+                windowranges, windowtimesfile, eventsfile, tokennames,
+                outfiles, isbinaryfeaturefile.(outfilenames),
+                args["medstats"], patients, eventindex)
+        finally
+            foreach(close, outfiles)
+            if eventsfile isa IO
+                close(eventsfile)
             end
         end
     end
+
+    if args["savestate"] ≠ nothing
+        # patients whose events have all expired are recalculated from their
+        # history if they have snapshots again, rather than kept forever
+        filter!(p -> !hasexpired(p.second), patients)
+        print("saving $(args["savestate"])...\n")
+        serialize(args["savestate"], Checkpoint(windowranges,
+            args["medstats"], tokennames.names, patients))
+        if !isempty(patients)
+            print("a run resuming from this state needs the events of the " *
+                  "saved patients from " *
+                  "$(minimum(p.consumeduntil for p in values(patients))) on " *
+                  "(and all of the events of any other patients)\n")
+        end
+    end
 end
 
 main()
@@ -7,6 +7,15 @@ import argparse
 
 startup_time = time.time()
 
+def save_folds(y, cvgroups, num_cv_groups, prefix):
+    # split the rows into folds in a single pass (keeping their order)
+    folds = dict(iter(y.groupby(cvgroups)))
+    for i in range(num_cv_groups):
+        #np.save(f'{prefix}y_fold{i}.npy', folds.get(i, y.iloc[:0]))
+        folds.get(i, y.iloc[:0]).to_csv(
+                f'{prefix}y_fold{i}.csv',
+                index=False, date_format="%Y-%m-%dT%H:%M:%S")
+
 def parse_arguments():
     argument_parser = argparse.ArgumentParser()
     argument_parser.add_argument('CAMFILE',
@@ -20,6 +29,9 @@ def parse_arguments():
     argument_parser.add_argument('--useholdout',
             help='use only the holdout set (otherwise exclude the holdout set)',
             action='store_true')
+    argument_parser.add_argument('--holdoutprefix',
+            help='also save the holdout set using this prefix (in the same ' +
+                'pass that saves the non-holdout set to TARGETPREFIX)')
 
     return argument_parser.parse_args()
 
@@ -37,17 +49,14 @@ if __name__ == "__main__":
 
 
     print(f"{time.time() - startup_time}: calculating groups")
-    mrn_to_holdout = dict(zip(grouptable['MRN'],grouptable['Holdout']))
-    mrn_to_cvgroup = dict(zip(grouptable['MRN'],grouptable['CVGroup']))
+    group_rows = pd.Index(grouptable['MRN']).get_indexer(ytable['MRN'])
     num_cv_groups = max(grouptable['CVGroup']) + 1
 
     # older data has MRNs with CAM screens but no demographics
     # once this is fixed we should remove the missing demographics
-    holdouts_alldata = ytable['MRN'].map(lambda mrn: mrn_to_holdout[mrn]
-        if mrn in mrn_to_holdout else True)
-    cv_groups_alldata = ytable['MRN'].map(lambda mrn: mrn_to_cvgroup[mrn]
-        if mrn in mrn_to_cvgroup else 0)
-    missing_demographics = ytable['MRN'].map(lambda mrn: not mrn in mrn_to_holdout)
+    missing_demographics = group_rows < 0
+    holdouts_alldata = np.asarray(grouptable['Holdout'])[group_rows]
+    cv_groups_alldata = np.asarray(grouptable['CVGroup'])[group_rows]
 
 
     print(f"{time.time() - startup_time}: generating X and y")
@@ -56,17 +65,14 @@ if __name__ == "__main__":
     y_raw = pd.DataFrame({'MRN':ytable['MRN'], 'DTS':ytable['DTS'],
             'y':ytable['CAM_max'] > 0})
 
-    # remove the holdout groups
-    if args.useholdout:
-        y = y_raw.loc[holdouts_alldata & ~missing_demographics]
-        cvgroups = cv_groups_alldata[holdouts_alldata & ~missing_demographics]
+    # the holdout set can be saved in the same pass as the other data
+    if args.holdoutprefix is not None:
+        outputs = [(False, args.TARGETPREFIX), (True, args.holdoutprefix)]
     else:
-        y = y_raw.loc[~holdouts_alldata & ~missing_demographics]
-        cvgroups = cv_groups_alldata[~holdouts_alldata & ~missing_demographics]
+        outputs = [(args.useholdout, args.TARGETPREFIX)]
 
     print(f"{time.time() - startup_time}: saving folds")
-    for i in range(num_cv_groups):
-        #np.save(f'{args.TARGETPREFIX}y_fold{i}.npy', y[cvgroups == i])
-        pd.DataFrame(y.loc[cvgroups == i]).to_csv(
-                f'{args.TARGETPREFIX}y_fold{i}.csv',
-                index=False, date_format="%Y-%m-%dT%H:%M:%S")
+    for holdout, prefix in outputs:
+        keep = (holdouts_alldata == holdout) & ~missing_demographics
+        save_folds(y_raw.loc[keep], cv_groups_alldata[keep], num_cv_groups,
+                prefix)
@@ -13,12 +13,52 @@ import os.path
 import argparse
 import pickle
 import sys
-from ROCPlot import cv_roc_plot, bootstrapped_roc_plot
-from PRPlot import cv_pr_plot, bootstrapped_pr_plot
-from CalibrationPlot import cv_calibration_plot, bootstrapped_calibration_plot
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from ROCPlot import (cv_roc_metrics, bootstrapped_roc_metrics,
+        roc_plot_from_metrics, ci_method_names)
+from PRPlot import cv_pr_metrics, bootstrapped_pr_metrics, pr_plot_from_metrics
+from CalibrationPlot import (cv_calibration_metrics,
+        bootstrapped_calibration_metrics, calibration_plot_from_metrics)
 
 startup_time = time.time()
 
+cv_metrics_functions = {
+    'roc': cv_roc_metrics,
+    'pr': cv_pr_metrics,
+    'calibration': cv_calibration_metrics,
+}
+
+bootstrapped_metrics_functions = {
+    'roc': bootstrapped_roc_metrics,
+    'pr': bootstrapped_pr_metrics,
+    'calibration': bootstrapped_calibration_metrics,
+}
+
+
+def load_bundle(filename):
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+def compute_cell(kind, num_bootstraps, seed, ci_method, y_file, yhat_file,
+        mrn_file=None):
+    """Load the bundles for a single grid square and compute its metrics (in
+    the same format as the files written by ComputeMetrics.py), so that only
+    one square's worth of data needs to be in memory at a time.
+    """
+    ys = load_bundle(y_file)
+    y_hats = load_bundle(yhat_file)
+    if num_bootstraps > 0 or ci_method != 'bootstrap':
+        mrns = None if mrn_file is None else load_bundle(mrn_file)[0]
+        options = {} if ci_method == 'bootstrap' else dict(ci_method=ci_method)
+        cell_metrics = bootstrapped_metrics_functions[kind](ys[0], y_hats[0],
+                num_bootstraps=num_bootstraps, mrns=mrns, seed=seed, **options)
+    else:
+        cell_metrics = cv_metrics_functions[kind](ys, y_hats)
+
+    return {'bootstraps': num_bootstraps, kind: cell_metrics}
+
 
 def parse_arguments():
     argument_parser = argparse.ArgumentParser()
@@ -26,24 +66,43 @@ def parse_arguments():
             help='names for each of the rows')
     argument_parser.add_argument('--colnames', nargs='+', required=True,
             help='names for each of the columns')
-    argument_parser.add_argument('--ys', nargs='+', required=True,
-            type=argparse.FileType('rb'),
+    argument_parser.add_argument('--ys', nargs='+',
             help='bundles of actual y values for each grid square')
-    argument_parser.add_argument('--yhats', nargs='+', required=True,
-            type=argparse.FileType('rb'),
+    argument_parser.add_argument('--yhats', nargs='+',
             help='bundles of predicted y values for each grid square')
+    argument_parser.add_argument('--metrics', nargs='+',
+            help='metrics files (from ComputeMetrics.py) for each grid ' +
+                'square, to plot instead of computing the curves from the ' +
+                'ys and yhats')
+    argument_parser.add_argument('--mrns', nargs='+',
+            help='bundles of MRNs for each grid square; if given, bootstrap ' +
+                'by resampling patients rather than individual rows')
+    argument_parser.add_argument('--seed', type=int, default=0,
+            help='random seed for the bootstraps')
+    argument_parser.add_argument('--workers', type=int, default=1,
+            help='number of processes to use for computing the grid squares')
     argument_parser.add_argument('--out',
             help='filename to use to save the grid plot')
     argument_parser.add_argument('--dpi', type=int, default=150,
             help='resolution of the final plot (dots per inch)')
     argument_parser.add_argument('--bootstraps', type=int, default=0,
             help='number of bootstraps to use for the confidence interval')
+    argument_parser.add_argument('--ci-method', choices=list(ci_method_names),
+            default='bootstrap',
+            help='method to use for the AUROC confidence intervals (the ' +
+                'DeLong method is only available for ROC curves)')
     argument_parser.add_argument('--precisionrecall', action='store_true',
             help='plot precision-recall curves instead of ROC curves')
     argument_parser.add_argument('--calibration', action='store_true',
             help='plot calibration curves instead of ROC curves')
 
-    return argument_parser.parse_args()
+    args = argument_parser.parse_args()
+    if args.metrics is None and (args.ys is None or args.yhats is None):
+        argument_parser.error('either --ys and --yhats or --metrics is required')
+    if args.ci_method != 'bootstrap' and (args.precisionrecall or args.calibration):
+        argument_parser.error(f'--ci-method {args.ci_method} is only available for ROC curves')
+
+    return args
 
 
 labelfont = {
@@ -60,66 +119,69 @@ if __name__ == "__main__":
 
     nrows = len(args.rownames)
     ncols = len(args.colnames)
-    if len(args.ys) != nrows * ncols:
-        print(f"Error: expected {nrows * ncols} ys, but received {len(args.ys)}")
-        sys.exit(1)
-    if len(args.yhats) != nrows * ncols:
-        print(f"Error: expected {nrows * ncols} yhats, but received {len(args.yhats)}")
-        sys.exit(1)
-
-    print(f"{time.time() - startup_time}: loading ys")
-    ys = np.array([pickle.load(y) for y in args.ys], dtype=object).reshape(nrows, ncols, -1)
-    print(f"{time.time() - startup_time}: loading y_hats")
-    y_hats = np.array([pickle.load(yhat) for yhat in args.yhats], dtype=object).reshape(nrows, ncols, -1)
-
-    print(f"{time.time() - startup_time}: generating plot")
-
+    if args.metrics is not None:
+        if len(args.metrics) != nrows * ncols:
+            print(f"Error: expected {nrows * ncols} metrics, but received {len(args.metrics)}")
+            sys.exit(1)
+    else:
+        if len(args.ys) != nrows * ncols:
+            print(f"Error: expected {nrows * ncols} ys, but received {len(args.ys)}")
+            sys.exit(1)
+        if len(args.yhats) != nrows * ncols:
+            print(f"Error: expected {nrows * ncols} yhats, but received {len(args.yhats)}")
+            sys.exit(1)
+        if args.mrns is not None and len(args.mrns) != nrows * ncols:
+            print(f"Error: expected {nrows * ncols} mrns, but received {len(args.mrns)}")
+            sys.exit(1)
 
     if args.precisionrecall:
+        kind = 'pr'
+        plotfunc = pr_plot_from_metrics
         xlabel='Recall'
         ylabel='Precision'
         ylabel2=''
     elif args.calibration:
+        kind = 'calibration'
+        plotfunc = calibration_plot_from_metrics
         xlabel='Predicted Probability'
         ylabel=('Observed Probability', '')
         ylabel2=('', 'Predictions in bin')
     else:
+        kind = 'roc'
+        plotfunc = roc_plot_from_metrics
         xlabel='False positive rate'
         ylabel='True positive rate'
         ylabel2=''
 
-    if args.bootstraps == 0:
-        if args.precisionrecall:
-            plotfunc = cv_pr_plot
-        elif args.calibration:
-            plotfunc = cv_calibration_plot
-        else:
-            plotfunc = cv_roc_plot
+    # each grid square is loaded (or computed) on demand, so that memory use
+    # scales with a single square rather than the whole grid
+    pool = None
+    if args.metrics is not None:
+        cells = map(load_bundle, args.metrics)
     else:
-        if args.precisionrecall:
-            plotfunc = lambda ax, ys, y_hats, xlabel, ylabel,legend : (
-                bootstrapped_pr_plot(ax, ys[0], y_hats[0], xlabel, ylabel,
-                legend=legend, num_bootstraps=args.bootstraps))
-        elif args.calibration:
-            plotfunc = lambda ax, ys, y_hats, xlabel, ylabel,legend : (
-                bootstrapped_calibration_plot(ax, ys[0], y_hats[0], xlabel, ylabel,
-                legend=legend, num_bootstraps=args.bootstraps))
+        mrn_files = args.mrns if args.mrns is not None else [None] * (nrows * ncols)
+        compute = partial(compute_cell, kind, args.bootstraps, args.seed,
+                args.ci_method)
+        if args.workers <= 1:
+            cells = map(compute, args.ys, args.yhats, mrn_files)
         else:
-            plotfunc = lambda ax, ys, y_hats, xlabel, ylabel,legend : (
-                bootstrapped_roc_plot(ax, ys[0], y_hats[0], xlabel, ylabel,
-                legend=legend, num_bootstraps=args.bootstraps))
+            pool = ProcessPoolExecutor(args.workers)
+            cells = pool.map(compute, args.ys, args.yhats, mrn_files)
 
     fig,axs = plt.subplots(nrows, ncols, figsize=(3*ncols,3*nrows), sharex=True, sharey=True,
             gridspec_kw=dict(wspace=0.1, hspace=0.1))
-    for i in range(nrows):
-        for j in range(ncols):
-            plotfunc(axs[i,j],ys[i,j], y_hats[i,j],
-                    xlabel=xlabel if i == nrows-1 else '',
-                    ylabel=ylabel if j == 0 else ylabel2 if j == ncols-1 else '',
-                    legend=False)
-            axs[i,j].tick_params(labelsize="small")
-            axs[i,j].spines['top'].set_visible(False)
-            axs[i,j].spines['right'].set_visible(False)
+    for k, cell_metrics in enumerate(cells):
+        i, j = divmod(k, ncols)
+        print(f"{time.time() - startup_time}: plotting row {i} column {j}")
+        plotfunc(axs[i,j], cell_metrics,
+                xlabel=xlabel if i == nrows-1 else '',
+                ylabel=ylabel if j == 0 else ylabel2 if j == ncols-1 else '',
+                legend=False)
+        axs[i,j].tick_params(labelsize="small")
+        axs[i,j].spines['top'].set_visible(False)
+        axs[i,j].spines['right'].set_visible(False)
+    if pool is not None:
+        pool.shutdown()
     for j in range(ncols):
         #plt.figtext(0.255 + 0.265*j, 0.90, args.colnames[j], ha="center", rotation=0, fontdict=labelfont)
         #axs[-1,j].set_xlabel(xlabel)
@@ -1,28 +1,29 @@
 #!/usr/bin/julia
 using ArgParse
+include("FeatureFiles.jl")
 
 function parse_commandline()
     s = ArgParseSettings()
 
     @add_arg_table! s begin
         "sourcefiles"
-            help = "files with features, all sharing the same MRN and DTS columns"
+            help = "files with features, all sharing the same MRN and DTS " *
+                "columns (CSV, or binary feature files ending with .f32)"
             nargs = '+'
             required = true
 
         "--output","-o"
-            help = "file to generate with the merged features"
+            help = "file to generate with the merged features (in the " *
+                "binary feature format if it ends with .f32)"
             required = true
     end
 
     return parse_args(s)
 end
 
-function main()
-    args = parse_commandline()
-
-    sourcefiles = [open(filename,"r") for filename in args["sourcefiles"]]
-    outfile = open(args["output"], "w")
+function hcattext(sourcefilenames, outfilename)
+    sourcefiles = [open(filename,"r") for filename in sourcefilenames]
+    outfile = open(outfilename, "w")
 
     # read the headers
     headersets = [split(readline(f),",") for f in sourcefiles]
@@ -54,4 +55,46 @@ function main()
     end
 end
 
+function hcatrows(sourcefilenames, binaries, outfilename, outbinary)
+    sourcefiles = [open(filename,"r") for filename in sourcefilenames]
+    outfile = open(outfilename, "w")
+
+    # read the headers, and write the merged headers
+    headersets = [readfeatureheader(f, binary)
+                  for (f, binary) in zip(sourcefiles, binaries)]
+    writefeatureheader(outfile, outbinary,
+        ["MRN"; "DTS"; [name for headerset in headersets
+                        for name in headerset[3:end]]])
+
+    rowsets = [Vector{Float32}(undef, length(headerset) - 2)
+               for headerset in headersets]
+    linenum = 1
+    while !eof(sourcefiles[1])
+        linenum += 1
+        if (linenum % 1000) == 0
+            print("processing line $linenum...\n")
+        end
+        mrn, dts = readfeaturerow!(rowsets[1], sourcefiles[1], binaries[1])
+        for i in 2:length(sourcefiles)
+            @assert readfeaturerow!(rowsets[i], sourcefiles[i],
+                                    binaries[i]) == (mrn, dts)
+        end
+        writefeaturerow(outfile, outbinary, mrn, dts, vcat(rowsets...))
+    end
+    close(outfile)
+end
+
+function main()
+    args = parse_commandline()
+
+    binaries = isbinaryfeaturefile.(args["sourcefiles"])
+    outbinary = isbinaryfeaturefile(args["output"])
+    if !any(binaries) && !outbinary
+        # CSV lines can simply be joined without parsing the features
+        hcattext(args["sourcefiles"], args["output"])
+    else
+        hcatrows(args["sourcefiles"], binaries, args["output"], outbinary)
+    end
+end
+
 main()
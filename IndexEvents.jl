@@ -0,0 +1,94 @@
+#!/usr/bin/julia
+using ArgParse
+using Dates
+include("EventFiles.jl")
+
+# Generates an index of where each patient's events start in a tokenized
+# event file (CSV or binary), so that GenerateWindowedStatistics.jl can seek
+# straight to the events of the patients it needs (e.g. the current census for
+# a report) rather than reading the whole history of every patient.
+
+function parse_commandline()
+    s = ArgParseSettings()
+
+    @add_arg_table! s begin
+        "tokenizedevents"
+            help = "file with MRNs, datetime stamps, measure, and values, " *
+                "sorted by MRN (CSV, or a binary event file ending with " *
+                ".events)"
+            required = true
+
+        "indexfile"
+            help = "file to generate with the byte offset of the first " *
+                "event of each MRN and the number of events"
+            required = true
+    end
+
+    return parse_args(s)
+end
+
+# the patient whose events are currently being indexed
+mutable struct PatientIndex
+    mrn::Int
+    offset::Int    # byte offset of their first event
+    numevents::Int
+end
+
+function writepatient(indexfile, patient::PatientIndex)
+    if patient.numevents > 0
+        write(indexfile, "$(patient.mrn),$(patient.offset),$(patient.numevents)\n")
+    end
+end
+
+# count an event with the given offset and MRN, writing the index of the last
+# patient when a new one starts
+function addevent!(indexfile, patient::PatientIndex, offset, mrn)
+    if mrn ≠ patient.mrn
+        @assert patient.numevents == 0 || mrn > patient.mrn "events are not sorted by MRN"
+        writepatient(indexfile, patient)
+        patient.mrn = mrn
+        patient.offset = offset
+        patient.numevents = 0
+    end
+    patient.numevents += 1
+end
+
+function indexevents(indexfile, events::BinaryEventFile)
+    patient = PatientIndex(-1, 0, 0)
+    while !eof(events)
+        offset = position(events)
+        mrn, dts, id, value = readbinaryevent(events)
+        addevent!(indexfile, patient, offset, mrn)
+    end
+    writepatient(indexfile, patient)
+end
+
+function indexevents(indexfile, events::IO)
+    header = readline(events)
+    @assert header == "MRN,DTS,MEASURE,VALUE"
+    patient = PatientIndex(-1, 0, 0)
+    while !eof(events)
+        offset = position(events)
+        line = readline(events)
+        mrn = parse(Int, line[1:findfirst(isequal(','), line) - 1])
+        addevent!(indexfile, patient, offset, mrn)
+    end
+    writepatient(indexfile, patient)
+end
+
+function main()
+    args = parse_commandline()
+
+    print("generating $(args["indexfile"])...\n")
+    open(args["indexfile"], "w") do indexfile
+        write(indexfile, "MRN,OFFSET,NUMEVENTS\n")
+        if isbinaryeventfile(args["tokenizedevents"])
+            indexevents(indexfile, openbinaryevents(args["tokenizedevents"]))
+        else
+            open(events -> indexevents(indexfile, events),
+                 args["tokenizedevents"], "r")
+        end
+    end
+end
+
+main()
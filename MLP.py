@@ -12,6 +12,8 @@ import warnings
 import pickle
 import argparse
 import json
+from RowMasks import apply_rowmasks
+from CleaningTransformer import stack_features
 import pandas as pd
 
 startup_time = time.time()
@@ -36,6 +38,14 @@ def parse_arguments():
             help='pairs of X and y datafiles used to train the model')
     subparser_train.add_argument('MODELFILE',
             help='filename to use to save the trained model\'s parameters')
+    subparser_train.add_argument('--cleaningmodel',
+            help='cleaning model (from CleanInputs.jl) to apply to the ' +
+                'X datafiles as they are loaded, rather than loading ' +
+                'cleaned datafiles')
+    subparser_train.add_argument('--rowmask', nargs='+',
+            help='row mask files (from GenerateRowMasks.py), one for each ' +
+                'X datafile, selecting the rows to use as they are loaded, ' +
+                'rather than loading subsets of the datafiles')
 
     subparser_apply = subparsers.add_parser('apply',
             help='apply the model to a given dataset')
@@ -46,6 +56,14 @@ def parse_arguments():
             help='file with inputs to use for the model')
     subparser_apply.add_argument('OUTFILE',
             help='file to save the predicted outputs')
+    subparser_apply.add_argument('--cleaningmodel',
+            help='cleaning model (from CleanInputs.jl) to apply to the ' +
+                'X datafiles as they are loaded, rather than loading ' +
+                'cleaned datafiles')
+    subparser_apply.add_argument('--rowmask', nargs='+',
+            help='row mask files (from GenerateRowMasks.py), one for each ' +
+                'X datafile, selecting the rows to use as they are loaded, ' +
+                'rather than loading subsets of the datafiles')
 
     return argument_parser.parse_args()
 
@@ -70,7 +88,8 @@ if __name__ == "__main__":
         print(f"{time.time() - startup_time}: loading X")
         X_dataframes = [pd.read_csv(f, parse_dates=["DTS"])
                 for f in args.DATAFILE[0::2]]
-        X = np.vstack([np.asarray(df.iloc[:,2:]) for df in X_dataframes])
+        X_dataframes = apply_rowmasks(X_dataframes, args.rowmask)
+        X = stack_features(X_dataframes, args.cleaningmodel)
         del X_dataframes # these are large, so we try to free the memory
         print(f"{time.time() - startup_time}: loading y")
         y_dataframes = [pd.read_csv(f, parse_dates=["DTS"])
@@ -100,7 +119,8 @@ if __name__ == "__main__":
         print(f"{time.time() - startup_time}: loading X")
         X_dataframes = [pd.read_csv(f, parse_dates=["DTS"])
                 for f in args.DATAFILE]
-        X = np.vstack([np.asarray(df.iloc[:,2:]) for df in X_dataframes])
+        X_dataframes = apply_rowmasks(X_dataframes, args.rowmask)
+        X = stack_features(X_dataframes, args.cleaningmodel)
         mrndts = pd.concat([df[["MRN","DTS"]] for df in X_dataframes],
                 axis=0).reset_index(drop=True)
         del X_dataframes # these are large, so we try to free the memory
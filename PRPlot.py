@@ -7,17 +7,68 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import sklearn
 from sklearn.metrics import precision_recall_curve, auc
-from sklearn.utils import resample
 import time
 import os.path
 import argparse
 import pickle
+from Bootstrap import PatientClusters, chunk_size_for, run_bootstraps
 
 startup_time = time.time()
 
-def bootstrapped_pr_plot(ax, ys, y_hats, xlabel='Recall (true positive rate)', 
-        ylabel='Precision (positive predictive value)', legend=True,
-        num_bootstraps=1000):
+def pr_replicates(data, rngs):
+    clusters, pos_hist, neg_hist, interp_recall = data
+
+    # tally the cases at each score for all of the replicates in this chunk
+    weights = clusters.resampling_weights(rngs)
+    pos_counts = pos_hist @ weights
+    neg_counts = neg_hist @ weights
+    tps = np.cumsum(pos_counts, axis=0)
+    fps = np.cumsum(neg_counts, axis=0)
+
+    replicates = []
+    for i in range(weights.shape[1]):
+        # skip scores that only belong to patients not drawn in this
+        # replicate, and stop once every positive has been recalled (as
+        # precision_recall_curve does)
+        present = (pos_counts[:,i] + neg_counts[:,i]) > 0
+        tp = tps[present,i]
+        fp = fps[present,i]
+        last = np.searchsorted(tp, tp[-1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.concatenate([[1.], tp[:last+1] / (tp + fp)[:last+1]])
+            recall = np.concatenate([[0.], tp[:last+1] / tp[-1]])
+
+        # interpolate the curve onto a single x-axis so that we can then
+        # calculate some statistics on the y-axis
+        replicates.append((np.interp(interp_recall, recall, precision),
+            auc(recall, precision) if tp[-1] > 0 else np.nan))
+
+    return replicates
+
+
+def bootstrap_pr_curves(ys, y_hats, mrns, interp_recall, num_bootstraps=1000,
+        seed=0, num_workers=1):
+    clusters = PatientClusters(mrns)
+
+    # collapse the rows into per-patient counts of positive and negative
+    # cases at each distinct score (ordered from the highest score down)
+    thresholds, score_bins = np.unique(-np.asarray(y_hats),
+            return_inverse=True)
+    positives = np.asarray(ys, dtype=float)
+    pos_hist = clusters.histogram(score_bins, len(thresholds), positives)
+    neg_hist = clusters.histogram(score_bins, len(thresholds), 1 - positives)
+
+    replicates = run_bootstraps(pr_replicates,
+            (clusters, pos_hist, neg_hist, interp_recall), num_bootstraps,
+            seed=seed, num_workers=num_workers,
+            chunk_size=chunk_size_for(len(thresholds), clusters.num_patients))
+    interp_precision_bootstraps, aucs = zip(*replicates)
+
+    return np.array(interp_precision_bootstraps), np.array(aucs)
+
+
+def bootstrapped_pr_metrics(ys, y_hats, num_bootstraps=1000, mrns=None,
+        seed=0, num_workers=1):
 
     alpha = 0.05 # 1 - (confidence interval = 95%)
 
@@ -25,31 +76,41 @@ def bootstrapped_pr_plot(ax, ys, y_hats, xlabel='Recall (true positive rate)',
     precision, recall, thresh = precision_recall_curve(ys, y_hats)
     main_auc = auc(recall, precision)
 
-    # generate the bootstrap samples
-    bootstrap_samples = [resample(ys, y_hats) for i in range(num_bootstraps)]
+    # resample whole patients if we know them (since days from the same
+    # patient are correlated), otherwise treat each row as its own patient
+    if mrns is None:
+        mrns = np.arange(len(ys))
 
     # generate the bootstrap curves
-    bootstrapped_pr_curves = [precision_recall_curve(y, y_hat) for y, y_hat
-        in bootstrap_samples]
-
-    # interpolate the bootstrap curves onto a single x-axis so that we can
-    # then calculate some statistics on the y-axis
     interp_recall = np.linspace(0., 1., 1000)
-    interp_precision_bootstraps = np.array([np.interp(interp_recall, recall[::-1], precision[::-1])
-        for precision, recall, thresh in bootstrapped_pr_curves])
+    interp_precision_bootstraps, aucs = bootstrap_pr_curves(ys, y_hats, mrns,
+            interp_recall, num_bootstraps=num_bootstraps, seed=seed,
+            num_workers=num_workers)
+
     pr_ci_low, pr_ci_high = np.quantile(
         interp_precision_bootstraps, [alpha/2, 1 - alpha/2], axis=0)
-    aucs = [auc(recall, precision) for precision, recall, thresh in bootstrapped_pr_curves]
     auc_ci_low, auc_ci_high = np.quantile(
         aucs, [alpha/2, 1 - alpha/2], axis=0)
+
+    return dict(alpha=alpha, precision=precision, recall=recall,
+            auc=main_auc, incidence=np.mean(ys), interp_recall=interp_recall,
+            pr_ci=(pr_ci_low, pr_ci_high), auc_ci=(auc_ci_low, auc_ci_high))
+
+
+def render_bootstrapped_pr(ax, metrics, xlabel='Recall (true positive rate)',
+        ylabel='Precision (positive predictive value)', legend=True):
+    alpha = metrics['alpha']
+    main_auc = metrics['auc']
+    pr_ci_low, pr_ci_high = metrics['pr_ci']
+    auc_ci_low, auc_ci_high = metrics['auc_ci']
     ci_precision = 2 if auc_ci_high - auc_ci_low > 0.02 else 3
 
     # plot the grey +/- one SD range
-    ax.fill_between(interp_recall, pr_ci_low, pr_ci_high,
+    ax.fill_between(metrics['interp_recall'], pr_ci_low, pr_ci_high,
             color="grey", alpha=0.2, label=f'{100*(1 - alpha):.0f}% confidence interval')
     # plot the mean PR
-    ax.plot(recall, precision,
-            label=f'PR curve (AUPRC {main_auc:.2f} ({auc_ci_low:.{ci_precision}f},{auc_ci_high:.{ci_precision}f})) (Incidence: {np.mean(ys):.2f})')
+    ax.plot(metrics['recall'], metrics['precision'],
+            label=f'PR curve (AUPRC {main_auc:.2f} ({auc_ci_low:.{ci_precision}f},{auc_ci_high:.{ci_precision}f})) (Incidence: {metrics["incidence"]:.2f})')
     #ax.set_xlim(0, 1)
     #ax.set_ylim(0, 1)
 
@@ -64,8 +125,17 @@ def bootstrapped_pr_plot(ax, ys, y_hats, xlabel='Recall (true positive rate)',
     ax.set(xlabel=xlabel, ylabel=ylabel)
 
 
-def cv_pr_plot(ax, ys, y_hats, xlabel='Recall (true positive rate)', 
-        ylabel='Precision (positive predictive value)', legend=True):
+def bootstrapped_pr_plot(ax, ys, y_hats, xlabel='Recall (true positive rate)', 
+        ylabel='Precision (positive predictive value)', legend=True,
+        num_bootstraps=1000, mrns=None, seed=0, num_workers=1):
+    metrics = bootstrapped_pr_metrics(ys, y_hats,
+            num_bootstraps=num_bootstraps, mrns=mrns, seed=seed,
+            num_workers=num_workers)
+    render_bootstrapped_pr(ax, metrics, xlabel=xlabel, ylabel=ylabel,
+            legend=legend)
+
+
+def cv_pr_metrics(ys, y_hats):
     # generate the PR curves for each fold
     pr_curves = [precision_recall_curve(y, y_hat) for y, y_hat in zip(ys, y_hats)]
 
@@ -78,12 +148,26 @@ def cv_pr_plot(ax, ys, y_hats, xlabel='Recall (true positive rate)',
     sd_precision = (np.var(interp_precision_cvs, axis=0))**0.5
     aucs = [auc(recall, precision) for precision, recall, thresh in pr_curves]
 
+    return dict(
+            fold_curves=[(precision, recall)
+                for precision, recall, thresh in pr_curves],
+            interp_recall=interp_recall, mean_precision=mean_precision,
+            sd_precision=sd_precision, aucs=aucs)
+
+
+def render_cv_pr(ax, metrics, xlabel='Recall (true positive rate)',
+        ylabel='Precision (positive predictive value)', legend=True):
+    interp_recall = metrics['interp_recall']
+    mean_precision = metrics['mean_precision']
+    sd_precision = metrics['sd_precision']
+    aucs = metrics['aucs']
+
     # plot the grey +/- one SD range
     ax.fill_between(interp_recall, np.minimum(mean_precision + sd_precision, 1), np.maximum(mean_precision - sd_precision, 0),
         color="grey", alpha=0.2, label="mean PR +/- 1 SD")
     # plot the PR curve for each fold
     first_fold = True
-    for precision, recall, thresh in pr_curves:
+    for precision, recall in metrics['fold_curves']:
         ax.plot(recall, precision, color='blue', alpha=0.05,
             label="PR for each fold in cross validation" if first_fold else None)
         first_fold = False
@@ -99,12 +183,26 @@ def cv_pr_plot(ax, ys, y_hats, xlabel='Recall (true positive rate)',
     ax.set(xlabel=xlabel, ylabel=ylabel)
 
 
+def cv_pr_plot(ax, ys, y_hats, xlabel='Recall (true positive rate)', 
+        ylabel='Precision (positive predictive value)', legend=True):
+    render_cv_pr(ax, cv_pr_metrics(ys, y_hats), xlabel=xlabel,
+            ylabel=ylabel, legend=legend)
+
+
+def pr_plot_from_metrics(ax, metrics, **kwargs):
+    # metrics files hold the results for every kind of plot
+    if metrics['bootstraps'] > 0:
+        render_bootstrapped_pr(ax, metrics['pr'], **kwargs)
+    else:
+        render_cv_pr(ax, metrics['pr'], **kwargs)
+
+
 def parse_arguments():
     argument_parser = argparse.ArgumentParser()
-    argument_parser.add_argument('YS',
+    argument_parser.add_argument('YS', nargs='?',
             type=argparse.FileType('rb'),
             help='bundle of actual y values for each fold')
-    argument_parser.add_argument('YHATS',
+    argument_parser.add_argument('YHATS', nargs='?',
             type=argparse.FileType('rb'),
             help='bundle of predicted y values for each fold')
     argument_parser.add_argument('PLOTFILE',
@@ -113,8 +211,24 @@ def parse_arguments():
     argument_parser.add_argument('--dpi', type=int, default=150)
     argument_parser.add_argument('--bootstraps', type=int, default=0,
             help='number of bootstraps to use for confidence intervals')
+    argument_parser.add_argument('--mrns',
+            type=argparse.FileType('rb'),
+            help='bundle of MRNs for each fold; if given, bootstrap by ' +
+                'resampling patients rather than individual rows')
+    argument_parser.add_argument('--seed', type=int, default=0,
+            help='random seed for the bootstraps')
+    argument_parser.add_argument('--workers', type=int, default=1,
+            help='number of processes to use for the bootstraps')
+    argument_parser.add_argument('--metrics',
+            type=argparse.FileType('rb'),
+            help='metrics file (from ComputeMetrics.py) to plot instead of ' +
+                'computing the curves from YS and YHATS')
 
-    return argument_parser.parse_args()
+    args = argument_parser.parse_args()
+    if args.metrics is None and args.YHATS is None:
+        argument_parser.error('either YS and YHATS or --metrics is required')
+
+    return args
 
 
 if __name__ == "__main__":
@@ -122,16 +236,27 @@ if __name__ == "__main__":
     args = parse_arguments()
     #print(args)
 
-    print(f"{time.time() - startup_time}: loading ys")
-    ys = pickle.load(args.YS)
-    print(f"{time.time() - startup_time}: loading y_hats")
-    y_hats = pickle.load(args.YHATS)
+    if args.metrics is not None:
+        print(f"{time.time() - startup_time}: loading metrics")
+        metrics = pickle.load(args.metrics)
+    else:
+        print(f"{time.time() - startup_time}: loading ys")
+        ys = pickle.load(args.YS)
+        print(f"{time.time() - startup_time}: loading y_hats")
+        y_hats = pickle.load(args.YHATS)
+        if args.mrns is not None:
+            print(f"{time.time() - startup_time}: loading mrns")
+            mrns = pickle.load(args.mrns)
 
     print(f"{time.time() - startup_time}: generating plot")
     fig,ax = plt.subplots(figsize=(7,7))
     ax.set_title(args.title)
-    if args.bootstraps > 0:
-        bootstrapped_pr_plot(ax, ys[0], y_hats[0], num_bootstraps=args.bootstraps)
+    if args.metrics is not None:
+        pr_plot_from_metrics(ax, metrics)
+    elif args.bootstraps > 0:
+        bootstrapped_pr_plot(ax, ys[0], y_hats[0], num_bootstraps=args.bootstraps,
+                mrns=None if args.mrns is None else mrns[0],
+                seed=args.seed, num_workers=args.workers)
     else:
         cv_pr_plot(ax, ys, y_hats)
     plt.savefig(args.PLOTFILE, bbox_inches='tight', dpi=args.dpi)
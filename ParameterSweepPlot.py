@@ -38,14 +38,21 @@ def parameter_sweep_plot(paramvals, aucs):
 
 def parse_arguments():
     argument_parser = argparse.ArgumentParser()
-    argument_parser.add_argument('INPUTS', nargs='+',
+    argument_parser.add_argument('INPUTS', nargs='*',
             help='pairs of x-values and auc datafiles')
     argument_parser.add_argument('PLOTFILE',
             help='filename to use to save the ROC plot')
     argument_parser.add_argument('--title', type=str, default="ROC")
     argument_parser.add_argument('--dpi', type=int, default=150)
+    argument_parser.add_argument('--table',
+            help='table of x-values and aucs (from SummarizeAUCs.py ' +
+                '--paramvals) to use instead of INPUTS')
 
-    return argument_parser.parse_args()
+    args = argument_parser.parse_args()
+    if args.table is None and len(args.INPUTS) == 0:
+        argument_parser.error('either INPUTS or --table is required')
+
+    return args
 
 
 if __name__ == "__main__":
@@ -53,10 +60,14 @@ if __name__ == "__main__":
     args = parse_arguments()
     #print(args)
 
-    paramvals = np.asarray([float(val) for val in args.INPUTS[0::2]])
-
     print(f"{time.time() - startup_time}: loading aucs")
-    aucs = np.asarray([np.loadtxt(filename) for filename in args.INPUTS[1::2]])
+    if args.table is not None:
+        table = np.loadtxt(args.table, ndmin=2)
+        paramvals = table[:,0]
+        aucs = table[:,1:]
+    else:
+        paramvals = np.asarray([float(val) for val in args.INPUTS[0::2]])
+        aucs = np.asarray([np.loadtxt(filename) for filename in args.INPUTS[1::2]])
 
     print(f"{time.time() - startup_time}: generating plot")
     plt.figure(figsize=(7,7))
@@ -0,0 +1,116 @@
+# An approximation of the distribution of a stream of values (a "merging
+# t-digest"), from which quantiles can be estimated.  Unlike P2Quantile, two
+# digests can be merged into a digest of all of their values, so the
+# statistics of several files can be calculated separately and combined.
+#
+# The values are summarized by centroids (a mean and a weight), which are kept
+# small near the tails of the distribution and larger near the median; the
+# compression limits the number of centroids to roughly compression/2.
+mutable struct TDigest
+    compression::Float64
+    means::Vector{Float64}    # the centroids, sorted by their means
+    weights::Vector{Float64}
+    buffer::Vector{Float32}   # values not yet merged into the centroids
+    min::Float64
+    max::Float64
+end
+
+TDigest(compression=100.0) = TDigest(compression, Float64[], Float64[],
+                                     Float32[], Inf, -Inf)
+
+# the number of values to buffer before merging them into the centroids
+buffersize(d::TDigest) = round(Int, 5 * d.compression)
+
+# the scale function, which maps a quantile onto the index of a centroid;
+# neighbouring centroids are merged if they would span less than one index
+scale(d::TDigest, q) = d.compression / (2π) * asin(2 * clamp(q, 0, 1) - 1)
+
+Base.isempty(d::TDigest) = isempty(d.weights) && isempty(d.buffer)
+
+function fit!(d::TDigest, value::Real)
+    push!(d.buffer, value)
+    d.min = min(d.min, value)
+    d.max = max(d.max, value)
+    if length(d.buffer) ≥ buffersize(d)
+        compress!(d)
+    end
+    return d
+end
+
+# merge the given centroids (in any order) into the digest's centroids
+function mergecentroids!(d::TDigest, means, weights)
+    order = sortperm(means)
+    means = means[order]
+    weights = weights[order]
+    total = sum(weights)
+
+    empty!(d.means)
+    empty!(d.weights)
+    weightbefore = 0.0 # the total weight of the earlier centroids
+    for (mean, weight) in zip(means, weights)
+        if (!isempty(d.weights) &&
+            scale(d, (weightbefore + d.weights[end] + weight) / total) -
+            scale(d, weightbefore / total) ≤ 1)
+            # add this to the last centroid
+            d.weights[end] += weight
+            d.means[end] += (mean - d.means[end]) * weight / d.weights[end]
+        else
+            # start a new centroid
+            if !isempty(d.weights)
+                weightbefore += d.weights[end]
+            end
+            push!(d.means, mean)
+            push!(d.weights, weight)
+        end
+    end
+    return d
+end
+
+# merge the buffered values into the centroids
+function compress!(d::TDigest)
+    if !isempty(d.buffer)
+        mergecentroids!(d, [d.means; d.buffer],
+                        [d.weights; ones(length(d.buffer))])
+        empty!(d.buffer)
+    end
+    return d
+end
+
+function Base.merge!(d::TDigest, other::TDigest)
+    compress!(d)
+    compress!(other)
+    if !isempty(other.weights)
+        mergecentroids!(d, [d.means; other.means], [d.weights; other.weights])
+        d.min = min(d.min, other.min)
+        d.max = max(d.max, other.max)
+    end
+    return d
+end
+
+# an estimate of the q quantile, interpolating between the centres of the
+# centroids (or 0 if there are no values, as with P2Quantile)
+function quantile(d::TDigest, q::Real)
+    compress!(d)
+    if isempty(d.weights)
+        return 0.0
+    end
+
+    target = clamp(q, 0, 1) * sum(d.weights)
+    centre = d.weights[1] / 2
+    if target < centre
+        # between the minimum and the first centroid
+        return d.min + (d.means[1] - d.min) * target / centre
+    end
+    for i in 2:length(d.weights)
+        nextcentre = centre + (d.weights[i-1] + d.weights[i]) / 2
+        if target ≤ nextcentre
+            return (d.means[i-1] + (d.means[i] - d.means[i-1]) *
+                    (target - centre) / (nextcentre - centre))
+        end
+        centre = nextcentre
+    end
+    # between the last centroid and the maximum
+    lastweight = d.weights[end] / 2
+    return (d.means[end] + (d.max - d.means[end]) *
+            min(1, (target - centre) / lastweight))
+end
@@ -8,17 +8,63 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import sklearn
 from sklearn.metrics import roc_curve, auc, roc_auc_score
-from sklearn.utils import resample
 import time
 import os.path
 import argparse
 import pickle
+from Bootstrap import (PatientClusters, chunk_size_for, run_bootstraps,
+        trapezoid_area)
+from RankAUC import delong_auc_ci
 
 startup_time = time.time()
 
-def bootstrapped_roc_plot(ax, ys, y_hats, xlabel="False Positive Rate",
-        ylabel="True Positive Rate", legend=True,
-        num_bootstraps=1000):
+ci_method_names = {
+    'bootstrap': 'bootstrap',
+    'delong': 'DeLong',
+}
+
+def roc_replicates(data, rngs):
+    clusters, pos_hist, neg_hist, interp_fpr = data
+
+    # build the ROC curves of all of the replicates in this chunk at once
+    weights = clusters.resampling_weights(rngs)
+    origin = np.zeros((1, weights.shape[1]))
+    tps = np.vstack([origin, np.cumsum(pos_hist @ weights, axis=0)])
+    fps = np.vstack([origin, np.cumsum(neg_hist @ weights, axis=0)])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tpr = tps / tps[-1]
+        fpr = fps / fps[-1]
+    aucs = trapezoid_area(fpr, tpr)
+
+    # interpolate the curves onto a single x-axis so that we can then
+    # calculate some statistics on the y-axis
+    return [(np.interp(interp_fpr, fpr[:,i], tpr[:,i]), aucs[i])
+            for i in range(weights.shape[1])]
+
+
+def bootstrap_roc_curves(ys, y_hats, mrns, interp_fpr, num_bootstraps=1000,
+        seed=0, num_workers=1):
+    clusters = PatientClusters(mrns)
+
+    # collapse the rows into per-patient counts of positive and negative
+    # cases at each distinct score (ordered from the highest score down)
+    thresholds, score_bins = np.unique(-np.asarray(y_hats),
+            return_inverse=True)
+    positives = np.asarray(ys, dtype=float)
+    pos_hist = clusters.histogram(score_bins, len(thresholds), positives)
+    neg_hist = clusters.histogram(score_bins, len(thresholds), 1 - positives)
+
+    replicates = run_bootstraps(roc_replicates,
+            (clusters, pos_hist, neg_hist, interp_fpr), num_bootstraps,
+            seed=seed, num_workers=num_workers,
+            chunk_size=chunk_size_for(len(thresholds), clusters.num_patients))
+    interp_tpr_bootstraps, aucs = zip(*replicates)
+
+    return np.array(interp_tpr_bootstraps), np.array(aucs)
+
+
+def bootstrapped_roc_metrics(ys, y_hats, num_bootstraps=1000, mrns=None,
+        seed=0, num_workers=1, ci_method='bootstrap'):
 
     alpha = 0.05 # 1 - (confidence interval = 95%)
 
@@ -26,33 +72,53 @@ def bootstrapped_roc_plot(ax, ys, y_hats, xlabel="False Positive Rate",
     fpr, tpr, thresh = roc_curve(ys, y_hats)
     main_auc = auc(fpr, tpr)
 
-    # generate the bootstrap samples
-    bootstrap_samples = [resample(ys, y_hats, random_state=i) for i in range(num_bootstraps)]
+    # the DeLong method only gives an interval for the AUC (not the curve),
+    # but takes milliseconds rather than minutes
+    if ci_method == 'delong':
+        _, auc_ci = delong_auc_ci(ys, y_hats, alpha)
+        return dict(alpha=alpha, fpr=fpr, tpr=tpr, auc=main_auc,
+                interp_fpr=None, roc_ci=None, auc_ci=auc_ci,
+                ci_method=ci_method)
 
-    # generate the bootstrap curves
-    bootstrapped_roc_curves = [roc_curve(y, y_hat) for y, y_hat
-        in bootstrap_samples]
+    # resample whole patients if we know them (since days from the same
+    # patient are correlated), otherwise treat each row as its own patient
+    if mrns is None:
+        mrns = np.arange(len(ys))
 
-    # interpolate the bootstrap curves onto a single x-axis so that we can
-    # then calculate some statistics on the y-axis
+    # generate the bootstrap curves
     interp_fpr = np.linspace(0., 1., 1000)
-    interp_tpr_bootstraps = np.array([np.interp(interp_fpr, fpr, tpr)
-        for fpr, tpr, thresh in bootstrapped_roc_curves])
+    interp_tpr_bootstraps, aucs = bootstrap_roc_curves(ys, y_hats, mrns,
+            interp_fpr, num_bootstraps=num_bootstraps, seed=seed,
+            num_workers=num_workers)
+
     roc_ci_low, roc_ci_high = np.quantile(
         interp_tpr_bootstraps, [alpha/2, 1 - alpha/2], axis=0)
-    aucs = [auc(fpr, tpr) for fpr, tpr, thresh in bootstrapped_roc_curves]
     auc_ci_low, auc_ci_high = np.quantile(
         aucs, [alpha/2, 1 - alpha/2], axis=0)
 
-    # plot the grey +/- one SD range
-    ax.fill_between(interp_fpr, roc_ci_low, roc_ci_high,
-            color="grey", alpha=0.2, label=f'{100*(1 - alpha):.0f}% confidence interval')
+    return dict(alpha=alpha, fpr=fpr, tpr=tpr, auc=main_auc,
+            interp_fpr=interp_fpr, roc_ci=(roc_ci_low, roc_ci_high),
+            auc_ci=(auc_ci_low, auc_ci_high), ci_method=ci_method)
+
+
+def render_bootstrapped_roc(ax, metrics, xlabel="False Positive Rate",
+        ylabel="True Positive Rate", legend=True):
+    alpha = metrics['alpha']
+    main_auc = metrics['auc']
+    auc_ci_low, auc_ci_high = metrics['auc_ci']
+    ci_method = ci_method_names[metrics.get('ci_method', 'bootstrap')]
+
+    # plot the grey confidence interval range (if we have one for the curve)
+    if metrics['roc_ci'] is not None:
+        roc_ci_low, roc_ci_high = metrics['roc_ci']
+        ax.fill_between(metrics['interp_fpr'], roc_ci_low, roc_ci_high,
+                color="grey", alpha=0.2, label=f'{100*(1 - alpha):.0f}% confidence interval')
     # plot the diagonal (zero information) line
     ax.plot([0, 1], [0, 1], linestyle='--', color="grey")
     # plot the mean ROC
     ci_precision = 2 if auc_ci_high - auc_ci_low > 0.02 else 3
-    ax.plot(fpr, tpr,
-            label=f'ROC (AUROC {main_auc:.2f} ({auc_ci_low:.{ci_precision}f},{auc_ci_high:.{ci_precision}f}))')
+    ax.plot(metrics['fpr'], metrics['tpr'],
+            label=f'ROC (AUROC {main_auc:.2f} ({auc_ci_low:.{ci_precision}f},{auc_ci_high:.{ci_precision}f}) by {ci_method})')
     #ax.set_xlim(0, 1)
     #ax.set_ylim(0, 1)
 
@@ -63,14 +129,24 @@ def bootstrapped_roc_plot(ax, ys, y_hats, xlabel="False Positive Rate",
     if legend:
         ax.legend(loc="lower right")
     else:
-        ax.text(0.1, 0.0, f'AUROC {main_auc:.2f} ({auc_ci_low:.{ci_precision}f},{auc_ci_high:.{ci_precision}f})')
+        ax.text(0.1, 0.0, f'AUROC {main_auc:.2f} ({auc_ci_low:.{ci_precision}f},{auc_ci_high:.{ci_precision}f})' +
+                ('' if ci_method == 'bootstrap' else f'\n{ci_method} CI'))
     #ax.set_xlim(0, 1)
     ax.set(xlabel=xlabel, ylabel=ylabel)
 
 
-def cv_roc_plot(ax, ys, y_hats, xlabel="False Positive Rate",
+def bootstrapped_roc_plot(ax, ys, y_hats, xlabel="False Positive Rate",
         ylabel="True Positive Rate", legend=True,
-        num_bootstraps=0):
+        num_bootstraps=1000, mrns=None, seed=0, num_workers=1,
+        ci_method='bootstrap'):
+    metrics = bootstrapped_roc_metrics(ys, y_hats,
+            num_bootstraps=num_bootstraps, mrns=mrns, seed=seed,
+            num_workers=num_workers, ci_method=ci_method)
+    render_bootstrapped_roc(ax, metrics, xlabel=xlabel, ylabel=ylabel,
+            legend=legend)
+
+
+def cv_roc_metrics(ys, y_hats):
     # generate the roc curves for each fold
     roc_curves = [roc_curve(y, y_hat) for y, y_hat in zip(ys, y_hats)]
 
@@ -82,12 +158,24 @@ def cv_roc_plot(ax, ys, y_hats, xlabel="False Positive Rate",
     sd_tpr = (np.var(interp_tpr_cvs, axis=0))**0.5
     aucs = [auc(fpr, tpr) for fpr, tpr, thresh in roc_curves]
 
+    return dict(fold_curves=[(fpr, tpr) for fpr, tpr, thresh in roc_curves],
+            interp_fpr=interp_fpr, mean_tpr=mean_tpr, sd_tpr=sd_tpr,
+            aucs=aucs)
+
+
+def render_cv_roc(ax, metrics, xlabel="False Positive Rate",
+        ylabel="True Positive Rate", legend=True):
+    interp_fpr = metrics['interp_fpr']
+    mean_tpr = metrics['mean_tpr']
+    sd_tpr = metrics['sd_tpr']
+    aucs = metrics['aucs']
+
     # plot the grey +/- one SD range
     ax.fill_between(interp_fpr, np.minimum(mean_tpr + sd_tpr, 1), np.maximum(mean_tpr - sd_tpr, 0),
         color="grey", alpha=0.2, label="mean ROC +/- 1 SD")
     # plot the ROC for each fold
     first_fold = True
-    for fpr, tpr, thresh in roc_curves:
+    for fpr, tpr in metrics['fold_curves']:
         ax.plot(fpr, tpr, color='blue', alpha=0.05,
             label="ROC for each fold in cross validation" if first_fold else None)
         first_fold = False
@@ -107,12 +195,28 @@ def cv_roc_plot(ax, ys, y_hats, xlabel="False Positive Rate",
     ax.set(xlabel=xlabel, ylabel=ylabel)
 
 
+def cv_roc_plot(ax, ys, y_hats, xlabel="False Positive Rate",
+        ylabel="True Positive Rate", legend=True,
+        num_bootstraps=0):
+    render_cv_roc(ax, cv_roc_metrics(ys, y_hats), xlabel=xlabel,
+            ylabel=ylabel, legend=legend)
+
+
+def roc_plot_from_metrics(ax, metrics, **kwargs):
+    # metrics files hold the results for every kind of plot (and only the
+    # cross-validation results have a curve for each fold)
+    if 'fold_curves' in metrics['roc']:
+        render_cv_roc(ax, metrics['roc'], **kwargs)
+    else:
+        render_bootstrapped_roc(ax, metrics['roc'], **kwargs)
+
+
 def parse_arguments():
     argument_parser = argparse.ArgumentParser()
-    argument_parser.add_argument('YS',
+    argument_parser.add_argument('YS', nargs='?',
             type=argparse.FileType('rb'),
             help='bundle of actual y values for each fold')
-    argument_parser.add_argument('YHATS',
+    argument_parser.add_argument('YHATS', nargs='?',
             type=argparse.FileType('rb'),
             help='bundle of predicted y values for each fold')
     argument_parser.add_argument('PLOTFILE',
@@ -121,24 +225,57 @@ def parse_arguments():
     argument_parser.add_argument('--dpi', type=int, default=150)
     argument_parser.add_argument('--bootstraps', type=int, default=0,
             help='number of bootstraps to use for confidence intervals')
+    argument_parser.add_argument('--mrns',
+            type=argparse.FileType('rb'),
+            help='bundle of MRNs for each fold; if given, bootstrap by ' +
+                'resampling patients rather than individual rows')
+    argument_parser.add_argument('--seed', type=int, default=0,
+            help='random seed for the bootstraps')
+    argument_parser.add_argument('--workers', type=int, default=1,
+            help='number of processes to use for the bootstraps')
+    argument_parser.add_argument('--ci-method', choices=list(ci_method_names),
+            default='bootstrap',
+            help='method to use for the AUROC confidence interval; the ' +
+                'DeLong method is much faster than bootstrapping, but does ' +
+                'not give an interval for the curve itself')
+    argument_parser.add_argument('--metrics',
+            type=argparse.FileType('rb'),
+            help='metrics file (from ComputeMetrics.py) to plot instead of ' +
+                'computing the curves from YS and YHATS')
 
-    return argument_parser.parse_args()
+    args = argument_parser.parse_args()
+    if args.metrics is None and args.YHATS is None:
+        argument_parser.error('either YS and YHATS or --metrics is required')
+
+    return args
 
 
 if __name__ == "__main__":
 
     args = parse_arguments()
 
-    print(f"{time.time() - startup_time}: loading ys")
-    ys = pickle.load(args.YS)
-    print(f"{time.time() - startup_time}: loading y_hats")
-    y_hats = pickle.load(args.YHATS)
+    if args.metrics is not None:
+        print(f"{time.time() - startup_time}: loading metrics")
+        metrics = pickle.load(args.metrics)
+    else:
+        print(f"{time.time() - startup_time}: loading ys")
+        ys = pickle.load(args.YS)
+        print(f"{time.time() - startup_time}: loading y_hats")
+        y_hats = pickle.load(args.YHATS)
+        if args.mrns is not None:
+            print(f"{time.time() - startup_time}: loading mrns")
+            mrns = pickle.load(args.mrns)
 
     print(f"{time.time() - startup_time}: generating plot")
     fig,ax = plt.subplots(figsize=(7,7))
     ax.set_title(args.title)
-    if args.bootstraps > 0:
-        bootstrapped_roc_plot(ax, ys[0], y_hats[0], num_bootstraps=args.bootstraps)
+    if args.metrics is not None:
+        roc_plot_from_metrics(ax, metrics)
+    elif args.bootstraps > 0 or args.ci_method == 'delong':
+        bootstrapped_roc_plot(ax, ys[0], y_hats[0], num_bootstraps=args.bootstraps,
+                mrns=None if args.mrns is None else mrns[0],
+                seed=args.seed, num_workers=args.workers,
+                ci_method=args.ci_method)
     else:
         cv_roc_plot(ax, ys, y_hats)
     plt.savefig(args.PLOTFILE, bbox_inches='tight', dpi=args.dpi)
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+
+def read_rowmask(filename):
+    """Read a row mask file (with a "keep" column of 0s and 1s, as written by
+    GenerateRowMasks.py) as an array of whether to keep each row.
+    """
+    mask = pd.read_csv(filename, dtype={"keep": np.int8})
+    if list(mask.columns) != ["keep"]:
+        raise ValueError(f"unexpected rowmask file format in {filename}")
+    return np.asarray(mask["keep"]) == 1
+
+
+def apply_rowmasks(dataframes, rowmasks=None):
+    """Select the rows of each dataframe kept by the corresponding row mask
+    file (if any), rather than loading filtered copies of the files.
+    """
+    if rowmasks is None:
+        return dataframes
+    if len(rowmasks) != len(dataframes):
+        raise ValueError(f"expected a rowmask for each of the " +
+                f"{len(dataframes)} datafiles but got {len(rowmasks)}")
+    masked = []
+    for df, rowmask in zip(dataframes, rowmasks):
+        keep = read_rowmask(rowmask)
+        if len(keep) != len(df):
+            raise ValueError(f"{rowmask} has {len(keep)} rows but its " +
+                    f"datafile has {len(df)}")
+        masked.append(df[keep].reset_index(drop=True))
+    return masked
@@ -0,0 +1,228 @@
+#!/usr/bin/python3
+
+import numpy as np
+import pandas as pd
+import time
+import argparse
+import pickle
+import itertools
+from sklearn.metrics import auc
+
+startup_time = time.time()
+
+
+class ScoreHistogram:
+    """Counts of positive and negative cases with each (quantized) predicted
+    score, from which the AUROC, AUPRC and calibration can be calculated
+    without keeping the individual predictions.  Histograms of different
+    folds or shards can simply be added together.
+
+    Scores are quantized into num_bins equal bins on [0, 1], so the AUROC
+    only loses the ordering of cases within the same bin (see
+    auroc_error_bound) and the calibration bins are exact unless a
+    calibration bin boundary falls inside a score bin.
+    """
+
+    def __init__(self, num_bins=2**16):
+        self.num_bins = num_bins
+        self.positives = np.zeros(num_bins, dtype=np.int64)
+        self.negatives = np.zeros(num_bins, dtype=np.int64)
+        self.score_sums = np.zeros(num_bins)
+
+    def add(self, ys, y_hats):
+        y_hats = np.asarray(y_hats, dtype=float)
+        positive = np.asarray(ys) > 0.5
+        bins = np.clip((y_hats * self.num_bins).astype(np.int64),
+                0, self.num_bins - 1)
+        self.positives += np.bincount(bins[positive], minlength=self.num_bins)
+        self.negatives += np.bincount(bins[~positive], minlength=self.num_bins)
+        self.score_sums += np.bincount(bins, y_hats, minlength=self.num_bins)
+
+    def __iadd__(self, other):
+        if other.num_bins != self.num_bins:
+            raise ValueError(f"can't merge a histogram with {other.num_bins} " +
+                    f"bins into one with {self.num_bins} bins")
+        self.positives += other.positives
+        self.negatives += other.negatives
+        self.score_sums += other.score_sums
+        return self
+
+    def check_both_classes(self):
+        # the AUROC needs both classes, so raise an error (as roc_auc_score
+        # does) rather than returning NaN
+        if np.sum(self.positives) == 0 or np.sum(self.negatives) == 0:
+            raise ValueError("only one class is present in the histogram, " +
+                    "so the AUROC is not defined")
+
+    def auroc(self):
+        self.check_both_classes()
+        # each positive beats the negatives in lower bins, and ties half of
+        # the negatives in its own bin
+        neg_below = np.cumsum(self.negatives) - self.negatives
+        return (np.sum(self.positives * (self.negatives / 2 + neg_below)) /
+                (np.sum(self.positives) * np.sum(self.negatives)))
+
+    def auroc_error_bound(self):
+        self.check_both_classes()
+        # the only pairs whose order is unknown are those in the same bin
+        return (np.sum(self.positives * self.negatives) / 2 /
+                (np.sum(self.positives) * np.sum(self.negatives)))
+
+    def pr_curve(self):
+        if np.sum(self.positives) == 0:
+            raise ValueError("there are no positives in the histogram, " +
+                    "so the precision-recall curve is not defined")
+        # sweep the threshold down from the highest scoring bin, stopping
+        # once every positive has been recalled (as precision_recall_curve
+        # does)
+        present = (self.positives + self.negatives)[::-1] > 0
+        tps = np.cumsum(self.positives[::-1])[present]
+        fps = np.cumsum(self.negatives[::-1])[present]
+        last = np.searchsorted(tps, tps[-1])
+        precision = np.concatenate([[1.], tps[:last+1] / (tps + fps)[:last+1]])
+        recall = np.concatenate([[0.], tps[:last+1] / tps[-1]])
+        return precision, recall
+
+    def auprc(self):
+        precision, recall = self.pr_curve()
+        return auc(recall, precision)
+
+    def calibration(self, n_bins=10):
+        # assign each score bin to the calibration bin containing its center
+        centers = (np.arange(self.num_bins) + 0.5) / self.num_bins
+        calibration_bins = np.minimum((centers * n_bins).astype(np.int64),
+                n_bins - 1)
+        bin_pos = np.bincount(calibration_bins, self.positives, minlength=n_bins)
+        bin_est_pos = np.bincount(calibration_bins, self.score_sums,
+                minlength=n_bins)
+        bin_counts = np.bincount(calibration_bins,
+                self.positives + self.negatives, minlength=n_bins)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return pd.DataFrame({
+                'bin_low': np.arange(n_bins) / n_bins,
+                'bin_high': np.arange(1, n_bins + 1) / n_bins,
+                'count': bin_counts.astype(np.int64),
+                'mean_predicted': bin_est_pos / bin_counts,
+                'fraction_of_positives': bin_pos / bin_counts,
+                'calibration_error': np.abs(bin_pos - bin_est_pos) / bin_counts,
+            })
+
+    def summary(self, n_bins=10):
+        calibration = self.calibration(n_bins)
+        total = np.sum(self.positives) + np.sum(self.negatives)
+        return pd.DataFrame({
+            'positives': [np.sum(self.positives)],
+            'negatives': [np.sum(self.negatives)],
+            'auroc': [self.auroc()],
+            'auroc_error_bound': [self.auroc_error_bound()],
+            'auprc': [self.auprc()],
+            'ece': [np.nansum(calibration['calibration_error'] *
+                calibration['count']) / total],
+            'mce': [np.nanmax(calibration['calibration_error'])],
+        })
+
+    def save(self, f):
+        pickle.dump(dict(positives=self.positives, negatives=self.negatives,
+            score_sums=self.score_sums), f)
+
+    @staticmethod
+    def load(f):
+        counts = pickle.load(f)
+        histogram = ScoreHistogram(len(counts['positives']))
+        histogram.positives = counts['positives']
+        histogram.negatives = counts['negatives']
+        histogram.score_sums = counts['score_sums']
+        return histogram
+
+
+def accumulate(histogram, yfile, yhatfile, chunksize):
+    # read the y and y_hat files in step with each other, so only one chunk
+    # of each needs to be in memory at once
+    for y_chunk, y_hat_chunk in itertools.zip_longest(
+            pd.read_csv(yfile, chunksize=chunksize),
+            pd.read_csv(yhatfile, chunksize=chunksize)):
+        if (y_chunk is None or y_hat_chunk is None or
+                len(y_chunk) != len(y_hat_chunk)):
+            raise ValueError(f"{yfile} and {yhatfile} have different " +
+                    "numbers of rows")
+        histogram.add(np.asarray(y_chunk.iloc[:,2:]).ravel(),
+                np.asarray(y_hat_chunk.iloc[:,2:]).ravel())
+
+
+def parse_arguments():
+    argument_parser = argparse.ArgumentParser(
+            description='evaluate predictions from histograms of their scores')
+    subparsers = argument_parser.add_subparsers(
+            dest='command', title='command')
+    subparsers.required=True
+
+    subparser_accumulate = subparsers.add_parser('accumulate',
+            help='build a histogram from pairs of y and y_hat datafiles')
+    subparser_accumulate.add_argument('DATAFILE', nargs='+',
+            help='pairs of y and y_hat datafiles')
+    subparser_accumulate.add_argument('HISTOGRAMFILE',
+            type=argparse.FileType('wb'),
+            help='filename to use to save the histogram')
+    subparser_accumulate.add_argument('--bins', type=int, default=2**16,
+            help='number of bins used to quantize the scores')
+    subparser_accumulate.add_argument('--chunksize', type=int, default=1000000,
+            help='number of rows to read at a time')
+
+    subparser_merge = subparsers.add_parser('merge',
+            help='combine the histograms of several folds or shards')
+    subparser_merge.add_argument('INPUTFILE', nargs='+',
+            type=argparse.FileType('rb'),
+            help='histograms to combine')
+    subparser_merge.add_argument('HISTOGRAMFILE',
+            type=argparse.FileType('wb'),
+            help='filename to use to save the combined histogram')
+
+    subparser_summarize = subparsers.add_parser('summarize',
+            help='calculate the metrics for a histogram')
+    subparser_summarize.add_argument('HISTOGRAMFILE',
+            type=argparse.FileType('rb'),
+            help='histogram to summarize')
+    subparser_summarize.add_argument('SUMMARYFILE',
+            help='filename to use to save the metrics (csv)')
+    subparser_summarize.add_argument('--calibration',
+            help='filename to use to save the calibration bins (csv)')
+    subparser_summarize.add_argument('--calibration-bins', type=int, default=10,
+            help='number of bins to use for calibration')
+
+    args = argument_parser.parse_args()
+    if args.command == 'accumulate' and len(args.DATAFILE) % 2 != 0:
+        subparser_accumulate.error('DATAFILE must be pairs of y and y_hat files')
+
+    return args
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+
+    if args.command == 'accumulate':
+        histogram = ScoreHistogram(args.bins)
+        for yfile, yhatfile in zip(args.DATAFILE[0::2], args.DATAFILE[1::2]):
+            print(f"{time.time() - startup_time}: accumulating {yhatfile}")
+            accumulate(histogram, yfile, yhatfile, args.chunksize)
+        print(f"{time.time() - startup_time}: saving histogram")
+        histogram.save(args.HISTOGRAMFILE)
+
+    elif args.command == 'merge':
+        print(f"{time.time() - startup_time}: merging histograms")
+        histogram = ScoreHistogram.load(args.INPUTFILE[0])
+        for f in args.INPUTFILE[1:]:
+            histogram += ScoreHistogram.load(f)
+        print(f"{time.time() - startup_time}: saving histogram")
+        histogram.save(args.HISTOGRAMFILE)
+
+    elif args.command == 'summarize':
+        print(f"{time.time() - startup_time}: loading histogram")
+        histogram = ScoreHistogram.load(args.HISTOGRAMFILE)
+        print(f"{time.time() - startup_time}: calculating metrics")
+        histogram.summary(args.calibration_bins).to_csv(args.SUMMARYFILE,
+                index=False)
+        if args.calibration is not None:
+            histogram.calibration(args.calibration_bins).to_csv(
+                    args.calibration, index=False)
@@ -0,0 +1,226 @@
+#!/usr/bin/julia
+using ArgParse
+include("FeatureFiles.jl")
+include("EventFiles.jl")
+
+# Splits MRN-sorted files into shards, each holding a contiguous range of
+# MRNs, so that the shards can be processed in parallel (e.g. by make -j), and
+# concatenates the results of processing each shard back into a single file.
+# The shards never split a patient's rows, so the results are the same as
+# processing the whole file at once.  CSV files, binary event files (.events)
+# and binary feature files (.f32) can all be sharded and merged.
+
+function parse_commandline()
+    s = ArgParseSettings()
+
+    @add_arg_table! s begin
+        "boundaries"
+            help = "choose the MRN ranges of the shards from the snapshot times"
+            action = :command
+
+        "split"
+            help = "split an MRN-sorted file into shards"
+            action = :command
+
+        "merge"
+            help = "concatenate shards (in order) into a single file"
+            action = :command
+    end
+
+    @add_arg_table! s["boundaries"] begin
+        "--shards"
+            help = "number of shards"
+            arg_type = Int
+            required = true
+
+        "snapshottimes"
+            help = "file with MRN and times of each snapshot, sorted by MRN"
+            required = true
+
+        "boundariesfile"
+            help = "target file with the first MRN of each shard"
+            required = true
+    end
+
+    @add_arg_table! s["split"] begin
+        "boundariesfile"
+            help = "file with the first MRN of each shard"
+            required = true
+
+        "sourcefile"
+            help = "MRN-sorted file to split"
+            required = true
+
+        "shardfiles"
+            help = "target files for each shard (one per line of the " *
+                "boundaries file)"
+            nargs = '+'
+            required = true
+    end
+
+    @add_arg_table! s["merge"] begin
+        "outfile"
+            help = "target file with the rows of all of the shards"
+            required = true
+
+        "shardfiles"
+            help = "shards to concatenate, in order"
+            nargs = '+'
+            required = true
+    end
+
+    return parse_args(s)
+end
+
+# read the header of a file to shard, returning it (to copy into each shard)
+# and the size of each row (or 0 if the rows are lines of text)
+function readshardheader(stream::IO, filename::AbstractString)
+    if isbinaryeventfile(filename)
+        header = read(stream, sizeof(binaryeventmagic))
+        @assert String(copy(header)) == binaryeventmagic "not a binary event file"
+        return header, binaryeventsize
+    elseif isbinaryfeaturefile(filename)
+        columns = readfeatureheader(stream, true)
+        header = Vector{UInt8}(binaryfeaturemagic * join(columns, ",") * "\n")
+        # MRN and DTS (Int64) followed by a Float32 for each feature
+        return header, 16 + 4 * (length(columns) - 2)
+    else
+        return Vector{UInt8}(readline(stream, keep=true)), 0
+    end
+end
+
+function choosebounds(snapshottimesfile, numshards)
+    # count the snapshots of each patient
+    mrns = Int[]
+    counts = Int[]
+    header = readline(snapshottimesfile)
+    @assert header == "MRN,DTS"
+    for line in eachline(snapshottimesfile)
+        mrn = parse(Int, split(line, ",")[1])
+        if isempty(mrns) || mrn ≠ mrns[end]
+            @assert isempty(mrns) || mrn > mrns[end] "snapshot times are not sorted by MRN"
+            push!(mrns, mrn)
+            push!(counts, 0)
+        end
+        counts[end] += 1
+    end
+
+    # start a new shard at the first patient past each multiple of
+    # 1/numshards of the snapshots (any shards past the last patient are
+    # left empty)
+    firstmrns = fill(typemax(Int), numshards)
+    firstmrns[1] = isempty(mrns) ? typemin(Int) : mrns[1]
+    total = sum(counts)
+    before = 0
+    shard = 2
+    for (mrn, count) in zip(mrns, counts)
+        while shard ≤ numshards && before ≥ (shard - 1) * total / numshards
+            firstmrns[shard] = mrn
+            shard += 1
+        end
+        before += count
+    end
+    return firstmrns
+end
+
+function readbounds(filename)
+    open(filename, "r") do f
+        header = readline(f)
+        @assert header == "FIRSTMRN"
+        return [parse(Int, line) for line in eachline(f)]
+    end
+end
+
+function splitshards(firstmrns, source, sourcename, shards)
+    header, rowsize = readshardheader(source, sourcename)
+    for shard in shards
+        write(shard, header)
+    end
+
+    row = Vector{UInt8}(undef, rowsize)
+    lastmrn = typemin(Int)
+    numrows = 0
+    while !eof(source)
+        if rowsize == 0
+            line = readline(source, keep=true)
+            mrn = parse(Int, line[1:findfirst(isequal(','), line) - 1])
+        else
+            read!(source, row)
+            mrn = Int(ltoh(reinterpret(Int64, view(row, 1:8))[1]))
+        end
+        @assert mrn ≥ lastmrn "$sourcename is not sorted by MRN"
+        lastmrn = mrn
+
+        # the last shard whose first MRN is at or before this row's MRN
+        shard = max(1, searchsortedlast(firstmrns, mrn))
+        write(shards[shard], rowsize == 0 ? line : row)
+
+        numrows += 1
+        if (numrows % 1000000) == 0
+            print("Processing row $numrows...\n")
+        end
+    end
+end
+
+function mergeshards(outfile, shards, shardnames)
+    buffer = Vector{UInt8}(undef, 1 << 20)
+    firstheader = nothing
+    for (shard, shardname) in zip(shards, shardnames)
+        # make sure all of the shards have the same header, and only keep
+        # the first one
+        header, rowsize = readshardheader(shard, shardname)
+        if firstheader == nothing
+            firstheader = header
+            write(outfile, header)
+        end
+        @assert header == firstheader "$shardname has a different header"
+
+        # the rows can be copied as they are
+        while !eof(shard)
+            numread = readbytes!(shard, buffer)
+            write(outfile, view(buffer, 1:numread))
+        end
+    end
+end
+
+function main()
+    args = parse_commandline()
+    command = args["%COMMAND%"]
+    args = args[command]
+
+    if command == "boundaries"
+        print("choosing the MRNs for $(args["shards"]) shards...\n")
+        firstmrns = open(f -> choosebounds(f, args["shards"]),
+                         args["snapshottimes"], "r")
+        open(args["boundariesfile"], "w") do f
+            write(f, "FIRSTMRN\n")
+            for mrn in firstmrns
+                write(f, "$mrn\n")
+            end
+        end
+    elseif command == "split"
+        firstmrns = readbounds(args["boundariesfile"])
+        @assert length(args["shardfiles"]) == length(firstmrns) "expected a file for each of the $(length(firstmrns)) shards"
+        print("splitting $(args["sourcefile"]) into $(length(firstmrns)) shards...\n")
+        open(args["sourcefile"], "r") do source
+            shards = [open(filename, "w") for filename in args["shardfiles"]]
+            try
+                splitshards(firstmrns, source, args["sourcefile"], shards)
+            finally
+                foreach(close, shards)
+            end
+        end
+    elseif command == "merge"
+        print("merging $(length(args["shardfiles"])) shards into $(args["outfile"])...\n")
+        open(args["outfile"], "w") do outfile
+            shards = [open(filename, "r") for filename in args["shardfiles"]]
+            try
+                mergeshards(outfile, shards, args["shardfiles"])
+            finally
+                foreach(close, shards)
+            end
+        end
+    end
+end
+
+main()
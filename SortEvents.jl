@@ -0,0 +1,175 @@
+#!/usr/bin/julia
+using ArgParse
+using DataStructures
+include("CSVRecords.jl")
+
+# Sorts an exported CSV file by MRN and then DTS (which the streaming steps
+# of the pipeline assume), using an external merge sort so that files much
+# larger than memory can be sorted: batches of records that fit within the
+# memory budget are sorted on several threads and saved as sorted runs, which
+# are then merged.  Records with the same MRN and DTS keep their original
+# order, and the records themselves are copied exactly (including any quoted
+# line feeds).
+
+function parse_commandline()
+    s = ArgParseSettings()
+
+    @add_arg_table! s begin
+        "eventfile"
+            help = "file with MRNs, datetime stamps, and other columns"
+            required = true
+
+        "mrncolumn"
+            help = "columnname with the patient's MRN"
+            required = true
+
+        "dtscolumn"
+            help = "columnname with the date-time stamp"
+            required = true
+
+        "sortedfile"
+            help = "file to generate with the records sorted by MRN and DTS"
+            required = true
+
+        "--memory"
+            help = "approximate memory budget for the records being sorted " *
+                "at once (MB); the records are split between the threads " *
+                "(set by JULIA_NUM_THREADS)"
+            arg_type = Int
+            default = 1024
+
+        "--tmpdir"
+            help = "directory in which to save the sorted runs"
+            default = tempdir()
+    end
+
+    return parse_args(s)
+end
+
+const SortKey = Tuple{Int,String}
+
+# the ISO 8601 date-time stamps sort correctly as strings (whether or not the
+# date and time are separated by a T, as they are after tokenization)
+function sortkey(record, mrnindex, dtsindex)
+    fields = split(normalizerecord(record), ",")
+    return (parse(Int, fields[mrnindex]),
+            replace(fields[dtsindex], " " => "T"))
+end
+
+# sort a batch of records on each thread, returning the sorted chunks
+function sortchunks(records, mrnindex, dtsindex)
+    numchunks = Threads.nthreads()
+    bounds = round.(Int, range(0, stop=length(records), length=numchunks+1))
+    chunks = [view(records, (bounds[i]+1):bounds[i+1]) for i in 1:numchunks]
+    sorted = Vector{Vector{String}}(undef, numchunks)
+    Threads.@threads for i in 1:numchunks
+        keys = [sortkey(record, mrnindex, dtsindex) for record in chunks[i]]
+        sorted[i] = chunks[i][sortperm(keys, alg=MergeSort)]
+    end
+    return filter(!isempty, sorted)
+end
+
+function writerun(records, tmpdir)
+    filename, stream = mktemp(tmpdir)
+    for record in records
+        write(stream, record)
+    end
+    close(stream)
+    return filename
+end
+
+function readrun(stream, mrnindex, dtsindex)
+    record = readrawrecord(stream)
+    return record, sortkey(record, mrnindex, dtsindex)
+end
+
+# merge the sorted runs, returning the number of records
+function mergeruns(outfile, runs, mrnindex, dtsindex)
+    # each run's next record, ordered by its key and then the run's index (so
+    # that the sort is stable)
+    records = Vector{String}(undef, length(runs))
+    heap = BinaryMinHeap{Tuple{SortKey,Int}}()
+    for (i, run) in enumerate(runs)
+        if !eof(run)
+            records[i], key = readrun(run, mrnindex, dtsindex)
+            push!(heap, (key, i))
+        end
+    end
+
+    numrecords = 0
+    lastkey = nothing
+    while !isempty(heap)
+        key, i = pop!(heap)
+
+        # make sure the records are being written in order
+        @assert lastkey == nothing || lastkey ≤ key "records are out of order"
+        lastkey = key
+
+        write(outfile, records[i])
+        numrecords += 1
+        if (numrecords % 1000000) == 0
+            print("Merged $numrecords records...\n")
+        end
+
+        if !eof(runs[i])
+            records[i], key = readrun(runs[i], mrnindex, dtsindex)
+            push!(heap, (key, i))
+        end
+    end
+    return numrecords
+end
+
+function main()
+    args = parse_commandline()
+    membudget = args["memory"] * 2^20
+
+    print("sorting $(args["eventfile"]) into $(args["sortedfile"])...\n")
+    tmpdir = mktempdir(args["tmpdir"])
+    try
+        open(args["eventfile"], "r") do eventfile
+            header = readline(eventfile, keep=true)
+            headers = split(chomp(header), ",")
+            mrnindex = findfirst(isequal(args["mrncolumn"]), headers)
+            dtsindex = findfirst(isequal(args["dtscolumn"]), headers)
+            @assert mrnindex ≠ nothing "no $(args["mrncolumn"]) column"
+            @assert dtsindex ≠ nothing "no $(args["dtscolumn"]) column"
+
+            # save sorted runs of the records
+            runfiles = String[]
+            while !eof(eventfile)
+                records = String[]
+                numbytes = 0
+                while numbytes < membudget && !eof(eventfile)
+                    record = readrawrecord(eventfile)
+                    # the last record of a file might not end with a line feed
+                    if !endswith(record, "\n")
+                        record *= "\n"
+                    end
+                    numbytes += sizeof(record)
+                    push!(records, record)
+                end
+
+                for chunk in sortchunks(records, mrnindex, dtsindex)
+                    push!(runfiles, writerun(chunk, tmpdir))
+                end
+                print("saved $(length(runfiles)) sorted runs...\n")
+            end
+
+            # merge the runs
+            runs = [open(filename, "r") for filename in runfiles]
+            try
+                open(args["sortedfile"], "w") do sortedfile
+                    write(sortedfile, header)
+                    numrecords = mergeruns(sortedfile, runs, mrnindex, dtsindex)
+                    print("sorted $numrecords records\n")
+                end
+            finally
+                foreach(close, runs)
+            end
+        end
+    finally
+        rm(tmpdir, recursive=true)
+    end
+end
+
+main()
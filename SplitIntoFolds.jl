@@ -1,12 +1,14 @@
 #!/usr/bin/julia
 using ArgParse
+include("FeatureFiles.jl")
 
 function parse_commandline()
     s = ArgParseSettings()
 
     @add_arg_table! s begin
         "featurefile"
-            help = "file with MRN, DTS and feature columns"
+            help = "file with MRN, DTS and feature columns (CSV, or a " *
+                "binary feature file ending with .f32)"
             required = true
 
         "foldassignmentfile"
@@ -14,7 +16,8 @@ function parse_commandline()
             required = true
 
         "outputprefix"
-            help = "prefix for output files; #.csv will be appended (#=fold)"
+            help = "prefix for output files; #.csv (or #.f32 for a binary " *
+                "featurefile) will be appended (#=fold)"
             required = true
 
         "--numfolds","-n"
@@ -40,23 +43,38 @@ function readfeatureline(stream::IO)
     end
 end
 
+# binary rows are copied as they are, so only the MRN needs to be read
+function readfeaturebytes(stream::IO, rowsize)
+    if eof(stream::IO)
+        return typemax(Int),UInt8[]
+    else
+        row = read(stream, rowsize)
+        mrn = Int(ltoh(reinterpret(Int64, row[1:8])[1]))
+        return mrn, row
+    end
+end
+
 function main()
     args = parse_commandline()
 
+    binary = isbinaryfeaturefile(args["featurefile"])
     featurefile = open(args["featurefile"], "r")
     foldassignmentfile = open(args["foldassignmentfile"], "r")
-    outputfiles = [open(args["outputprefix"] * "$i.csv", "w")
+    outputfiles = [open(args["outputprefix"] * "$i" * (binary ? ".f32" : ".csv"), "w")
                    for i in 0:(args["numfolds"] - 1)]
 
     # read the headers
     foldassignmentheaders = readline(foldassignmentfile)
     @assert foldassignmentheaders == "MRN,Holdout,CVGroup"
-    featureheaders = readline(featurefile)
+    featureheaders = readfeatureheader(featurefile, binary)
     for f in outputfiles
-        write(f, featureheaders)
-        write(f, "\n")
+        writefeatureheader(f, binary, featureheaders)
     end
 
+    rowsize = 16 + 4 * (length(featureheaders) - 2) # (if binary)
+    readrow(stream) = (binary ? readfeaturebytes(stream, rowsize) :
+                       readfeatureline(stream))
+
     featuremrn = -1
     featureline = ""
     for patientinfo in eachline(foldassignmentfile)
@@ -69,7 +87,7 @@ function main()
 
         # read in features until we get to this patient
         while featuremrn < mrn
-            featuremrn, featureline = readfeatureline(featurefile)
+            featuremrn, featureline = readrow(featurefile)
         end
 
         # read in the features for this patient
@@ -79,9 +97,11 @@ function main()
             if holdout == args["useholdout"]
                 # copy the line to the appropriate output file
                 write(outputfiles[cvgroup+1], featureline)
-                write(outputfiles[cvgroup+1], "\n")
+                if !binary
+                    write(outputfiles[cvgroup+1], "\n")
+                end
             end
-            featuremrn, featureline = readfeatureline(featurefile)
+            featuremrn, featureline = readrow(featurefile)
         end
     end
 end
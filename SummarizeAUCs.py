@@ -1,57 +1,97 @@
 #!/usr/bin/python3
 
 import numpy as np
-import scipy as sp
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 import pandas as pd
-import sklearn
-from sklearn.metrics import roc_curve, auc, roc_auc_score
 import time
 import os.path
 import argparse
+from RankAUC import rank_aucs, delong_auc_ci, delong_paired_comparisons
 
 startup_time = time.time()
 
 def calculate_AUCs(ys, y_hats):
-    # generate the roc curves for each fold
-    roc_curves = [roc_curve(y, y_hat) for y, y_hat in zip(ys, y_hats)]
+    return rank_aucs(ys, y_hats)
 
-    # interpolate the curves onto a single x-axis so that we can then calculate some statistics on
-    # the y-axis
-    interp_fpr = np.linspace(0., 1., 1000)
-    interp_tpr_cvs = np.array([sp.interp(interp_fpr, fpr, tpr) for fpr, tpr, thresh in roc_curves])
-    mean_tpr = np.mean(interp_tpr_cvs, axis=0)
-    sd_tpr = (np.var(interp_tpr_cvs, axis=0))**0.5
-    aucs = [auc(fpr, tpr) for fpr, tpr, thresh in roc_curves]
+def compare_AUCs(ys, y_hats, names):
+    # the paired test needs every model to be scored on the same cases
+    for y in ys[1:]:
+        if len(y) != len(ys[0]) or np.any(y != ys[0]):
+            raise ValueError('paired comparisons need the same y values for every model')
 
-    return aucs
+    aucs = calculate_AUCs(ys, y_hats)
+    return pd.DataFrame(
+        [(names[i], names[j], aucs[i], aucs[j], difference, z, p_value)
+            for i, j, difference, z, p_value in
+            delong_paired_comparisons(ys[0], y_hats)],
+        columns=['model_a', 'model_b', 'auc_a', 'auc_b', 'difference', 'z',
+            'p_value'])
 
 def parse_arguments():
     argument_parser = argparse.ArgumentParser()
     argument_parser.add_argument('DATAFILE', nargs='+',
-            type=argparse.FileType('rb'),
             help='pairs of y and y_hat datafiles')
     argument_parser.add_argument('AUCFILE',
             help='filename to use to save the aucs')
+    argument_parser.add_argument('--paramvals', nargs='+', type=float,
+            help='parameter values for a sweep; the datafiles are then ' +
+                'split evenly between the values (in order), and each row ' +
+                'of AUCFILE holds a value followed by its AUC for each fold')
+    argument_parser.add_argument('--ci-method', choices=['none', 'delong'],
+            default='none',
+            help='also save a confidence interval for each AUC, ' +
+                'calculated with the given method')
+    argument_parser.add_argument('--comparisons',
+            help='filename to use to save paired DeLong comparisons of the ' +
+                'AUCs (every pair of datafiles must share the same y values)')
+
+    args = argument_parser.parse_args()
+    if len(args.DATAFILE) % 2 != 0:
+        argument_parser.error('DATAFILE must be pairs of y and y_hat files')
+    if (args.paramvals is not None and
+            len(args.DATAFILE) % (2 * len(args.paramvals)) != 0):
+        argument_parser.error('the datafiles do not split evenly between ' +
+                'the parameter values')
+    if args.paramvals is not None and (args.ci_method != 'none' or
+            args.comparisons is not None):
+        argument_parser.error('--paramvals cannot be combined with ' +
+                '--ci-method or --comparisons')
 
-    return argument_parser.parse_args()
+    return args
 
 
 if __name__ == "__main__":
 
     args = parse_arguments()
 
+    # every setting in a sweep shares the same y files, so only read each
+    # distinct file once
+    loaded = {}
+    def load_values(filename):
+        if filename not in loaded:
+            df = pd.read_csv(filename)
+            loaded[filename] = np.asarray(df.iloc[:,2:]).ravel()
+        return loaded[filename]
+
     print(f"{time.time() - startup_time}: loading ys")
-    y_dataframes = [pd.read_csv(f, parse_dates=["DTS"])
-            for f in args.DATAFILE[0::2]]
-    ys = [np.asarray(df.iloc[:,2:]).ravel() for df in y_dataframes]
+    ys = [load_values(f) for f in args.DATAFILE[0::2]]
     print(f"{time.time() - startup_time}: loading y_hats")
-    y_hat_dataframes = [pd.read_csv(f, parse_dates=["DTS"])
-            for f in args.DATAFILE[1::2]]
-    y_hats = [np.asarray(df.iloc[:,2:]).ravel() for df in y_hat_dataframes]
+    y_hats = [load_values(f) for f in args.DATAFILE[1::2]]
 
     print(f"{time.time() - startup_time}: generating summary")
     aucs = calculate_AUCs(ys, y_hats)
-    np.savetxt(args.AUCFILE, aucs)
+    if args.ci_method == 'delong':
+        cis = np.array([delong_auc_ci(y, y_hat)[1]
+            for y, y_hat in zip(ys, y_hats)])
+        np.savetxt(args.AUCFILE, np.column_stack([aucs, cis]),
+                header='auc ci_low ci_high (95% CI by the DeLong method)')
+    elif args.paramvals is None:
+        np.savetxt(args.AUCFILE, aucs)
+    else:
+        aucs = aucs.reshape(len(args.paramvals), -1)
+        np.savetxt(args.AUCFILE, np.column_stack([args.paramvals, aucs]))
+
+    if args.comparisons is not None:
+        print(f"{time.time() - startup_time}: comparing AUCs")
+        comparisons = compare_AUCs(ys, y_hats,
+                [os.path.basename(f) for f in args.DATAFILE[1::2]])
+        comparisons.to_csv(args.comparisons, index=False)
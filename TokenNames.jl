@@ -16,6 +16,17 @@ function addtoken!(tokens, name)
     return id
 end
 
+# add the tokens of other (in the order they were first seen) to tokens,
+# returning the id in tokens of each of the tokens of other
+function mergetokens!(tokens, other)
+    ids = Vector{Int}(undef, length(other.names))
+    for (i, (name, count)) in enumerate(zip(other.names, other.counts))
+        ids[i] = addtoken!(tokens, name)
+        tokens.counts[ids[i]] += count - 1
+    end
+    return ids
+end
+
 function readtokennames(filename::String)
     result = TokenNames()
 
@@ -1,21 +1,101 @@
 #!/usr/bin/julia
 using ArgParse
 include("TokenNames.jl")
+include("EventFiles.jl")
+include("CSVRecords.jl")
 
-function coercetonumber(value)
-    m = match(r"[0-9]+(\.[0-9]+)?", value)
+const iso8601 = dateformat"yyyy-mm-ddTHH:MM:SS"
+
+# the results of coercing values and normalizing measure names are cached,
+# since the same strings are repeated millions of times (each cache is simply
+# cleared whenever it fills up)
+const maxcachesize = 1000000
+
+function cached!(f, cache::Dict, key)
+    value = get(cache, key, nothing)
+    if value === nothing
+        if length(cache) >= maxcachesize
+            empty!(cache)
+        end
+        value = f()
+        cache[String(key)] = value
+    end
+    return value
+end
+
+# the state each thread uses to tokenize events (Regex objects can't be
+# shared between threads, so each tokenizer compiles its own)
+struct Tokenizer
+    number::Regex
+    negative::Regex
+    positive::Regex
+    synonyms::Dict{String,String}
+    valuecache::Dict{String,Vector{Float64}}
+    namecache::Dict{String,Vector{String}}
+end
+
+Tokenizer(synonyms) = Tokenizer(Regex("[0-9]+(\\.[0-9]+)?"),
+                                Regex("negative|Negative|NEGATIVE"),
+                                Regex("positive|Positive|POSITIVE"),
+                                synonyms, Dict(), Dict())
+
+function coercetonumber(tokenizer, value)
+    m = match(tokenizer.number, value)
 
     if m != nothing
         return parse(Float64, m.match)
-    elseif match(r"negative|Negative|NEGATIVE", value) != nothing
+    elseif match(tokenizer.negative, value) != nothing
         return 0.
-    elseif match(r"positive|Positive|POSITIVE", value) != nothing
+    elseif match(tokenizer.positive, value) != nothing
         return 1.
     else
         return NaN
     end
 end;
 
+function coercetonumbers(tokenizer, valuetxt)
+    return cached!(tokenizer.valuecache, valuetxt) do
+        # some values (e.g. BP) have more than one value separated by
+        # slashes.
+        map(value -> coercetonumber(tokenizer, value), split(valuetxt, "/"))
+    end
+end
+
+# the (normalized) names of the first numvalues values of a measure
+function measurenames(tokenizer, measurefield, numvalues)
+    names = cached!(() -> String[], tokenizer.namecache, measurefield)
+    while length(names) < numvalues
+        measurename = uppercase(measurefield)
+        measurename = get(tokenizer.synonyms, measurename, measurename)
+        submeasurename = measurename*"_SLASH"^length(names)
+        push!(names, get(tokenizer.synonyms, submeasurename, submeasurename))
+    end
+    return names
+end
+
+function tokenizerecords!(out, binary, tokens, tokenizer, records, mrnindex,
+                          dtsindex, measureindex, valueindex)
+    for line in records
+        fields = split(line,",")
+        mrn = fields[mrnindex]
+        dts = replace(fields[dtsindex], " " => "T")
+        measurevals = coercetonumbers(tokenizer, fields[valueindex])
+        names = measurenames(tokenizer, fields[measureindex],
+                             length(measurevals))
+        for (i,val) in enumerate(measurevals)
+            if isfinite(val)
+                id = addtoken!(tokens, names[i])
+                if binary
+                    writeevent(out, parse(Int, mrn), DateTime(dts, iso8601),
+                               id, val)
+                else
+                    write(out, "$mrn,$dts,$(names[i]),$val\n")
+                end
+            end
+        end
+    end
+end
+
 
 function parse_commandline()
     s = ArgParseSettings()
@@ -42,7 +122,8 @@ function parse_commandline()
             required = true
 
         "tokeneventsfile"
-            help = "file to generate with the tokenized events"
+            help = "file to generate with the tokenized events (in the " *
+                "binary event format if it ends with .events)"
             required = true
 
         "tokennamesfile"
@@ -51,6 +132,12 @@ function parse_commandline()
 
         "--synonymsfile"
             help = "file with synonyms used to normalize the names"
+
+        "--chunksize"
+            help = "number of records each thread tokenizes at a time (the " *
+                "number of threads is set by JULIA_NUM_THREADS)"
+            arg_type = Int
+            default = 100000
     end
 
     return parse_args(s)
@@ -78,7 +165,12 @@ function main()
     print("generating $(args["tokeneventsfile"])...\n")
     open(args["eventfile"], "r") do eventfile
         open(args["tokeneventsfile"], "w") do tokeneventsfile
-            write(tokeneventsfile, "MRN,DTS,MEASURE,VALUE\n")
+            binary = isbinaryeventfile(args["tokeneventsfile"])
+            if binary
+                writeeventheader(tokeneventsfile)
+            else
+                write(tokeneventsfile, "MRN,DTS,MEASURE,VALUE\n")
+            end
 
             headers = split(readline(eventfile), ",")
             mrnindex = findfirst(isequal(args["mrncolumn"]), headers)
@@ -86,41 +178,39 @@ function main()
             measureindex = findfirst(isequal(args["measurecolumn"]), headers)
             valueindex = findfirst(isequal(args["valuecolumn"]), headers)
 
-            for line in eachline(eventfile)
-                # unfortunately some lines may have line feeds and/or commas
-                # wrapped in quotes; we need to handle these carefully
-                if '"' in line
-                    # continue reading until all quotes are closed.
-                    while count(isequal('"'),line) % 2 == 1
-                        line *= readline(eventfile)
-                    end
-                    quotes = split(line, "\"")
-                    for i in 2:2:length(quotes)
-                        # remove commas, newlines and carriage returns
-                        quotes[i] = replace(quotes[i], r"[\n\r,]"=>'_')
-                    end
-                    line = join(quotes, "")
+            # the records are read in batches, which are split between the
+            # threads; the chunks are then written in order, and their tokens
+            # are added in the order they first appeared, so the results are
+            # the same as tokenizing the records one at a time
+            numchunks = Threads.nthreads()
+            # each chunk has its own tokenizer (whichever thread runs it)
+            tokenizers = [Tokenizer(synonyms) for i in 1:numchunks]
+            while !eof(eventfile)
+                records = String[]
+                while (length(records) < numchunks * args["chunksize"] &&
+                       !eof(eventfile))
+                    push!(records, readrecord(eventfile))
+                end
+
+                bounds = round.(Int, range(0, stop=length(records),
+                                           length=numchunks+1))
+                outputs = [IOBuffer() for i in 1:numchunks]
+                chunktokens = [TokenNames() for i in 1:numchunks]
+                Threads.@threads for i in 1:numchunks
+                    tokenizerecords!(outputs[i], binary, chunktokens[i],
+                        tokenizers[i],
+                        view(records, (bounds[i]+1):bounds[i+1]),
+                        mrnindex, dtsindex, measureindex, valueindex)
                 end
 
-                fields = split(line,",")
-                mrn = fields[mrnindex]
-                dts = replace(fields[dtsindex], " " => "T")
-                measurename = uppercase(fields[measureindex])
-                measurename = get(synonyms, measurename, measurename)
-                valuetxt = fields[valueindex]
-
-                # some values (e.g. BP) have more than one value separated by
-                # slashes.
-                measurevals = map(coercetonumber, split(valuetxt, "/"))
-                for (i,val) in enumerate(measurevals)
-                    if isfinite(val)
-                        submeasurename = measurename*"_SLASH"^(i-1)
-                        submeasurename = get(synonyms, submeasurename,
-                            submeasurename)
-                        addtoken!(tokens, submeasurename)
+                for i in 1:numchunks
+                    ids = mergetokens!(tokens, chunktokens[i])
+                    if binary
+                        # the binary events hold the ids of the chunk's tokens
                         write(tokeneventsfile,
-                            "$mrn,$dts,$submeasurename,$val\n"
-                        )
+                              remapeventids!(take!(outputs[i]), ids))
+                    else
+                        write(tokeneventsfile, take!(outputs[i]))
                     end
                 end
             end
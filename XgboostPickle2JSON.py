@@ -4,21 +4,75 @@ import numpy as np
 import xgboost as xgb
 import pickle
 import argparse
+import os.path
+import time
+import warnings
+
+startup_time = time.time()
+
+# UBJSON models can only be written (and read) by xgboost 1.6 and newer
+ubj_supported = tuple(int(v) for v in xgb.__version__.split('.')[:2]) >= (1, 6)
 
 def parse_arguments():
-    argument_parser = argparse.ArgumentParser()
-    argument_parser.add_argument('PICKLEFILE',
-            type=argparse.FileType('rb'),
-            help='pickle file from which to load the model parameters')
-    argument_parser.add_argument('OUTFILE',
-            help='JSON file to save the model parameters')
+    argument_parser = argparse.ArgumentParser(
+            description='convert xgboost models to formats that newer ' +
+                'versions of xgboost can load')
+    argument_parser.add_argument('MODELFILE', nargs='+',
+            help='pickle (or previously converted) files from which to ' +
+                'load the model parameters')
+    argument_parser.add_argument('--formats', nargs='+',
+            choices=['json', 'ubj'], default=['json', 'ubj'],
+            help='formats to save; each is saved next to its MODELFILE ' +
+                '(or in OUTDIR) with the format as its extension')
+    argument_parser.add_argument('--outdir',
+            help='directory in which to save the converted models')
 
     return argument_parser.parse_args()
 
 
+def load_model(filename):
+    if filename.endswith('.pickle'):
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+    bt_model = xgb.XGBClassifier()
+    bt_model.load_model(filename)
+    return bt_model
+
+
+def converted_filename(filename, fmt, outdir=None):
+    stem = os.path.splitext(filename)[0]
+    if outdir is not None:
+        stem = os.path.join(outdir, os.path.basename(stem))
+    return f"{stem}.{fmt}"
+
+
 if __name__ == "__main__":
 
     args = parse_arguments()
 
-    bt_model = pickle.load(args.PICKLEFILE)
-    bt_model.save_model(args.OUTFILE)
+    formats = args.formats
+    if 'ubj' in formats and not ubj_supported:
+        warnings.warn(f"xgboost {xgb.__version__} can't save UBJSON models; " +
+                "only saving the other formats")
+        formats = [fmt for fmt in formats if fmt != 'ubj']
+
+    for filename in args.MODELFILE:
+        start = time.time()
+        bt_model = load_model(filename)
+        print(f"{time.time() - startup_time}: loaded {filename} " +
+                f"in {time.time() - start:.3f}s")
+
+        for fmt in formats:
+            outfile = converted_filename(filename, fmt, args.outdir)
+            if outfile == filename:
+                continue
+            start = time.time()
+            bt_model.save_model(outfile)
+            save_time = time.time() - start
+
+            # time loading the result, since that's what the conversion is for
+            start = time.time()
+            load_model(outfile)
+            print(f"{time.time() - startup_time}: saved {outfile} " +
+                    f"in {save_time:.3f}s ({os.path.getsize(outfile)} bytes, " +
+                    f"loads in {time.time() - start:.3f}s)")
@@ -3,34 +3,167 @@
 import xgboost as xgb
 import shap
 import argparse
+import hashlib
+import os.path
+import time
+import numpy as np
 import pandas as pd
+from RowMasks import read_rowmask
+from concurrent.futures import ProcessPoolExecutor
 from matplotlib import pyplot as plt
 
+startup_time = time.time()
+
 def parse_arguments():
     argument_parser = argparse.ArgumentParser()
-    argument_parser.add_argument('MODELJSON',
-            help='JSON file from which to load the model parameters')
+    argument_parser.add_argument('MODELFILE',
+            help='JSON or UBJSON file from which to load the model ' +
+                'parameters (a UBJSON file next to a JSON one is preferred)')
     argument_parser.add_argument('XVALS',
             help='CSV file of inputs examples to use for the SHAP plot')
     argument_parser.add_argument('PLOTFILE',
             help='PNG file to which to save the output')
     argument_parser.add_argument('--dpi', type=int, default=150)
+    argument_parser.add_argument('--workers', type=int, default=1,
+            help='number of processes to use for computing SHAP values')
+    argument_parser.add_argument('--chunksize', type=int, default=10000,
+            help='number of rows to explain at a time')
+    argument_parser.add_argument('--subsample', type=int,
+            help='only explain this many (randomly chosen) rows')
+    argument_parser.add_argument('--ys',
+            help='CSV file of outcomes for XVALS; if given, the subsample ' +
+                'is stratified by outcome')
+    argument_parser.add_argument('--rowmask',
+            help='row mask file (from GenerateRowMasks.py) selecting the ' +
+                'rows of XVALS (and YS) to use')
+    argument_parser.add_argument('--seed', type=int, default=0,
+            help='random seed for the subsample')
+    argument_parser.add_argument('--cachedir',
+            help='directory in which to save (and look for) the SHAP ' +
+                'values, keyed by a hash of the model, data and subsample')
+    argument_parser.add_argument('--from-cache', action='store_true',
+            help='only render the plot from cached SHAP values (and fail ' +
+                'if there are none)')
 
-    return argument_parser.parse_args()
+    args = argument_parser.parse_args()
+    if args.from_cache and args.cachedir is None:
+        argument_parser.error('--from-cache requires --cachedir')
 
+    return args
 
-if __name__ == "__main__":
 
-    args = parse_arguments()
+def file_hash(filename):
+    m = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            m.update(block)
+    return m.hexdigest()
+
+
+def preferred_model_file(filename):
+    # the binary UBJSON format is much faster to load than JSON
+    ubj_filename = os.path.splitext(filename)[0] + '.ubj'
+    if os.path.exists(ubj_filename):
+        return ubj_filename
+    return filename
+
 
+def subsample_rows(num_rows, subsample, ys=None, seed=0):
+    if subsample is None or subsample >= num_rows:
+        return np.arange(num_rows)
+
+    rng = np.random.default_rng(seed)
+    if ys is None:
+        return np.sort(rng.choice(num_rows, subsample, replace=False))
+
+    # keep the same fraction of rows from each outcome
+    rows = []
+    for value in np.unique(ys):
+        value_rows = np.flatnonzero(ys == value)
+        count = int(round(subsample * len(value_rows) / num_rows))
+        rows.append(rng.choice(value_rows, min(count, len(value_rows)),
+            replace=False))
+    return np.sort(np.concatenate(rows))
+
+
+# the model is loaded once by each worker process rather than sent with every
+# chunk of rows
+worker_explainer = None
+
+def init_worker(model_filename):
+    global worker_explainer
+    start = time.time()
     bt_model = xgb.XGBClassifier()
-    bt_model.load_model(args.MODELJSON)
+    bt_model.load_model(model_filename)
+    print(f"{time.time() - startup_time}: loaded {model_filename} " +
+            f"in {time.time() - start:.3f}s")
+    worker_explainer = shap.explainers.Tree(bt_model)
+
+def explain_chunk(X_chunk):
+    return worker_explainer(X_chunk).values
 
+
+def shap_values_for(model_filename, X, chunksize, num_workers):
+    chunks = [X[start:start + chunksize]
+            for start in range(0, len(X), chunksize)]
+    if num_workers <= 1:
+        init_worker(model_filename)
+        values = [explain_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(num_workers, initializer=init_worker,
+                initargs=(model_filename,)) as pool:
+            values = list(pool.map(explain_chunk, chunks))
+
+    return np.concatenate(values)
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+    model_filename = preferred_model_file(args.MODELFILE)
+
+    print(f"{time.time() - startup_time}: loading X")
     X = pd.read_csv(args.XVALS, parse_dates=["DTS"]).iloc[:,2:]
+    keep = None
+    if args.rowmask is not None:
+        keep = read_rowmask(args.rowmask)
+        X = X[keep].reset_index(drop=True)
+
+    ys = None
+    if args.ys is not None:
+        print(f"{time.time() - startup_time}: loading ys")
+        ys = np.asarray(pd.read_csv(args.ys).iloc[:,2])
+        if keep is not None:
+            ys = ys[keep]
+    rows = subsample_rows(len(X), args.subsample, ys, args.seed)
+
+    cachefile = None
+    if args.cachedir is not None:
+        key = hashlib.sha256(' '.join([file_hash(model_filename),
+            file_hash(args.XVALS), str(args.subsample),
+            'None' if args.ys is None else file_hash(args.ys),
+            str(args.seed)] +
+            ([] if args.rowmask is None else [file_hash(args.rowmask)])
+            ).encode()).hexdigest()[:16]
+        cachefile = os.path.join(args.cachedir, f"shap_values_{key}.npy")
+
+    if cachefile is not None and os.path.exists(cachefile):
+        print(f"{time.time() - startup_time}: loading cached SHAP values")
+        values = np.load(cachefile)
+    elif args.from_cache:
+        raise FileNotFoundError(f"no cached SHAP values in {cachefile}")
+    else:
+        print(f"{time.time() - startup_time}: calculating SHAP values " +
+                f"for {len(rows)} rows")
+        values = shap_values_for(model_filename, X.values[rows],
+                args.chunksize, args.workers)
+        if cachefile is not None:
+            np.save(cachefile, values)
 
-    explainer = shap.explainers.Tree(bt_model, feature_names=X.columns)
-    shap_values = explainer(X.values)
+    shap_values = shap.Explanation(values, data=X.values[rows],
+            feature_names=list(X.columns))
 
+    print(f"{time.time() - startup_time}: generating plot")
     plt.figure(figsize=(15,20))
     shap.plots.beeswarm(shap_values, max_display=41, plot_size=None)
     plt.savefig(args.PLOTFILE, bbox_inches='tight', dpi=args.dpi)
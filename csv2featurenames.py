@@ -5,6 +5,7 @@ import pandas as pd
 import time
 import json
 import argparse
+from CleaningTransformer import CleaningTransformer
 
 startup_time = time.time()
 
@@ -16,6 +17,9 @@ def parse_arguments():
     argument_parser.add_argument('FEATURENAMES',
             type=argparse.FileType('w'),
             help='JSON file to create with the featurenames')
+    argument_parser.add_argument('--cleaningmodel',
+            help='cleaning model (from CleanInputs.jl); only the names of ' +
+                'the features it keeps are saved')
 
     return argument_parser.parse_args()
 
@@ -31,4 +35,9 @@ if __name__ == "__main__":
     # generate the feature names
     print(f"{time.time() - startup_time}: saving names")
     featurenames = [name for name in data.columns[2:]]
+    if args.cleaningmodel is not None:
+        cleaner = CleaningTransformer(args.cleaningmodel)
+        assert featurenames == cleaner.input_featurenames, \
+                "the features don't match the cleaning model"
+        featurenames = cleaner.featurenames
     json.dump(featurenames, args.FEATURENAMES)